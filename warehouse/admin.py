@@ -2,7 +2,8 @@
 from django import forms
 from django.contrib import admin
 from django.utils import timezone
-from .models import SKU, LabelVersion, ShipmentBatch, Operator , WarehouseLocation , InventoryStock , InboundReceipt , InboundLineItem , OutboundExecution , StockTransaction
+from .inbound import complete_receipt
+from .models import SKU, LabelVersion, ShipmentBatch, Operator , WarehouseLocation , InventoryStock , InboundReceipt , InboundLineItem , OutboundExecution , StockTransaction , PickAllocation , PickWave , StockBalanceSnapshot , ReconciliationRun , ReconciliationDiscrepancy , LabelAvailability , SKUAvailability , CycleCount , CycleCountLine
 
 @admin.register(Operator)
 class OperatorAdmin(admin.ModelAdmin):
@@ -72,13 +73,13 @@ class ShipmentBatchAdmin(admin.ModelAdmin):
 
 @admin.register(WarehouseLocation)
 class WarehouseLocationAdmin(admin.ModelAdmin):
-    list_display = ['code', 'location_type', 'is_active', 'description']
-    list_filter = ['location_type', 'is_active']
+    list_display = ['code', 'zone', 'aisle', 'bay', 'level', 'location_type', 'is_active', 'description']
+    list_filter = ['location_type', 'is_active', 'zone']
     search_fields = ['code']
 
 @admin.register(InventoryStock)
 class InventoryStockAdmin(admin.ModelAdmin):
-    list_display = ['location', 'label_version', 'quantity', 'updated_at']
+    list_display = ['location', 'label_version', 'quantity', 'quantity_allocated', 'updated_at']
     list_filter = ['location', 'label_version__sku']
     search_fields = ['location__code', 'label_version__sku__sku_code']
 
@@ -87,6 +88,14 @@ class InboundReceiptAdmin(admin.ModelAdmin):
     list_display = ['receipt_no', 'reference_no', 'status', 'operator', 'created_at', 'completed_at']
     list_filter = ['status', 'operator']
     search_fields = ['receipt_no', 'reference_no']
+    # 完成状态必须经过过账流程，不能直接改字段
+    readonly_fields = ['status', 'completed_at']
+    actions = ['complete_receipts']
+
+    @admin.action(description="Complete selected receipts (post stock)")
+    def complete_receipts(self, request, queryset):
+        for receipt_id in queryset.exclude(status='completed').values_list('id', flat=True):
+            complete_receipt(receipt_id)
 
 @admin.register(InboundLineItem)
 class InboundLineItemAdmin(admin.ModelAdmin):
@@ -100,6 +109,66 @@ class OutboundExecutionAdmin(admin.ModelAdmin):
     list_filter = ['status', 'picker']
     search_fields = ['batch__batch_code', 'tracking_number']
 
+@admin.register(PickAllocation)
+class PickAllocationAdmin(admin.ModelAdmin):
+    list_display = ['execution', 'location', 'label_version', 'quantity', 'created_at']
+    search_fields = ['execution__batch__batch_code', 'location__code']
+
+@admin.register(PickWave)
+class PickWaveAdmin(admin.ModelAdmin):
+    list_display = ['code', 'status', 'created_by', 'created_at']
+    list_filter = ['status']
+    search_fields = ['code']
+
+@admin.register(StockBalanceSnapshot)
+class StockBalanceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['snapshot_at', 'location', 'label_version', 'quantity', 'last_transaction_id']
+    list_filter = ['snapshot_at']
+    search_fields = ['location__code', 'label_version__sku__sku_code']
+
+class ReconciliationDiscrepancyInline(admin.TabularInline):
+    model = ReconciliationDiscrepancy
+    extra = 0
+    can_delete = False
+    readonly_fields = ['location', 'label_version', 'stock_quantity', 'ledger_sum', 'ledger_balance']
+
+@admin.register(ReconciliationRun)
+class ReconciliationRunAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'incremental', 'started_at', 'finished_at', 'checked_keys', 'discrepancy_count']
+    list_filter = ['status', 'incremental']
+    readonly_fields = ['status', 'incremental', 'workers', 'started_at', 'finished_at', 'last_transaction_id',
+                       'checked_keys', 'discrepancy_count', 'error']
+    inlines = [ReconciliationDiscrepancyInline]
+
+@admin.register(LabelAvailability)
+class LabelAvailabilityAdmin(admin.ModelAdmin):
+    list_display = ['label_version', 'sku', 'on_hand', 'allocated', 'committed', 'updated_at']
+    search_fields = ['sku__sku_code']
+    readonly_fields = ['label_version', 'sku', 'on_hand', 'allocated', 'committed', 'updated_at']
+
+@admin.register(SKUAvailability)
+class SKUAvailabilityAdmin(admin.ModelAdmin):
+    list_display = ['sku', 'on_hand', 'allocated', 'committed', 'updated_at']
+    search_fields = ['sku__sku_code']
+    readonly_fields = ['sku', 'on_hand', 'allocated', 'committed', 'updated_at']
+
+@admin.register(CycleCount)
+class CycleCountAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'operator', 'created_at', 'posted_at', 'location_count', 'line_count', 'adjusted_count']
+    list_filter = ['status']
+    # 整区盘点可能有上万个库位与明细，不在详情页内联展示
+    exclude = ['locations']
+    readonly_fields = ['status', 'created_at', 'posted_at', 'last_transaction_id',
+                       'location_count', 'line_count', 'adjusted_count']
+
+@admin.register(CycleCountLine)
+class CycleCountLineAdmin(admin.ModelAdmin):
+    list_display = ['count', 'location', 'label_version', 'expected_quantity', 'counted_quantity', 'movement', 'variance']
+    list_select_related = ['count', 'location', 'label_version']
+    search_fields = ['location__code', 'label_version__sku__sku_code']
+    readonly_fields = ['count', 'location', 'label_version', 'expected_quantity', 'counted_quantity', 'counted_at',
+                       'movement', 'variance']
+
 @admin.register(StockTransaction)
 class StockTransactionAdmin(admin.ModelAdmin):
     list_display = ['transaction_type', 'sku', 'label_version', 'location', 'quantity_change', 'balance_after', 'operator', 'timestamp']
@@ -0,0 +1,206 @@
+# warehouse/allocation.py
+"""
+出库分配引擎
+为已审核通过的批次（OutboundExecution）挑选拣货库位：只分配批次指定的 LabelVersion，
+一次查询取出整个波次涉及标签版本的全部可用库存，在内存中按策略分配，
+再用一次 bulk_create + 一条 CASE UPDATE 写回，分配数量计入 InventoryStock.quantity_allocated。
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField, Exists, OuterRef
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .availability import apply_changes
+from .events import publish_executions
+from .models import InventoryStock, OutboundExecution, PickAllocation
+from .posting import post_stock, StockLine
+from .waves import update_wave_status
+
+STRATEGIES = ('fewest_locations', 'fifo', 'picking_first')
+
+
+class AllocationError(Exception):
+    """分配或发货请求不合法"""
+
+
+def default_strategy():
+    return getattr(settings, 'WAREHOUSE_ALLOCATION_STRATEGY', 'fewest_locations')
+
+
+def _order_candidates(candidates, need, strategy):
+    """按策略排列候选库存行，candidates 元素为 dict（含 available）"""
+    if strategy == 'fifo':
+        # 先进先出：最久未变动的库存先拣
+        return sorted(candidates, key=lambda c: (c['updated_at'], c['id']))
+    if strategy == 'picking_first':
+        # 先清空拣货区（小库存优先，腾出拣货位），再按先进先出动用其他区域
+        return sorted(candidates, key=lambda c: (
+            c['location_type'] != 'picking',
+            c['available'] if c['location_type'] == 'picking' else 0,
+            c['updated_at'], c['id'],
+        ))
+    # fewest_locations：单个库位能满足时取刚好够用的最小库位，否则按可用量从大到小
+    single = [c for c in candidates if c['available'] >= need]
+    if single:
+        return [min(single, key=lambda c: (c['available'], c['id']))]
+    return sorted(candidates, key=lambda c: (-c['available'], c['id']))
+
+
+def allocate_executions(execution_ids, strategy=None):
+    """
+    为一批出库任务分配库位。每个任务要么全部分配成功，要么记入 shortages 不分配。
+    已有分配、批次未审核通过或已发货的任务会被跳过。
+    返回 {"allocated": {execution_id: [PickAllocation...]}, "shortages": [...], "skipped": [...]}。
+    """
+    strategy = strategy or default_strategy()
+    if strategy not in STRATEGIES:
+        raise AllocationError(f"Unknown strategy '{strategy}'. Use one of {', '.join(STRATEGIES)}.")
+
+    with transaction.atomic():
+        # 第一条语句即写入：SQLite 上 select_for_update 不加锁，DEFERRED 事务先读后写时读锁升级会立即失败，
+        # 不经过 busy timeout（见 post_stock）。先对这批任务行做一次原值更新取得写锁，
+        # 之后的读取与分配都在写锁下进行，并发分配按 busy timeout 排队
+        OutboundExecution.objects.filter(pk__in=execution_ids).update(status=F('status'))
+        executions = list(
+            OutboundExecution.objects.filter(pk__in=execution_ids)
+            .select_related('batch__label')
+            .annotate(has_allocations=Exists(PickAllocation.objects.filter(execution=OuterRef('pk'))))
+            .order_by('id')
+        )
+        skipped = sorted(set(execution_ids) - {e.pk for e in executions})
+        pending = []
+        for execution in executions:
+            if execution.has_allocations or execution.status != 'assigned' or execution.batch.status != 'approved':
+                skipped.append(execution.pk)
+            else:
+                pending.append(execution)
+
+        # 一次查询取出相关标签版本的全部可用库存（走 stock_available_idx 部分索引）
+        label_ids = {e.batch.label_id for e in pending}
+        candidates_by_label = {}
+        for row in (
+            InventoryStock.objects.select_for_update(of=('self',))
+            .filter(label_version_id__in=label_ids, location__is_active=True,
+                    quantity__gt=F('quantity_allocated'))
+            .values('id', 'location_id', 'label_version_id', 'quantity', 'quantity_allocated',
+                    'updated_at', 'location__location_type')
+        ):
+            row['available'] = row['quantity'] - row['quantity_allocated']
+            row['location_type'] = row.pop('location__location_type')
+            candidates_by_label.setdefault(row['label_version_id'], []).append(row)
+
+        allocations = []
+        allocated = {}
+        reserved = {}
+        shortages = []
+        for execution in pending:
+            label_id = execution.batch.label_id
+            need = execution.batch.quantity
+            candidates = [c for c in candidates_by_label.get(label_id, ()) if c['available'] > 0]
+            total = sum(c['available'] for c in candidates)
+            if need <= 0 or total < need:
+                shortages.append({"execution": execution.pk, "label_version": label_id,
+                                  "requested": need, "available": total})
+                continue
+            picks = []
+            for candidate in _order_candidates(candidates, need, strategy):
+                take = min(need, candidate['available'])
+                candidate['available'] -= take
+                reserved[candidate['id']] = reserved.get(candidate['id'], 0) + take
+                picks.append(PickAllocation(
+                    execution=execution, location_id=candidate['location_id'],
+                    label_version_id=label_id, quantity=take,
+                ))
+                need -= take
+                if not need:
+                    break
+            allocations.extend(picks)
+            allocated[execution.pk] = picks
+
+        PickAllocation.objects.bulk_create(allocations, batch_size=1000)
+        _bump_allocated(reserved)
+        label_reserved = {}
+        for pick in allocations:
+            delta = label_reserved.setdefault(pick.label_version_id, {"allocated": 0})
+            delta["allocated"] += pick.quantity
+        apply_changes(label_reserved, {e.batch.label_id: e.batch.label.sku_id for e in pending})
+
+    return {"allocated": allocated, "shortages": shortages, "skipped": sorted(skipped), "strategy": strategy}
+
+
+def _bump_allocated(changes):
+    """changes: {stock_id: 增量}，按增量分组生成 CASE，一条 UPDATE 写回"""
+    if not changes:
+        return
+    by_amount = {}
+    for stock_id, amount in changes.items():
+        by_amount.setdefault(amount, []).append(stock_id)
+    InventoryStock.objects.filter(pk__in=list(changes)).update(
+        quantity_allocated=F('quantity_allocated') + Case(
+            *[When(pk__in=ids, then=Value(amount)) for amount, ids in by_amount.items()],
+            default=Value(0), output_field=IntegerField(),
+        )
+    )
+
+
+def _release(picks):
+    """
+    picks: [(location_id, label_version_id, quantity)]。释放库存行上的 quantity_allocated，
+    返回按标签版本汇总的可用量变动（供 apply_changes 使用，调用方可再补充 committed）。
+    """
+    stock_ids = dict(
+        ((loc, lv), pk) for pk, loc, lv in InventoryStock.objects.filter(
+            location_id__in={p[0] for p in picks}, label_version_id__in={p[1] for p in picks}
+        ).values_list('id', 'location_id', 'label_version_id')
+    )
+    release = {}
+    for loc, lv, qty in picks:
+        release[stock_ids[(loc, lv)]] = release.get(stock_ids[(loc, lv)], 0) - qty
+    _bump_allocated(release)
+    summary = {}
+    for loc, lv, qty in picks:
+        summary.setdefault(lv, {"allocated": 0, "committed": 0})["allocated"] -= qty
+    return summary
+
+
+def ship_execution(execution_id, operator=None, tracking_number=''):
+    """
+    发货：按分配记录过账 outbound 流水扣减库存，同时释放 quantity_allocated，任务置为 shipped。
+    """
+    with transaction.atomic():
+        claimed = (
+            OutboundExecution.objects.filter(pk=execution_id).exclude(status='shipped')
+            .update(status='shipped', shipped_at=timezone.now(), tracking_number=tracking_number)
+        )
+        execution = OutboundExecution.objects.select_related('batch').get(pk=execution_id)
+        if not claimed:
+            raise AllocationError("Execution is already shipped.")
+        picks = list(execution.allocations.values_list('location_id', 'label_version_id', 'quantity'))
+        if not picks:
+            raise AllocationError("Execution has no allocations.")
+
+        # 发货后批次不再占用 committed，分配量同时释放
+        summary = _release(picks)
+        if execution.batch.status == 'approved':
+            summary.setdefault(execution.batch.label_id, {"allocated": 0, "committed": 0})["committed"] -= execution.batch.quantity
+        apply_changes(summary)
+        transactions = post_stock(
+            [StockLine(loc, lv, -qty, execution.batch.batch_code) for loc, lv, qty in picks],
+            'outbound', operator=operator or execution.picker_id,
+        )
+        if execution.wave_id:
+            update_wave_status(execution.wave_id)
+        publish_executions([execution.pk], 'shipped')
+    return execution, transactions
+
+
+@receiver(pre_delete, sender=OutboundExecution)
+def _release_deleted_execution(sender, instance, **kwargs):
+    # 级联删除分配记录之前释放未发货任务的占用（已发货的在发货时已释放）；批次删除级联到任务时同样生效
+    if instance.status == 'shipped':
+        return
+    picks = list(PickAllocation.objects.filter(execution_id=instance.pk).values_list('location_id', 'label_version_id', 'quantity'))
+    if picks:
+        apply_changes(_release(picks))
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class WarehouseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'warehouse'
+
+    def ready(self):
+        # 注册扫描校验索引、标签响应缓存、事件总线、分配释放的信号处理
+        from . import verification  # noqa: F401
+        from . import label_cache  # noqa: F401
+        from . import events  # noqa: F401
+        from . import availability  # noqa: F401
+        from . import allocation  # noqa: F401
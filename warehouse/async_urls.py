@@ -0,0 +1,10 @@
+# warehouse/async_urls.py
+from django.urls import path
+
+from . import async_views
+
+urlpatterns = [
+    path('labels/checksum/<str:checksum>/', async_views.label_by_checksum, name='async-label-by-checksum'),
+    path('locations/<path:code>/stock/', async_views.location_stock, name='async-location-stock'),
+    path('batches/<int:pk>/status/', async_views.batch_status, name='async-batch-status'),
+]
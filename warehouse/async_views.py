@@ -0,0 +1,86 @@
+# warehouse/async_views.py
+"""
+异步只读查询接口（/api/async/）
+扫描枪与看板的高频查询（按 checksum 查标签、按库位查库存、查批次状态）几乎全是等待 I/O，
+在 ASGI 下用异步视图与异步 ORM（aget / afirst / async for）实现：等待数据库与慢客户端时不占用工作线程，
+单个工作进程即可挂住大量并发连接。
+- 只返回 values() 取出的字段，不经过 DRF 序列化器，避免在事件循环里触发同步的关联懒加载；
+- 同步的 DRF 视图集（views.py）保持不变，写操作与复杂查询仍走原接口；
+- WSGI 下这些视图同样可用（Django 自动转换），但没有并发收益。
+"""
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .models import InventoryStock, LabelVersion, ShipmentBatch, WarehouseLocation
+
+LABEL_FIELDS = ('id', 'sku_id', 'sku__sku_code', 'sku__current_label_id', 'version_number', 'fnsku', 'upc', 'checksum')
+STOCK_FIELDS = (
+    'id', 'label_version_id', 'label_version__sku__sku_code', 'label_version__version_number',
+    'quantity', 'quantity_allocated', 'updated_at',
+)
+BATCH_FIELDS = (
+    'id', 'batch_code', 'status', 'row_version', 'quantity', 'label_id',
+    'reviewer1_id', 'reviewer1_approved', 'reviewer2_id', 'reviewer2_approved', 'created_at',
+)
+
+
+def _not_found(message):
+    return JsonResponse({"error": message}, status=404)
+
+
+@require_GET
+async def label_by_checksum(request, checksum):
+    """同一 FNSKU/UPC 组合可能出现在多个 SKU 下，返回全部匹配的版本及是否为当前版本"""
+    labels = [
+        {
+            "id": row['id'],
+            "sku": row['sku_id'],
+            "sku_code": row['sku__sku_code'],
+            "version_number": row['version_number'],
+            "fnsku": row['fnsku'],
+            "upc": row['upc'],
+            "checksum": row['checksum'],
+            "is_current": row['id'] == row['sku__current_label_id'],
+        }
+        async for row in LabelVersion.objects.filter(checksum=checksum.lower()).order_by('id').values(*LABEL_FIELDS)
+    ]
+    if not labels:
+        return _not_found("Label not found")
+    return JsonResponse({"checksum": checksum.lower(), "labels": labels})
+
+
+@require_GET
+async def location_stock(request, code):
+    location = await (
+        WarehouseLocation.objects.filter(code=code)
+        .values('id', 'code', 'location_type', 'is_active').afirst()
+    )
+    if location is None:
+        return _not_found("Location not found")
+
+    stocks = InventoryStock.objects.filter(location_id=location['id']).order_by('id')
+    if request.GET.get('include_empty') not in ('1', 'true'):
+        stocks = stocks.filter(quantity__gt=0)
+    items = [
+        {
+            "id": row['id'],
+            "label_version": row['label_version_id'],
+            "sku_code": row['label_version__sku__sku_code'],
+            "version_number": row['label_version__version_number'],
+            "quantity": row['quantity'],
+            "quantity_allocated": row['quantity_allocated'],
+            "available": row['quantity'] - row['quantity_allocated'],
+            "updated_at": row['updated_at'],
+        }
+        async for row in stocks.values(*STOCK_FIELDS)
+    ]
+    return JsonResponse({"location": location, "total_quantity": sum(i['quantity'] for i in items), "items": items})
+
+
+@require_GET
+async def batch_status(request, pk):
+    try:
+        batch = await ShipmentBatch.objects.values(*BATCH_FIELDS).aget(pk=pk)
+    except ShipmentBatch.DoesNotExist:
+        return _not_found("Batch not found")
+    return JsonResponse(batch)
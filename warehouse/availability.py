@@ -0,0 +1,205 @@
+# warehouse/availability.py
+"""
+可用量汇总维护
+LabelAvailability / SKUAvailability 按主键存放 on_hand、allocated、committed，
+"SKU X 还能发多少" 由跨库位聚合 + 减去未发货批次的多表查询变为一次主键读取。
+写入路径在各自的事务内增量更新汇总行：
+- 过账（post_stock）：on_hand 按标签版本净变动；
+- 批次进入/离开 approved（审核 UPDATE、模型保存、删除）：committed 增减批次数量；
+- 分配：allocated 增加；发货：allocated 与 committed 释放，on_hand 由出库过账扣减。
+增量更新与过账引擎相同：缺失的汇总行以 0 补齐，再按增量分组生成 CASE，一条 UPDATE 写回一批。
+"""
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField, Sum
+from django.db.models.signals import post_init, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    InventoryStock, LabelAvailability, LabelVersion, OutboundExecution, ShipmentBatch, SKUAvailability,
+)
+
+FIELDS = ('on_hand', 'allocated', 'committed')
+CHUNK_SIZE = 1000
+
+
+class AvailabilityError(Exception):
+    """可用量查询请求不合法"""
+
+
+def apply_changes(changes, sku_by_label=None):
+    """
+    changes: {label_version_id: {"on_hand": 增量, "allocated": 增量, "committed": 增量}}（缺省字段为 0）
+    同时更新标签版本汇总行与所属 SKU 的汇总行；须在写入业务数据的同一事务内调用。
+    """
+    changes = {label_id: delta for label_id, delta in changes.items() if any(delta.values())}
+    if not changes:
+        return
+    missing = set(changes) - set(sku_by_label or ())
+    if missing:
+        sku_by_label = {
+            **(sku_by_label or {}),
+            **dict(LabelVersion.objects.filter(pk__in=missing).values_list('id', 'sku_id')),
+        }
+    sku_changes = {}
+    for label_id, delta in changes.items():
+        total = sku_changes.setdefault(sku_by_label[label_id], {})
+        for field, amount in delta.items():
+            total[field] = total.get(field, 0) + amount
+
+    with transaction.atomic(savepoint=False):
+        LabelAvailability.objects.bulk_create(
+            [LabelAvailability(label_version_id=label_id, sku_id=sku_by_label[label_id]) for label_id in changes],
+            ignore_conflicts=True, batch_size=CHUNK_SIZE,
+        )
+        SKUAvailability.objects.bulk_create(
+            [SKUAvailability(sku_id=sku_id) for sku_id in sku_changes], ignore_conflicts=True, batch_size=CHUNK_SIZE,
+        )
+        _bump(LabelAvailability, changes)
+        _bump(SKUAvailability, sku_changes)
+
+
+def _bump(model, changes):
+    now = timezone.now()
+    keys = list(changes)
+    for start in range(0, len(keys), CHUNK_SIZE):
+        chunk = keys[start:start + CHUNK_SIZE]
+        updates = {}
+        for field in FIELDS:
+            by_amount = {}
+            for pk in chunk:
+                amount = changes[pk].get(field, 0)
+                if amount:
+                    by_amount.setdefault(amount, []).append(pk)
+            if by_amount:
+                updates[field] = F(field) + Case(
+                    *[When(pk__in=ids, then=Value(amount)) for amount, ids in by_amount.items()],
+                    default=Value(0), output_field=IntegerField(),
+                )
+        model.objects.filter(pk__in=chunk).update(updated_at=now, **updates)
+
+
+def stock_posted(transactions, sku_by_label=None):
+    """过账后调用：按标签版本汇总流水数量变动"""
+    changes = {}
+    for txn in transactions:
+        delta = changes.setdefault(txn.label_version_id, {"on_hand": 0})
+        delta["on_hand"] += txn.quantity_change
+    apply_changes(changes, sku_by_label)
+
+
+def batches_changed(changes):
+    """
+    批次写入后调用。changes: [(batch_id, before, after), ...]，before/after 为 (status, label_id, quantity)，
+    新建时 before 为 None，删除时 after 为 None。
+    approved 的批次占用 committed；进出 approved 或修改已审核批次的标签、数量时增减，已发货的批次忽略。
+    """
+    touched = []
+    for batch_id, before, after in changes:
+        removed = tuple(before[1:]) if before and before[0] == 'approved' else None
+        added = tuple(after[1:]) if after and after[0] == 'approved' else None
+        if removed != added:
+            touched.append((batch_id, removed, added))
+    if not touched:
+        return
+    shipped = set(
+        OutboundExecution.objects.filter(batch_id__in=[t[0] for t in touched], status='shipped')
+        .values_list('batch_id', flat=True)
+    )
+    deltas = {}
+    for batch_id, removed, added in touched:
+        if batch_id in shipped:
+            continue
+        for commitment, sign in ((removed, -1), (added, 1)):
+            if commitment:
+                label_id, quantity = commitment
+                delta = deltas.setdefault(label_id, {"committed": 0})
+                delta["committed"] += sign * quantity
+    apply_changes(deltas)
+
+
+def check_availability(requested, by='label'):
+    """
+    requested: {label_version_id 或 sku_id: 需求数量}。一次主键查询取出汇总行，
+    返回 [{"id", "requested", "available", "ok"}]，没有汇总行的视为可用量 0。
+    """
+    if by not in ('label', 'sku'):
+        raise AvailabilityError("by must be 'label' or 'sku'.")
+    model = LabelAvailability if by == 'label' else SKUAvailability
+    available = {
+        pk: on_hand - committed
+        for pk, on_hand, committed in model.objects.filter(pk__in=list(requested)).values_list('pk', 'on_hand', 'committed')
+    }
+    return [
+        {"id": pk, "requested": quantity, "available": available.get(pk, 0), "ok": available.get(pk, 0) >= quantity}
+        for pk, quantity in requested.items()
+    ]
+
+
+@transaction.atomic
+def rebuild_availability():
+    """
+    从 InventoryStock 与未发货的已审核批次全量重建两张汇总表。
+    返回 {"labels", "skus", "corrected"}，corrected 为重建前数值不一致（含缺失、多余）的标签版本行数。
+    """
+    totals = {}
+    for label_id, on_hand, allocated in (
+        InventoryStock.objects.values('label_version_id')
+        .annotate(on_hand=Sum('quantity'), allocated=Sum('quantity_allocated'))
+        .values_list('label_version_id', 'on_hand', 'allocated')
+    ):
+        totals[label_id] = [on_hand or 0, allocated or 0, 0]
+    for label_id, committed in (
+        ShipmentBatch.objects.filter(status='approved').exclude(execution__status='shipped')
+        .values('label_id').annotate(committed=Sum('quantity')).values_list('label_id', 'committed')
+    ):
+        totals.setdefault(label_id, [0, 0, 0])[2] = committed or 0
+    sku_by_label = dict(LabelVersion.objects.filter(pk__in=list(totals)).values_list('id', 'sku_id'))
+
+    sku_totals = {}
+    for label_id, values in totals.items():
+        total = sku_totals.setdefault(sku_by_label[label_id], [0, 0, 0])
+        for i, value in enumerate(values):
+            total[i] += value
+
+    before = {
+        pk: [on_hand, allocated, committed]
+        for pk, on_hand, allocated, committed in LabelAvailability.objects.select_for_update()
+        .values_list('pk', 'on_hand', 'allocated', 'committed')
+    }
+    corrected = sum(
+        1 for pk in set(before) | set(totals) if before.get(pk, [0, 0, 0]) != totals.get(pk, [0, 0, 0])
+    )
+    LabelAvailability.objects.all().delete()
+    SKUAvailability.objects.all().delete()
+    LabelAvailability.objects.bulk_create([
+        LabelAvailability(label_version_id=label_id, sku_id=sku_by_label[label_id],
+                          **dict(zip(FIELDS, values)))
+        for label_id, values in totals.items()
+    ], batch_size=CHUNK_SIZE)
+    SKUAvailability.objects.bulk_create([
+        SKUAvailability(sku_id=sku_id, **dict(zip(FIELDS, values))) for sku_id, values in sku_totals.items()
+    ], batch_size=CHUNK_SIZE)
+    return {"labels": len(totals), "skus": len(sku_totals), "corrected": corrected}
+
+
+# --- 通过模型保存/删除批次（管理后台、批次接口的增改删）时维护 committed ---
+
+@receiver(post_init, sender=ShipmentBatch)
+def _remember_commitment(sender, instance, **kwargs):
+    # 用 __dict__ 读取，避免对 only()/defer() 延迟加载的字段触发查询
+    state = instance.__dict__
+    instance._loaded_commitment = (state.get('status'), state.get('label_id'), state.get('quantity'))
+
+
+@receiver(post_save, sender=ShipmentBatch)
+def _batch_saved(sender, instance, created, **kwargs):
+    current = (instance.status, instance.label_id, instance.quantity)
+    batches_changed([(instance.pk, None if created else instance._loaded_commitment, current)])
+    instance._loaded_commitment = current
+
+
+@receiver(pre_delete, sender=ShipmentBatch)
+def _batch_deleted(sender, instance, **kwargs):
+    # 级联删除出库任务之前判断是否已发货
+    batches_changed([(instance.pk, (instance.status, instance.label_id, instance.quantity), None)])
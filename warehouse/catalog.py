@@ -0,0 +1,178 @@
+# warehouse/catalog.py
+"""
+商品目录导入
+读取 CSV / XLSX（列：sku_code, product_name, fnsku, upc），按块处理：
+- 每块一次查询取出已存在的 SKU 及其当前标签版本；
+- 缺失的 SKU 一次 bulk_create，并与 FNSKU/UPC 发生变化的已有 SKU 一起交给
+  LabelVersion.bulk_create_versions 批量分配版本号（新 SKU 为 v0，变化的为新版本）；
+- 与当前版本一致的行不做改动，因此同一份目录重复导入是幂等的。
+不合法的行逐行记录错误（行号从表头之后的第 2 行开始），不影响其他行。
+"""
+import csv
+import io
+import os
+
+from django.db import transaction
+
+from .models import SKU, LabelVersion
+
+CHUNK_SIZE = 5000
+COLUMNS = ('sku_code', 'product_name', 'fnsku', 'upc')
+MAX_LENGTHS = {
+    'sku_code': SKU._meta.get_field('sku_code').max_length,
+    'product_name': SKU._meta.get_field('product_name').max_length,
+    'fnsku': LabelVersion._meta.get_field('fnsku').max_length,
+    'upc': LabelVersion._meta.get_field('upc').max_length,
+}
+
+
+class CatalogError(Exception):
+    """目录文件无法读取（格式、表头或依赖缺失）"""
+
+
+def _cell(value):
+    """XLSX 单元格转字符串：数字型 UPC 不能带 '.0'"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _header_index(header):
+    names = [_cell(h).lower() for h in header]
+    if 'sku_code' not in names:
+        raise CatalogError(f"Missing required column 'sku_code'. Expected columns: {', '.join(COLUMNS)}.")
+    return {name: names.index(name) for name in COLUMNS if name in names}
+
+
+def _csv_rows(text):
+    """逐行读取 CSV；编码或 CSV 格式错误转换为 CatalogError（读取是惰性的，错误可能出现在导入途中）"""
+    reader = csv.reader(text)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except UnicodeDecodeError:
+            # 解码按块进行，行号不可靠
+            raise CatalogError("CSV is not valid UTF-8. Save the file as UTF-8 and upload again.")
+        except csv.Error as exc:
+            raise CatalogError(f"Malformed CSV on line {reader.line_num}: {exc}")
+        yield row
+
+
+def _rows_from_table(table):
+    """table 为行序列迭代器（首行为表头），产出 (行号, dict)"""
+    try:
+        header = next(table)
+    except StopIteration:
+        raise CatalogError("File is empty.")
+    index = _header_index(header)
+    for line_no, values in enumerate(table, start=2):
+        if not any(_cell(v) for v in values):
+            continue
+        yield line_no, {
+            name: _cell(values[i]) if i < len(values) else ''
+            for name, i in index.items()
+        }
+
+
+def read_catalog(fileobj, filename):
+    """
+    按扩展名读取 CSV 或 XLSX，fileobj 为二进制文件对象。XLSX 需要安装 openpyxl（只在用到时导入）。
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise CatalogError("Reading XLSX files requires the 'openpyxl' package.")
+        try:
+            workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        except Exception as exc:
+            raise CatalogError(f"Cannot read XLSX file: {exc}")
+        return _rows_from_table(workbook.active.iter_rows(values_only=True))
+    if extension in ('.csv', '.txt', ''):
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+        return _rows_from_table(_csv_rows(text))
+    raise CatalogError(f"Unsupported file type '{extension}'. Use .csv or .xlsx.")
+
+
+def _validate(row):
+    if not row.get('sku_code'):
+        return "sku_code is required."
+    for name, limit in MAX_LENGTHS.items():
+        if len(row.get(name, '')) > limit:
+            return f"{name} exceeds {limit} characters."
+    return None
+
+
+def _import_chunk(chunk, created_by, summary):
+    codes = [row['sku_code'] for _, row in chunk]
+    with transaction.atomic():
+        existing = {
+            sku.sku_code: sku
+            for sku in SKU.objects.filter(sku_code__in=codes).select_related('current_label')
+        }
+        missing = [
+            SKU(sku_code=row['sku_code'], product_name=row.get('product_name', ''))
+            for _, row in chunk if row['sku_code'] not in existing
+        ]
+        SKU.objects.bulk_create(missing, batch_size=1000)
+        summary['created_skus'] += len(missing)
+        new_codes = {sku.sku_code for sku in missing}
+        if missing and missing[0].pk is None:
+            # 数据库不支持 RETURNING 时重新取回主键
+            existing.update(SKU.objects.in_bulk(new_codes, field_name='sku_code'))
+        else:
+            existing.update((sku.sku_code, sku) for sku in missing)
+
+        entries = []
+        for _, row in chunk:
+            sku = existing[row['sku_code']]
+            fnsku, upc = row.get('fnsku', ''), row.get('upc', '')
+            current = sku.current_label if sku.current_label_id else None
+            if current is not None and (current.fnsku, current.upc) == (fnsku, upc):
+                summary['unchanged'] += 1
+                continue
+            if row['sku_code'] not in new_codes and current is not None:
+                summary['new_versions'] += 1
+            entries.append((sku, fnsku, upc))
+        if entries:
+            LabelVersion.bulk_create_versions(entries, created_by=created_by)
+
+
+def import_catalog(rows, created_by='import', chunk_size=CHUNK_SIZE):
+    """
+    rows 为 (行号, dict) 迭代器（见 read_catalog）。
+    返回汇总 {"rows", "created_skus", "new_versions", "unchanged", "errors": [{"row", "sku_code", "error"}]}。
+    文件内重复的 sku_code 只导入第一次出现的行。
+    """
+    summary = {"rows": 0, "created_skus": 0, "new_versions": 0, "unchanged": 0, "errors": []}
+    seen = {}
+    chunk = []
+    for line_no, row in rows:
+        summary['rows'] += 1
+        error = _validate(row)
+        if error is None and row['sku_code'] in seen:
+            error = f"Duplicate sku_code (first seen on row {seen[row['sku_code']]})."
+        if error:
+            summary['errors'].append({"row": line_no, "sku_code": row.get('sku_code', ''), "error": error})
+            continue
+        seen[row['sku_code']] = line_no
+        chunk.append((line_no, row))
+        if len(chunk) >= chunk_size:
+            _import_chunk(chunk, created_by, summary)
+            chunk = []
+    if chunk:
+        _import_chunk(chunk, created_by, summary)
+    return summary
+
+
+def write_error_file(errors, fileobj):
+    """逐行错误写为 CSV（row, sku_code, error）"""
+    writer = csv.writer(fileobj)
+    writer.writerow(['row', 'sku_code', 'error'])
+    for error in errors:
+        writer.writerow([error['row'], error['sku_code'], error['error']])
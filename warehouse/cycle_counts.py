@@ -0,0 +1,229 @@
+# warehouse/cycle_counts.py
+"""
+循环盘点（整巷道、整区盘点）
+- start_cycle_count：冻结一组库位的 InventoryStock 快照为盘点明细，记下冻结时的最大流水 ID；
+- record_counts：批量录入实盘数量，按数量分组生成 CASE，一条 UPDATE 写回一批明细；
+- post_cycle_count：集合式计算差异，所有差异在一个事务内一次 post_stock 写成 adjust 流水并修正库存。
+盘点期间库位照常收发货：差异 = 实盘 - (快照 + 冻结点之后、清点之前的流水)，
+清点之前的收发货已体现在实盘里、清点之后的仍保留在库存里，两者都不会被重复计算。
+"清点时刻"取扫描枪记录的 counted_at，而不是上传时刻：离线扫描、批量上传时两者可能相差数小时。
+"""
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField, DateTimeField, Max
+from django.utils import timezone
+
+from .locations import location_filter
+from .models import (
+    CycleCount, CycleCountLine, InventoryStock, LabelVersion, Operator, StockTransaction, WarehouseLocation,
+)
+from .posting import post_stock, StockLine
+
+CHUNK_SIZE = 1000
+UNCOUNTED_POLICIES = ('skip', 'zero')
+
+
+class CycleCountError(Exception):
+    """盘点请求不合法或盘点状态不允许该操作"""
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _scope(count_id):
+    """盘点范围内库位 ID 的子查询"""
+    return CycleCount.locations.through.objects.filter(cyclecount_id=count_id).values('warehouselocation_id')
+
+
+def start_cycle_count(location_ids=None, params=None, operator=None, note=''):
+    """
+    冻结盘点快照。location_ids 与 params（库位层级过滤参数，见 locations.location_filter）至少给一个，
+    两者同时给出时取交集；只盘点启用的库位。已在其他进行中盘点里的库位不能重复盘点。
+    冻结点（最大流水 ID）与库存快照必须一致：事务的第一条语句先写盘点任务行，取得 SQLite 的库级写锁，
+    其后的两次读取之间不会有其他过账提交。换用行级锁的数据库时，需要先锁住范围内的库存行再读取。
+    """
+    if not location_ids and not params:
+        raise CycleCountError("Specify location ids or a location hierarchy filter.")
+    locations = WarehouseLocation.objects.filter(is_active=True)
+    if location_ids:
+        locations = locations.filter(pk__in=location_ids)
+    if params:
+        locations = locations.filter(location_filter(params))
+    operator_id = getattr(operator, 'pk', operator)
+    if operator_id is not None:
+        try:
+            operator_id = int(operator_id)
+        except (TypeError, ValueError):
+            raise CycleCountError(f"operator_id must be an integer, got {operator_id!r}.")
+    if operator_id is not None and not Operator.objects.filter(pk=operator_id).exists():
+        raise CycleCountError(f"Unknown operator: {operator_id}")
+
+    with transaction.atomic():
+        # 先写盘点任务行取得写锁，之后读取的最大流水 ID 与库存快照之间不会插入新的过账
+        count = CycleCount.objects.create(operator_id=operator_id, note=note)
+        ids = list(locations.order_by('id').values_list('id', flat=True))
+        if not ids:
+            raise CycleCountError("No active locations match.")
+        busy = sorted(set(
+            CycleCount.locations.through.objects
+            .filter(cyclecount__status='counting', warehouselocation_id__in=locations.values('id'))
+            .exclude(cyclecount_id=count.pk)
+            .values_list('warehouselocation_id', flat=True)
+        ))
+        if busy:
+            raise CycleCountError(f"{len(busy)} location(s) are already in an open cycle count, e.g. {busy[:10]}.")
+
+        Through = CycleCount.locations.through
+        Through.objects.bulk_create(
+            [Through(cyclecount_id=count.pk, warehouselocation_id=pk) for pk in ids], batch_size=CHUNK_SIZE,
+        )
+        count.last_transaction_id = StockTransaction.objects.aggregate(last=Max('id'))['last'] or 0
+        lines = [
+            CycleCountLine(count=count, location_id=loc, label_version_id=lv, expected_quantity=qty)
+            for loc, lv, qty in InventoryStock.objects.filter(location_id__in=_scope(count.pk), quantity__gt=0)
+            .values_list('location_id', 'label_version_id', 'quantity').iterator(chunk_size=CHUNK_SIZE)
+        ]
+        CycleCountLine.objects.bulk_create(lines, batch_size=CHUNK_SIZE)
+        count.location_count, count.line_count = len(ids), len(lines)
+        count.save(update_fields=['last_transaction_id', 'location_count', 'line_count'])
+    return count
+
+
+def _write_lines(field, values, output_field=None):
+    """values: {line_id: 新值}，按值分组生成 CASE，每块一条 UPDATE"""
+    line_ids = list(values)
+    for chunk in _chunks(line_ids):
+        by_value = {}
+        for pk in chunk:
+            by_value.setdefault(values[pk], []).append(pk)
+        CycleCountLine.objects.filter(pk__in=chunk).update(**{field: Case(
+            *[When(pk__in=ids, then=Value(value)) for value, ids in by_value.items()],
+            default=F(field), output_field=output_field or IntegerField(),
+        )})
+
+
+def record_counts(count_id, entries):
+    """
+    录入实盘数量。entries: [(location_id, label_version_id, counted_quantity[, counted_at]), ...]，
+    counted_at 为扫描枪记录的清点时刻（aware datetime），缺省或为 None 时取录入时刻；
+    它必须在盘点开始之后、不晚于当前时刻。同一组合以最后一条为准，重复录入覆盖之前的数量。
+    快照中没有的组合（清点时发现的货）补一行 expected_quantity=0。返回 {"recorded", "added"}。
+    """
+    now = timezone.now()
+    counted, counted_at = {}, {}
+    for loc, lv, quantity, *at in entries:
+        if not isinstance(quantity, int) or isinstance(quantity, bool):
+            raise CycleCountError(f"Counted quantity for location {loc} / label {lv} must be an integer.")
+        if quantity < 0:
+            raise CycleCountError(f"Counted quantity for location {loc} / label {lv} must not be negative.")
+        at = (at[0] if at else None) or now
+        if not isinstance(at, datetime):
+            raise CycleCountError(f"counted_at for location {loc} / label {lv} must be a datetime.")
+        if at > now:
+            raise CycleCountError(f"counted_at for location {loc} / label {lv} is in the future.")
+        counted[(loc, lv)], counted_at[(loc, lv)] = quantity, at
+    if not counted:
+        raise CycleCountError("No counts given.")
+    location_ids = {k[0] for k in counted}
+    label_ids = {k[1] for k in counted}
+
+    with transaction.atomic():
+        # 与 post_cycle_count 相同，先用条件 UPDATE 抢占进行中的盘点：第一条语句即写入并取得写锁，
+        # 之后的校验读取都在写锁下进行（SQLite DEFERRED 事务先读后写会在锁升级时立即失败）
+        claimed = CycleCount.objects.filter(pk=count_id, status='counting').update(status='counting')
+        count = CycleCount.objects.get(pk=count_id)
+        if not claimed:
+            raise CycleCountError(f"Cycle count is already {count.status}.")
+        early = [key for key, at in counted_at.items() if at < count.created_at]
+        if early:
+            raise CycleCountError(f"counted_at is before the cycle count started for {len(early)} line(s), e.g. {early[0]}.")
+        in_scope = set()
+        for chunk in _chunks(list(location_ids)):
+            in_scope.update(
+                _scope(count.pk).filter(warehouselocation_id__in=chunk).values_list('warehouselocation_id', flat=True)
+            )
+        if in_scope != location_ids:
+            raise CycleCountError(f"Locations outside this cycle count: {sorted(location_ids - in_scope)[:10]}")
+        known_labels = set(LabelVersion.objects.filter(pk__in=label_ids).values_list('id', flat=True))
+        if known_labels != label_ids:
+            raise CycleCountError(f"Unknown label versions: {sorted(label_ids - known_labels)[:10]}")
+
+        line_id = {}
+        for chunk in _chunks(list(location_ids)):
+            for pk, loc, lv in count.lines.filter(location_id__in=chunk).values_list('id', 'location_id', 'label_version_id'):
+                line_id[(loc, lv)] = pk
+        missing = [key for key in counted if key not in line_id]
+        added = CycleCountLine.objects.bulk_create(
+            [CycleCountLine(count=count, location_id=loc, label_version_id=lv) for loc, lv in missing],
+            batch_size=CHUNK_SIZE,
+        )
+        line_id.update(((line.location_id, line.label_version_id), line.pk) for line in added)
+
+        _write_lines('counted_quantity', {line_id[key]: quantity for key, quantity in counted.items()})
+        _write_lines('counted_at', {line_id[key]: at for key, at in counted_at.items()}, DateTimeField())
+        if added:
+            CycleCount.objects.filter(pk=count.pk).update(line_count=F('line_count') + len(added))
+    return {"recorded": len(counted), "added": len(added)}
+
+
+def post_cycle_count(count_id, operator=None, uncounted='skip'):
+    """
+    过账盘点差异。uncounted='skip' 时未录入实盘的明细不调整；'zero' 时视为实盘 0（整库位清点的口径）。
+    差异在一次 post_stock 中写成 adjust 流水（reference 为 CC-{id}），同一事务内修正库存与可用量汇总；
+    任一组合扣减后为负则整批回滚，盘点保持进行中。返回 (CycleCount, 流水列表)。
+    """
+    if uncounted not in UNCOUNTED_POLICIES:
+        raise CycleCountError(f"uncounted must be one of {', '.join(UNCOUNTED_POLICIES)}.")
+
+    with transaction.atomic():
+        now = timezone.now()
+        claimed = CycleCount.objects.filter(pk=count_id, status='counting').update(status='posted', posted_at=now)
+        count = CycleCount.objects.get(pk=count_id)
+        if not claimed:
+            raise CycleCountError(f"Cycle count is already {count.status}.")
+        if uncounted == 'zero':
+            count.lines.filter(counted_quantity__isnull=True).update(counted_quantity=0, counted_at=now)
+
+        # 冻结点之后、范围内库位的流水（走 txn_location_id_idx），按组合保留 (时间, 数量)
+        moves = {}
+        for loc, lv, quantity, at in (
+            StockTransaction.objects.filter(id__gt=count.last_transaction_id, location_id__in=_scope(count.pk))
+            .values_list('location_id', 'label_version_id', 'quantity_change', 'timestamp')
+            .iterator(chunk_size=CHUNK_SIZE)
+        ):
+            moves.setdefault((loc, lv), []).append((at, quantity))
+
+        movements, variances, posting = {}, {}, []
+        for pk, loc, lv, expected, quantity, counted_at in (
+            count.lines.filter(counted_quantity__isnull=False).order_by('id')
+            .values_list('id', 'location_id', 'label_version_id', 'expected_quantity', 'counted_quantity', 'counted_at')
+            .iterator(chunk_size=CHUNK_SIZE)
+        ):
+            # 扫描时刻之前的收发货已体现在实盘数量中，之后（含扫描到上传之间）的仍保留在库存里
+            moved = sum(q for at, q in moves.get((loc, lv), ()) if at <= counted_at)
+            variance = quantity - (expected + moved)
+            if moved:
+                movements[pk] = moved
+            variances[pk] = variance
+            if variance:
+                posting.append(StockLine(loc, lv, variance, count.reference))
+        _write_lines('movement', movements)
+        _write_lines('variance', variances)
+
+        transactions = post_stock(posting, 'adjust', operator=getattr(operator, 'pk', operator) or count.operator_id)
+        count.adjusted_count = len(posting)
+        count.save(update_fields=['adjusted_count'])
+    return count, transactions
+
+
+def cancel_cycle_count(count_id):
+    """取消进行中的盘点，释放库位；不写任何流水"""
+    with transaction.atomic():
+        cancelled = CycleCount.objects.filter(pk=count_id, status='counting').update(status='cancelled')
+        count = CycleCount.objects.get(pk=count_id)
+        if not cancelled:
+            raise CycleCountError(f"Cycle count is already {count.status}.")
+    return count
@@ -0,0 +1,123 @@
+# warehouse/db_router.py
+"""
+读写分离
+- 写操作、事务内的读、以及未显式允许的读全部走主库 default；
+- ReplicaRoutingMiddleware 只对安全方法（GET/HEAD/OPTIONS）的请求放行读库，
+  列表、详情、导出等只读接口因此落到 DATABASE_READ_REPLICAS 中的一个读库，
+  读库在进入请求时选定一次，同一请求内的所有查询复用它；
+- 写请求之后在 Cookie 中记录一个粘滞窗口（WAREHOUSE_STICKY_PRIMARY_SECONDS），
+  窗口内该客户端的读请求仍走主库，保证审核员能立即看到自己的修改（读己之写）。
+未配置读库时路由器不做任何事，行为与单库完全一致。
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'wh_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# 当前上下文选定的读库别名；默认 None，即一切读写走主库
+_replica_alias = ContextVar('warehouse_replica_alias', default=None)
+
+
+def read_replicas():
+    return list(getattr(settings, 'DATABASE_READ_REPLICAS', []))
+
+
+@contextmanager
+def replica_reads(allowed=True):
+    """在代码块内允许（或禁止）读库，例如只读的报表任务；进入时选定一个读库，已选定则沿用"""
+    alias = None
+    if allowed:
+        replicas = read_replicas()
+        current = _replica_alias.get()
+        alias = current if current in replicas else (random.choice(replicas) if replicas else None)
+    token = _replica_alias.set(alias)
+    try:
+        yield
+    finally:
+        _replica_alias.reset(token)
+
+
+def use_primary():
+    """在代码块内强制走主库"""
+    return replica_reads(False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _replica_alias.get()
+        if alias is None or alias not in read_replicas():
+            return None
+        # 主库上已开启事务时，读要看到本事务的写入
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 读库是主库的副本，跨库对象间的关系视为同一数据库
+        pool = {DEFAULT_DB_ALIAS, *read_replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 读库由复制同步，不单独迁移
+        if db in read_replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    按请求决定是否允许读库，并维护写后粘滞主库的 Cookie。
+    同时支持同步与异步调用链，ASGI 下不会把异步视图推到线程里执行。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not read_replicas():
+            return self.get_response(request)
+        with replica_reads(self.allow_replica(request)):
+            response = self.get_response(request)
+        return self.mark_sticky(request, response)
+
+    async def __acall__(self, request):
+        if not read_replicas():
+            return await self.get_response(request)
+        with replica_reads(self.allow_replica(request)):
+            response = await self.get_response(request)
+        return self.mark_sticky(request, response)
+
+    def allow_replica(self, request):
+        if request.method not in SAFE_METHODS:
+            return False
+        try:
+            return float(request.COOKIES.get(STICKY_COOKIE, 0)) <= time.time()
+        except ValueError:
+            return True
+
+    def mark_sticky(self, request, response):
+        if request.method not in SAFE_METHODS:
+            window = getattr(settings, 'WAREHOUSE_STICKY_PRIMARY_SECONDS', 5)
+            response.set_cookie(
+                STICKY_COOKIE, f"{time.time() + window:.3f}", max_age=window, httponly=True, samesite='Lax',
+            )
+        return response
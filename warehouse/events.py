@@ -0,0 +1,168 @@
+# warehouse/events.py
+"""
+进程内事件总线
+业务写入提交后发布事件（批次状态、出库任务状态、库存过账），SSE 接口（见 streams.py）订阅推送给看板，
+取代对 /api/batches/ 的轮询。
+- 每个订阅者持有一个 asyncio.Queue，发布方（同步视图所在线程）按事件循环通过 loop.call_soon_threadsafe 投递，
+  空闲订阅者只占一个队列和一个挂起的协程，单进程可承载数千连接；
+- 队列有上限，慢消费者只丢弃自己最旧的事件，不会拖慢发布方；
+- 最近的事件保留在环形缓冲中，断线重连时按 Last-Event-ID 补发。
+事件来源：模型 post_save 钩子，以及不触发信号的集合式写入（审核 UPDATE、过账 bulk_create、波次/发货）显式发布。
+所有事件都在事务提交后发布，回滚的写入不会被推送。
+总线只在当前进程内有效，多进程部署时每个进程只推送本进程产生的事件。
+"""
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.db import transaction
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+
+from .models import ShipmentBatch, OutboundExecution
+
+TOPICS = ('batch', 'execution', 'stock')
+
+Event = namedtuple('Event', ['id', 'topic', 'payload', 'timestamp'])
+
+
+class Subscription:
+    def __init__(self, broker, loop, topics, maxsize):
+        self.broker = broker
+        self.loop = loop
+        self.topics = frozenset(topics) if topics else None
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def wants(self, event):
+        return self.topics is None or event.topic in self.topics
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """等待下一个事件，超时返回 None"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+def _deliver(subscriptions, event):
+    for subscription in subscriptions:
+        subscription._put(event)
+
+
+class EventBroker:
+    def __init__(self, history=1000, queue_size=256):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history)
+        self._ids = itertools.count(1)
+        self.queue_size = queue_size
+
+    def publish(self, topic, payload):
+        with self._lock:
+            event = Event(next(self._ids), topic, payload, time.time())
+            self._history.append(event)
+            subscribers = [s for s in self._subscribers if s.wants(event)]
+        # 同一事件循环上的订阅者合并为一次 call_soon_threadsafe，避免逐个唤醒循环
+        by_loop = {}
+        for subscription in subscribers:
+            by_loop.setdefault(subscription.loop, []).append(subscription)
+        for loop, group in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, group, event)
+            except RuntimeError:
+                # 事件循环已关闭，连接均已断开
+                for subscription in group:
+                    self.unsubscribe(subscription)
+        return event
+
+    def subscribe(self, topics=None, last_event_id=None):
+        """在事件循环内调用；给出 last_event_id 时先放入缓冲中其后的事件"""
+        subscription = Subscription(self, asyncio.get_running_loop(), topics, self.queue_size)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._history:
+                    if event.id > last_event_id and subscription.wants(event):
+                        subscription._put(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+broker = EventBroker()
+
+
+def publish_on_commit(topic, payload):
+    transaction.on_commit(lambda: broker.publish(topic, payload))
+
+
+def publish_batches(changes):
+    """changes: [(batch_id, status, previous_status), ...]"""
+    if changes:
+        publish_on_commit('batch', {
+            "batches": [{"id": pk, "status": status, "previous_status": previous} for pk, status, previous in changes]
+        })
+
+
+def publish_executions(execution_ids, status, **extra):
+    if execution_ids:
+        publish_on_commit('execution', {"executions": sorted(execution_ids), "status": status, **extra})
+
+
+def publish_postings(transaction_type, transactions, limit=500):
+    """过账事件：每次过账一条，行数过多时截断明细"""
+    if transactions:
+        publish_on_commit('stock', {
+            "transaction_type": transaction_type,
+            "count": len(transactions),
+            "truncated": len(transactions) > limit,
+            "transactions": [
+                {
+                    "id": txn.id, "location": txn.location_id, "label_version": txn.label_version_id,
+                    "quantity_change": txn.quantity_change, "balance_after": txn.balance_after,
+                }
+                for txn in transactions[:limit]
+            ],
+        })
+
+
+# --- 模型保存钩子：记录加载时的状态，保存后状态变化才发布 ---
+
+@receiver(post_init, sender=ShipmentBatch)
+@receiver(post_init, sender=OutboundExecution)
+def _remember_status(sender, instance, **kwargs):
+    # 用 __dict__ 读取，避免对 only()/defer() 延迟加载的字段触发查询
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=ShipmentBatch)
+def _batch_saved(sender, instance, created, **kwargs):
+    previous = None if created else instance._loaded_status
+    if created or previous != instance.status:
+        publish_batches([(instance.pk, instance.status, previous)])
+    instance._loaded_status = instance.status
+
+
+@receiver(post_save, sender=OutboundExecution)
+def _execution_saved(sender, instance, created, **kwargs):
+    if created or instance._loaded_status != instance.status:
+        publish_executions([instance.pk], instance.status)
+    instance._loaded_status = instance.status
@@ -0,0 +1,164 @@
+# warehouse/exports.py
+"""
+流式导出
+对 values_list() 查询使用 iterator(chunk_size)，逐块编码为 CSV 或 NDJSON 并通过 StreamingHttpResponse 输出：
+不实例化模型、不经过 DRF 序列化，内存占用只与块大小有关，首个字节（表头）在查询开始前即可发出。
+可选 gzip 压缩，每块压缩后立即 flush 给客户端。
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .locations import location_filter, LocationFilterError
+
+CHUNK_SIZE = 2000
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# (列名, 查询字段)
+LEDGER_COLUMNS = [
+    ('id', 'id'),
+    ('timestamp', 'timestamp'),
+    ('transaction_type', 'transaction_type'),
+    ('sku_code', 'sku__sku_code'),
+    ('label_version', 'label_version_id'),
+    ('version_number', 'label_version__version_number'),
+    ('location', 'location__code'),
+    ('quantity_change', 'quantity_change'),
+    ('balance_after', 'balance_after'),
+    ('reference_document', 'reference_document'),
+    ('operator', 'operator__username'),
+]
+
+INVENTORY_COLUMNS = [
+    ('id', 'id'),
+    ('location', 'location__code'),
+    ('sku_code', 'label_version__sku__sku_code'),
+    ('label_version', 'label_version_id'),
+    ('version_number', 'label_version__version_number'),
+    ('quantity', 'quantity'),
+    ('quantity_allocated', 'quantity_allocated'),
+    ('updated_at', 'updated_at'),
+]
+
+
+class ExportError(ValueError):
+    """导出参数不合法"""
+
+
+def parse_bound(value, end=False):
+    """
+    解析日期范围边界：接受 ISO 日期时间或日期；只给日期时，结束边界取当天结束（次日零点之前）。
+    返回 (datetime, 是否为开区间上界)。
+    """
+    parsed = parse_datetime(value)
+    exclusive = False
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ExportError(f"Invalid date '{value}'.")
+        if end:
+            day = date.fromordinal(day.toordinal() + 1)
+            exclusive = True
+        parsed = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed, exclusive
+
+
+def filter_export(queryset, params, date_field, sku_field):
+    """
+    按查询参数过滤：date_from / date_to（ISO 日期或日期时间），sku、location（逗号分隔的 ID），
+    以及库位层级 zone、aisle/bay/level（见 locations.location_filter）。
+    """
+    if params.get('date_from'):
+        start, _ = parse_bound(params['date_from'])
+        queryset = queryset.filter(**{f'{date_field}__gte': start})
+    if params.get('date_to'):
+        end, exclusive = parse_bound(params['date_to'], end=True)
+        queryset = queryset.filter(**{f'{date_field}__{"lt" if exclusive else "lte"}': end})
+    for param, field in (('sku', sku_field), ('location', 'location_id')):
+        if params.get(param):
+            try:
+                ids = [int(v) for v in params[param].split(',') if v]
+            except ValueError:
+                raise ExportError(f"{param} must be comma-separated integer ids.")
+            queryset = queryset.filter(**{f'{field}__in': ids})
+    try:
+        queryset = queryset.filter(location_filter(params, prefix='location__'))
+    except LocationFilterError as exc:
+        raise ExportError(str(exc))
+    return queryset
+
+
+def _encode_chunks(rows, headers, file_format):
+    """把行迭代器编码为字节块，每 CHUNK_SIZE 行产出一块"""
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(headers)
+        # 表头先行输出，客户端在查询返回前即可收到响应
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        count = 0
+        for row in rows:
+            writer.writerow([v.isoformat() if isinstance(v, datetime) else v for v in row])
+            count += 1
+            if count % CHUNK_SIZE == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+        return
+
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder, ensure_ascii=False))
+        if len(lines) >= CHUNK_SIZE:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31：gzip 封装
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(queryset, columns, file_format, filename, compress=False):
+    """
+    返回流式导出响应。queryset 须已排序；columns 为 [(列名, 查询字段), ...]。
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown format '{file_format}'. Use one of {', '.join(EXPORT_FORMATS)}.")
+    headers = [name for name, _ in columns]
+    # 响应体在视图返回后才迭代，此时路由上下文已结束，先按当前请求固定数据库（读库或主库）
+    queryset = queryset.using(queryset.db)
+    rows = queryset.values_list(*[field for _, field in columns]).iterator(chunk_size=CHUNK_SIZE)
+    chunks = _encode_chunks(rows, headers, file_format)
+
+    filename = f"{filename}.{file_format}"
+    if compress:
+        response = StreamingHttpResponse(_gzip_chunks(chunks), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(chunks, content_type=EXPORT_FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    return response
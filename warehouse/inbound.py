@@ -0,0 +1,108 @@
+# warehouse/inbound.py
+"""
+入库作业服务
+- 扫描会话上传：手持终端一次性上传整个收货会话的原始扫描，服务端批量哈希并匹配入库明细。
+- 入库完成：整单一次集合式过账到目标库位，并写入 inbound 流水。
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Sum, Case, When, Value
+from django.utils import timezone
+
+from .models import LabelVersion, InboundReceipt, InboundLineItem
+from .posting import post_stock, StockLine
+
+
+class ReceiptClosed(Exception):
+    """入库单已完成，不再接受扫描或变更"""
+
+
+def ingest_scan_session(receipt_id, scans):
+    """
+    scans 为 (fnsku, upc) 序列，每个元素代表一次扫描（一件）。
+    相同的 FNSKU/UPC 组合先聚合计数，只计算一次哈希；与本单明细的 LabelVersion.checksum 匹配后，
+    用一条 bulk_update（quantity_received = quantity_received + n）累加到明细行。
+    同一标签版本有多条明细时，扫描计入 ID 最小的一行。
+    """
+    counts = Counter((fnsku or '', upc or '') for fnsku, upc in scans)
+    checksums = {pair: LabelVersion.compute_checksum(*pair) for pair in counts}
+
+    # 明细匹配在事务之外：SQLite DEFERRED 事务先读后写时读锁升级会立即失败（见 posting.post_stock）
+    lines_by_checksum = {}
+    for item_id, checksum in (
+        InboundLineItem.objects.filter(receipt_id=receipt_id)
+        .order_by('id').values_list('id', 'label_version__checksum')
+    ):
+        lines_by_checksum.setdefault(checksum, item_id)
+
+    received = Counter()
+    scanned_hash = {}
+    unmatched = []
+    for (fnsku, upc), n in counts.items():
+        checksum = checksums[(fnsku, upc)]
+        item_id = lines_by_checksum.get(checksum)
+        if item_id is None:
+            unmatched.append({"fnsku": fnsku, "upc": upc, "checksum": checksum, "count": n})
+            continue
+        received[item_id] += n
+        scanned_hash[item_id] = checksum
+
+    with transaction.atomic():
+        # 与 complete_receipt 相同，先用条件 UPDATE 抢占未完成的单据（取得写锁），草稿单有匹配时置为处理中
+        claimed = InboundReceipt.objects.filter(pk=receipt_id).exclude(status='completed').update(
+            status=Case(When(status='draft', then=Value('processing')), default=F('status')) if received else F('status')
+        )
+        if not claimed:
+            raise ReceiptClosed(InboundReceipt.objects.get(pk=receipt_id).receipt_no)
+
+        InboundLineItem.objects.bulk_update(
+            [
+                InboundLineItem(
+                    pk=item_id,
+                    quantity_received=F('quantity_received') + n,
+                    scanned_hash=scanned_hash[item_id],
+                )
+                for item_id, n in received.items()
+            ],
+            ['quantity_received', 'scanned_hash'],
+            batch_size=500,
+        )
+
+    return {
+        "receipt": receipt_id,
+        "scans": sum(counts.values()),
+        "matched": sum(received.values()),
+        "lines": [{"item": item_id, "scanned": n} for item_id, n in sorted(received.items())],
+        "unmatched": unmatched,
+    }
+
+
+def complete_receipt(receipt_id, operator=None):
+    """
+    完成入库单：用条件 UPDATE（status != 'completed'）抢占单据并锁定该行，
+    按 (标签版本, 目标库位) 聚合实收数量后交给过账引擎一次性入账。
+    已完成的单据直接返回，不会重复过账，因此失败重试是安全的。
+    返回 (receipt, 新建的流水列表)。
+    """
+    with transaction.atomic():
+        claimed = (
+            InboundReceipt.objects.filter(pk=receipt_id).exclude(status='completed')
+            .update(status='completed', completed_at=timezone.now())
+        )
+        receipt = InboundReceipt.objects.get(pk=receipt_id)
+        if not claimed:
+            return receipt, []
+
+        totals = (
+            InboundLineItem.objects.filter(receipt_id=receipt_id, quantity_received__gt=0)
+            .values('target_location_id', 'label_version_id')
+            .annotate(quantity=Sum('quantity_received'))
+            .order_by()
+        )
+        lines = [
+            StockLine(row['target_location_id'], row['label_version_id'], row['quantity'], receipt.receipt_no)
+            for row in totals
+        ]
+        transactions = post_stock(lines, 'inbound', operator=operator or receipt.operator_id)
+    return receipt, transactions
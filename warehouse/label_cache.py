@@ -0,0 +1,117 @@
+# warehouse/label_cache.py
+"""
+标签版本响应缓存
+LabelVersion 按设计不可变（变更即新版本），标签详情与 SKU 版本历史的序列化结果连同强 ETag
+一起放入 Django 缓存：重复读取（打印机、扫描枪）命中缓存后不访问数据库，
+If-None-Match 匹配时直接返回 304。
+ETag 由版本 checksum 与 sku_code 推导；版本保存/删除、批量建版本、SKU 保存后在提交时失效。
+
+提交时失效保证条目正确，因此所有后端都使用较长的 WAREHOUSE_LABEL_CACHE_TIMEOUT。
+失效通过 Django 缓存传播，多进程部署需设置 WAREHOUSE_REDIS_URL 使用共享缓存，
+否则其他进程的写入无法让本进程 LocMemCache 中的条目失效。
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .db_router import use_primary
+from .models import SKU, LabelVersion
+
+DETAIL_KEY = 'warehouse:label:{}'
+HISTORY_KEY = 'warehouse:sku-labels:{}'
+
+
+def _timeout():
+    return getattr(settings, 'WAREHOUSE_LABEL_CACHE_TIMEOUT', 86400)
+
+
+def _etag(*parts):
+    return '"{}"'.format(hashlib.sha256('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()[:32])
+
+
+def label_detail(label_id):
+    """返回 (etag, data)，标签不存在时返回 None"""
+    if not str(label_id).isdigit():
+        return None
+    key = DETAIL_KEY.format(label_id)
+    entry = cache.get(key)
+    if entry is None:
+        from .serializers import LabelVersionSerializer
+        # 回源走主库，避免把读库上的旧数据写进缓存
+        with use_primary():
+            label = LabelVersion.objects.select_related('sku').filter(pk=label_id).first()
+        if label is None:
+            return None
+        entry = (_etag(label.pk, label.checksum, label.sku.sku_code), dict(LabelVersionSerializer(label).data))
+        cache.set(key, entry, _timeout())
+    return entry
+
+
+def sku_history(sku_id):
+    """返回 SKU 全部标签版本（按版本号升序）的 (etag, data)，SKU 不存在时返回 None"""
+    if not str(sku_id).isdigit():
+        return None
+    key = HISTORY_KEY.format(sku_id)
+    entry = cache.get(key)
+    if entry is None:
+        from .serializers import LabelVersionSerializer
+        with use_primary():
+            sku = SKU.objects.filter(pk=sku_id).first()
+            if sku is None:
+                return None
+            versions = list(LabelVersion.objects.filter(sku=sku).select_related('sku').order_by('version_number'))
+        data = {
+            "sku": sku.pk,
+            "sku_code": sku.sku_code,
+            "current_label": sku.current_label_id,
+            "versions": [dict(row) for row in LabelVersionSerializer(versions, many=True).data],
+        }
+        entry = (_etag(sku.pk, sku.sku_code, sku.current_label_id, *[v.checksum for v in versions]), data)
+        cache.set(key, entry, _timeout())
+    return entry
+
+
+def conditional_response(request, entry, cache_control):
+    """entry 为 (etag, data)；If-None-Match 命中返回 304，否则返回带 ETag 的 200"""
+    etag, data = entry
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        candidates = parse_etags(if_none_match)
+        if '*' in candidates or etag in candidates:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, headers=headers)
+
+
+def invalidate(label_ids=(), sku_ids=()):
+    keys = [DETAIL_KEY.format(pk) for pk in label_ids] + [HISTORY_KEY.format(pk) for pk in sku_ids]
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_on_commit(label_ids=(), sku_ids=()):
+    label_ids, sku_ids = list(label_ids), list(sku_ids)
+    transaction.on_commit(lambda: invalidate(label_ids, sku_ids))
+
+
+@receiver(post_save, sender=LabelVersion)
+@receiver(post_delete, sender=LabelVersion)
+def _label_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.pk], [instance.sku_id])
+
+
+@receiver(post_save, sender=SKU)
+@receiver(post_delete, sender=SKU)
+def _sku_changed(sender, instance, **kwargs):
+    # sku_code 出现在每个版本的响应里，SKU 变更时连同其全部版本详情一起失效
+    label_ids = [] if kwargs.get('created') else list(
+        LabelVersion.objects.filter(sku_id=instance.pk).values_list('id', flat=True)
+    )
+    invalidate_on_commit(label_ids, [instance.pk])
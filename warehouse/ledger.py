@@ -0,0 +1,176 @@
+# warehouse/ledger.py
+"""
+流水账查询服务
+- 结余快照：以上一份快照为基础，只回放其后的流水（取每个组合最新一条流水的 balance_after），
+  快照完全由流水推导，不依赖读取 InventoryStock 时的事务隔离级别。
+  流水 ID 的分配顺序不等于提交顺序：仍在进行中的事务可能持有比已提交流水更小的 ID，
+  若快照取当前 Max(id)，这类流水提交后会永久落在快照链之外。因此快照只覆盖
+  WAREHOUSE_SNAPSHOT_SETTLE_SECONDS 之前的流水（过账事务远短于该时长），snapshot_at 即该截止时点。
+- 时点库存：从不晚于查询时点的最近快照出发，只汇总快照之后、查询时点之前的流水尾部。
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import StockBalanceSnapshot, StockTransaction
+
+CHUNK_SIZE = 5000
+_snapshot_running = threading.Lock()
+logger = logging.getLogger(__name__)
+
+
+class _SnapshotSuperseded(Exception):
+    """其他进程已写入覆盖同一区间的快照，回滚本份"""
+
+
+def _latest_snapshot(before=None):
+    """返回 (snapshot_at, last_transaction_id)，没有快照时为 (None, 0)"""
+    snapshots = StockBalanceSnapshot.objects.all()
+    if before is not None:
+        snapshots = snapshots.filter(snapshot_at__lte=before)
+    row = snapshots.order_by('-snapshot_at').values_list('snapshot_at', 'last_transaction_id').first()
+    return row if row else (None, 0)
+
+
+def settle_seconds():
+    return getattr(settings, 'WAREHOUSE_SNAPSHOT_SETTLE_SECONDS', 60)
+
+
+def take_snapshot(settle=None):
+    """
+    写入一份全量结余快照，返回 (snapshot_at, 写入行数)；截止时点之前没有新流水时返回 (None, 0)。
+    settle 为截止时点距现在的秒数（默认 WAREHOUSE_SNAPSHOT_SETTLE_SECONDS），只有早于截止时点的流水进入快照。
+    """
+    snapshot_at = timezone.now() - timedelta(seconds=settle_seconds() if settle is None else settle)
+    # 结余在事务之外计算：只读已提交、早于截止时点的流水与上一份快照，结果不随之后的过账变化；
+    # 写入放在单独的短事务里，第一条语句即为插入（SQLite DEFERRED 事务先读后写会在锁升级时立即失败）
+    previous_at, previous_last_id = _latest_snapshot()
+    last_id = (
+        StockTransaction.objects.filter(timestamp__lte=snapshot_at).aggregate(last=Max('id'))['last'] or 0
+    )
+    if last_id <= previous_last_id:
+        return None, 0
+
+    balances = {}
+    if previous_at is not None:
+        for loc, lv, qty in (
+            StockBalanceSnapshot.objects.filter(snapshot_at=previous_at)
+            .values_list('location_id', 'label_version_id', 'quantity').iterator(chunk_size=CHUNK_SIZE)
+        ):
+            balances[(loc, lv)] = qty
+
+    # 每个组合在 (上次快照, last_id] 区间内最新一条流水的 balance_after 即为当前结余
+    latest_ids = (
+        StockTransaction.objects.filter(id__gt=previous_last_id, id__lte=last_id)
+        .values('location_id', 'label_version_id').annotate(last=Max('id')).order_by()
+        .values_list('last', flat=True)
+    )
+    for loc, lv, balance in (
+        StockTransaction.objects.filter(id__in=latest_ids)
+        .values_list('location_id', 'label_version_id', 'balance_after').iterator(chunk_size=CHUNK_SIZE)
+    ):
+        balances[(loc, lv)] = balance
+
+    rows = [
+        StockBalanceSnapshot(
+            location_id=loc, label_version_id=lv, snapshot_at=snapshot_at,
+            quantity=qty, last_transaction_id=last_id,
+        )
+        for (loc, lv), qty in balances.items() if qty
+    ]
+    if not rows:
+        return None, 0
+    try:
+        with transaction.atomic():
+            StockBalanceSnapshot.objects.bulk_create(rows, batch_size=CHUNK_SIZE)
+            # 写锁下复查：计算期间其他进程已写入覆盖同一区间的快照时放弃本份
+            if StockBalanceSnapshot.objects.filter(last_transaction_id__gte=last_id).exclude(snapshot_at=snapshot_at).exists():
+                raise _SnapshotSuperseded
+    except _SnapshotSuperseded:
+        return None, 0
+    return snapshot_at, len(rows)
+
+
+def start_snapshot(background=None):
+    """
+    写一份快照；background 为 True（默认取 WAREHOUSE_SNAPSHOT_IN_BACKGROUND）时在后台线程执行，
+    不占用触发它的请求。已有快照在执行时直接跳过。
+    """
+    if background is None:
+        background = getattr(settings, 'WAREHOUSE_SNAPSHOT_IN_BACKGROUND', True)
+    if not _snapshot_running.acquire(blocking=False):
+        return
+
+    def target():
+        try:
+            take_snapshot()
+        except Exception:
+            if not background:
+                raise
+            # 后台线程没有调用方可以接收异常，记录日志；下一次触发时重试
+            logger.exception("Balance snapshot failed")
+        finally:
+            _snapshot_running.release()
+            if background:
+                connection.close()
+
+    if not background:
+        target()
+        return
+    threading.Thread(target=target, name='balance-snapshot', daemon=True).start()
+
+
+def maybe_snapshot_after(transactions):
+    """
+    过账后调用：流水 ID 跨过 WAREHOUSE_SNAPSHOT_EVERY 的整数倍时，在提交后触发一份快照（默认后台线程执行）。
+    """
+    every = getattr(settings, 'WAREHOUSE_SNAPSHOT_EVERY', None)
+    if not every or not transactions:
+        return
+    first_id, last_id = transactions[0].id, transactions[-1].id
+    if first_id is None or last_id is None:
+        return
+    if last_id // every > (first_id - 1) // every:
+        transaction.on_commit(start_snapshot)
+
+
+def balances_as_of(at, location_ids=None, label_version_ids=None, sku_ids=None):
+    """
+    查询时点 at 的库存结余：返回 (snapshot_at, 回放流水条数, {(location_id, label_version_id): quantity})。
+    结果只包含数量不为 0 的组合。
+    """
+    snapshot_at, last_id = _latest_snapshot(before=at)
+
+    balances = {}
+    if snapshot_at is not None:
+        rows = StockBalanceSnapshot.objects.filter(snapshot_at=snapshot_at)
+        if location_ids:
+            rows = rows.filter(location_id__in=location_ids)
+        if label_version_ids:
+            rows = rows.filter(label_version_id__in=label_version_ids)
+        if sku_ids:
+            rows = rows.filter(label_version__sku_id__in=sku_ids)
+        for loc, lv, qty in rows.values_list('location_id', 'label_version_id', 'quantity').iterator(chunk_size=CHUNK_SIZE):
+            balances[(loc, lv)] = qty
+
+    tail = StockTransaction.objects.filter(id__gt=last_id, timestamp__lte=at)
+    if location_ids:
+        tail = tail.filter(location_id__in=location_ids)
+    if label_version_ids:
+        tail = tail.filter(label_version_id__in=label_version_ids)
+    if sku_ids:
+        tail = tail.filter(sku_id__in=sku_ids)
+    replayed = 0
+    for row in (
+        tail.values('location_id', 'label_version_id')
+        .annotate(change=Sum('quantity_change'), rows=Count('id')).order_by()
+    ):
+        key = (row['location_id'], row['label_version_id'])
+        balances[key] = balances.get(key, 0) + row['change']
+        replayed += row['rows']
+    return snapshot_at, replayed, {key: qty for key, qty in balances.items() if qty}
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from warehouse.locations import backfill_hierarchy, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Re-parse zone/aisle/bay/level from every location code (after bulk imports that bypass save())."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        result = backfill_hierarchy(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Checked {result['checked']} locations, updated {result['updated']}."))
@@ -0,0 +1,132 @@
+import asyncio
+import io
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.models import InventoryStock, LabelVersion, ShipmentBatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync DRF read path under WSGI (fixed thread pool) with the async read API under ASGI "
+        "(one event loop) at N concurrent slow clients. Reads existing rows; run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000, help="Concurrent client connections.")
+        parser.add_argument('--requests', type=int, default=5000, help="Total requests per mode.")
+        parser.add_argument('--threads', type=int, default=32, help="WSGI worker threads (e.g. gunicorn --threads).")
+        parser.add_argument('--client-latency-ms', type=float, default=50.0,
+                            help="Time a slow client takes to drain each response.")
+        parser.add_argument('--mode', choices=['sync', 'async'], help="Run a single mode (default: both).")
+
+    def handle(self, *args, **options):
+        targets = self.targets()
+        if not targets:
+            raise CommandError("No labels, stock rows or batches to query. Load data first.")
+        for mode in ([options['mode']] if options['mode'] else ['sync', 'async']):
+            result = asyncio.run(self.run(mode, targets, options))
+            latencies = sorted(result['latencies'])
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000
+            self.stdout.write(
+                f"{mode:<6} connections={options['connections']} requests={len(latencies)} "
+                f"req/s={len(latencies) / result['elapsed']:,.0f} p50_ms={p50:.0f} p99_ms={p99:.0f} "
+                f"errors={result['errors']}"
+            )
+
+    def targets(self, sample=200):
+        """(同步路径, 异步路径) 对：标签、库存、批次三类查询各取一部分"""
+        pairs = []
+        for pk, checksum in LabelVersion.objects.order_by('?').values_list('id', 'checksum')[:sample]:
+            pairs.append((f'/api/labels/{pk}/', f'/api/async/labels/checksum/{checksum}/'))
+        for pk, code in InventoryStock.objects.order_by('?').values_list('id', 'location__code')[:sample]:
+            pairs.append((f'/api/inventory/{pk}/', f'/api/async/locations/{code}/stock/'))
+        for pk in ShipmentBatch.objects.order_by('?').values_list('id', flat=True)[:sample]:
+            pairs.append((f'/api/batches/{pk}/', f'/api/async/batches/{pk}/status/'))
+        return pairs
+
+    async def run(self, mode, targets, options):
+        latency = options['client_latency_ms'] / 1000
+        per_client = max(1, options['requests'] // options['connections'])
+        results = {'latencies': [], 'errors': 0}
+
+        if mode == 'sync':
+            wsgi = WSGIHandler()
+            pool = ThreadPoolExecutor(options['threads'])
+            loop = asyncio.get_running_loop()
+
+            async def request(path):
+                return await loop.run_in_executor(pool, self.wsgi_get, wsgi, path, latency)
+        else:
+            asgi = ASGIHandler()
+
+            async def request(path):
+                return await self.asgi_get(asgi, path, latency)
+
+        async def client(seed):
+            rng = random.Random(seed)
+            for _ in range(per_client):
+                path = rng.choice(targets)[0 if mode == 'sync' else 1]
+                started = time.monotonic()
+                status = await request(path)
+                results['latencies'].append(time.monotonic() - started)
+                if status != 200:
+                    results['errors'] += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(client(i) for i in range(options['connections'])))
+        results['elapsed'] = time.monotonic() - started
+        if mode == 'sync':
+            pool.shutdown()
+        return results
+
+    @staticmethod
+    def wsgi_get(handler, path, latency):
+        statuses = []
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+            'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http',
+            'wsgi.errors': io.StringIO(),
+        }
+        body = handler(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        try:
+            b''.join(body)
+            # 同步服务器把响应写给慢客户端时，工作线程一直被占用
+            time.sleep(latency)
+        finally:
+            body.close()
+        return int(statuses[0].split()[0])
+
+    @staticmethod
+    async def asgi_get(handler, path, latency):
+        statuses = []
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+        received = asyncio.Event()
+
+        async def receive():
+            if not received.is_set():
+                received.set()
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # 客户端不主动断开；响应完成后 Django 取消这个等待
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+            elif not message.get('more_body'):
+                # 慢客户端：只挂起当前协程，事件循环继续服务其他连接
+                await asyncio.sleep(latency)
+
+        await handler(scope, receive, send)
+        return statuses[0]
@@ -0,0 +1,120 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# 与 Django sqlite3 后端默认行为一致：自动提交，事务用 BEGIN（DEFERRED），5 秒超时，回滚日志
+PROFILES = {
+    'default': {'pragmas': '', 'begin': 'BEGIN', 'timeout': 5},
+    'production': {'pragmas': settings.SQLITE_PRODUCTION_PRAGMAS, 'begin': 'BEGIN IMMEDIATE', 'timeout': settings.SQLITE_BUSY_TIMEOUT},
+}
+
+SCHEMA = """
+CREATE TABLE stock (id INTEGER PRIMARY KEY, location_id INTEGER, label_version_id INTEGER, quantity INTEGER);
+CREATE INDEX stock_location ON stock (location_id);
+CREATE TABLE ledger (id INTEGER PRIMARY KEY, stock_id INTEGER, quantity_change INTEGER, balance_after INTEGER, ts REAL);
+"""
+
+
+class Command(BaseCommand):
+    help = "Benchmark mixed read/write throughput of the default vs production SQLite profile with concurrent workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--write-ratio', type=float, default=0.2, help="Share of operations that are postings.")
+        parser.add_argument('--rows', type=int, default=20000)
+        parser.add_argument('--profile', choices=sorted(PROFILES), help="Run a single profile (default: both).")
+
+    def handle(self, *args, **options):
+        for name in ([options['profile']] if options['profile'] else ['default', 'production']):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.sqlite3')
+                self.seed(path, PROFILES[name], options['rows'])
+                result = self.run(path, PROFILES[name], options)
+            self.stdout.write(
+                f"{name:<10} workers={options['workers']} "
+                f"reads/s={result['reads'] / result['elapsed']:,.0f} "
+                f"writes/s={result['writes'] / result['elapsed']:,.0f} "
+                f"locked_errors={result['errors']} p99_write_ms={result['p99']:.1f}"
+            )
+
+    def connect(self, path, profile):
+        conn = sqlite3.connect(path, timeout=profile['timeout'], isolation_level=None, check_same_thread=False)
+        for pragma in profile['pragmas'].split(';'):
+            if pragma.strip():
+                conn.execute(pragma)
+        return conn
+
+    def seed(self, path, profile, rows):
+        conn = self.connect(path, profile)
+        conn.executescript(SCHEMA)
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO stock (location_id, label_version_id, quantity) VALUES (?, ?, ?)',
+            ((i // 10, i % 10, 100) for i in range(rows)),
+        )
+        conn.execute('COMMIT')
+        conn.close()
+
+    def run(self, path, profile, options):
+        rows = options['rows']
+        deadline = time.monotonic() + options['seconds']
+        lock = threading.Lock()
+        totals = {'reads': 0, 'writes': 0, 'errors': 0, 'latencies': []}
+
+        def worker():
+            conn = self.connect(path, profile)
+            rng = random.Random()
+            reads = writes = errors = 0
+            latencies = []
+            while time.monotonic() < deadline:
+                try:
+                    if rng.random() < options['write_ratio']:
+                        started = time.monotonic()
+                        stock_id = rng.randint(1, rows)
+                        conn.execute(profile['begin'])
+                        try:
+                            # 与过账引擎相同的模式：先读后写再记流水
+                            (quantity,) = conn.execute('SELECT quantity FROM stock WHERE id = ?', (stock_id,)).fetchone()
+                            conn.execute('UPDATE stock SET quantity = ? WHERE id = ?', (quantity + 1, stock_id))
+                            conn.execute(
+                                'INSERT INTO ledger (stock_id, quantity_change, balance_after, ts) VALUES (?, 1, ?, ?)',
+                                (stock_id, quantity + 1, time.time()),
+                            )
+                            conn.execute('COMMIT')
+                        except Exception:
+                            conn.execute('ROLLBACK')
+                            raise
+                        latencies.append(time.monotonic() - started)
+                        writes += 1
+                    else:
+                        location = rng.randint(0, rows // 10)
+                        conn.execute('SELECT SUM(quantity) FROM stock WHERE location_id = ?', (location,)).fetchone()
+                        reads += 1
+                except sqlite3.OperationalError as exc:
+                    if 'locked' not in str(exc) and 'busy' not in str(exc):
+                        raise
+                    errors += 1
+            conn.close()
+            with lock:
+                totals['reads'] += reads
+                totals['writes'] += writes
+                totals['errors'] += errors
+                totals['latencies'].extend(latencies)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker) for _ in range(options['workers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        totals['elapsed'] = time.monotonic() - started
+        latencies = sorted(totals.pop('latencies'))
+        totals['p99'] = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0
+        return totals
@@ -0,0 +1,38 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.catalog import read_catalog, import_catalog, write_error_file, CatalogError, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Import SKUs and their initial label versions from a CSV/XLSX file (sku_code, product_name, fnsku, upc)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or XLSX catalog file.")
+        parser.add_argument('--created-by', default='import', help="Recorded as LabelVersion.created_by.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows per transaction.")
+        parser.add_argument('--errors', help="Per-row error report (CSV). Defaults to <path>.errors.csv.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        started = time.monotonic()
+        try:
+            with open(path, 'rb') as fh:
+                summary = import_catalog(
+                    read_catalog(fh, path), created_by=options['created_by'], chunk_size=options['chunk_size'],
+                )
+        except (OSError, CatalogError) as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['rows']} rows in {time.monotonic() - started:.1f}s: "
+            f"{summary['created_skus']} SKUs created, {summary['new_versions']} new label versions, "
+            f"{summary['unchanged']} unchanged, {len(summary['errors'])} errors."
+        ))
+        if summary['errors']:
+            error_path = options['errors'] or f"{os.path.splitext(path)[0]}.errors.csv"
+            with open(error_path, 'w', newline='') as fh:
+                write_error_file(summary['errors'], fh)
+            self.stdout.write(self.style.WARNING(f"Row errors written to {error_path}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from warehouse.availability import rebuild_availability
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-SKU and per-LabelVersion availability summaries from stock and approved, unshipped batches."
+
+    def handle(self, *args, **options):
+        result = rebuild_availability()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {result['labels']} label and {result['skus']} SKU summaries "
+            f"({result['corrected']} label rows differed)."
+        ))
@@ -0,0 +1,50 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand
+
+from warehouse.models import ReconciliationRun
+from warehouse.reconciliation import run_reconciliation, run_queued, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Reconcile InventoryStock against the StockTransaction ledger and record discrepancies."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help="Only check locations touched since the last completed run.")
+        parser.add_argument('--workers', type=int, default=1, help="Number of worker processes.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Locations per chunk.")
+        parser.add_argument('--output', help="Write the discrepancy report to this CSV file.")
+        parser.add_argument('--queued', action='store_true',
+                            help="Run the reconciliations queued through the API instead of starting a new one.")
+        parser.add_argument('--poll', type=float, default=0,
+                            help="With --queued, keep running and check the queue every N seconds.")
+
+    def handle(self, *args, **options):
+        if options['queued']:
+            while True:
+                for run in run_queued(chunk_size=options['chunk_size']):
+                    self.stdout.write(
+                        f"Run {run.pk}: {run.status}, checked {run.checked_keys} keys, "
+                        f"{run.discrepancy_count} discrepancies."
+                    )
+                if not options['poll']:
+                    return
+                time.sleep(options['poll'])
+
+        run = ReconciliationRun.objects.create(incremental=options['incremental'])
+        run_reconciliation(run, workers=options['workers'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Run {run.pk}: checked {run.checked_keys} keys, {run.discrepancy_count} discrepancies."
+        ))
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as fh:
+                writer = csv.writer(fh)
+                writer.writerow(['location', 'label_version', 'stock_quantity', 'ledger_sum', 'ledger_balance'])
+                for row in run.discrepancies.values_list(
+                    'location__code', 'label_version_id', 'stock_quantity', 'ledger_sum', 'ledger_balance'
+                ).iterator():
+                    writer.writerow(row)
+            self.stdout.write(f"Report written to {options['output']}")
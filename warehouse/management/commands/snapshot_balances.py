@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from warehouse.ledger import take_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write a stock balance snapshot (schedule via cron, e.g. nightly and at month end)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settle-seconds', type=int, default=None,
+            help="Only include transactions older than this (default: WAREHOUSE_SNAPSHOT_SETTLE_SECONDS).",
+        )
+
+    def handle(self, *args, **options):
+        snapshot_at, rows = take_snapshot(settle=options['settle_seconds'])
+        if snapshot_at is None:
+            self.stdout.write("No settled transactions since the last snapshot.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Snapshot {snapshot_at.isoformat()} written: {rows} balances."))
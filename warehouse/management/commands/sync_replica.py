@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database onto the configured read replicas (local two-database setup)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help="Replica aliases to refresh (default: all).")
+
+    def handle(self, *args, **options):
+        replicas = options['aliases'] or settings.DATABASE_READ_REPLICAS
+        if not replicas:
+            raise CommandError("No read replicas configured. Set WAREHOUSE_READ_REPLICAS.")
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError("sync_replica only supports SQLite; use the database's own replication instead.")
+
+        primary.ensure_connection()
+        for alias in replicas:
+            if alias not in settings.DATABASES or alias == 'default':
+                raise CommandError(f"Unknown replica '{alias}'.")
+            target = sqlite3.connect(str(settings.DATABASES[alias]['NAME']))
+            try:
+                # 在线备份 API：复制过程中主库仍可读写
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f"{alias} refreshed from default."))
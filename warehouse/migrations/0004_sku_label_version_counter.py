@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_label_counters(apps, schema_editor):
+    # 用已有的最大版本号回填计数器与最新版本指针
+    SKU = apps.get_model('warehouse', 'SKU')
+    LabelVersion = apps.get_model('warehouse', 'LabelVersion')
+    latest = {}
+    for label_id, sku_id, version_number in (
+        LabelVersion.objects.order_by('sku_id', 'version_number')
+        .values_list('id', 'sku_id', 'version_number').iterator()
+    ):
+        latest[sku_id] = (label_id, version_number)
+    skus = []
+    for sku in SKU.objects.filter(pk__in=latest.keys()).iterator():
+        label_id, version_number = latest[sku.pk]
+        sku.current_label_id = label_id
+        sku.label_version_counter = version_number + 1
+        skus.append(sku)
+    SKU.objects.bulk_update(skus, ['current_label', 'label_version_counter'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0003_warehouselocation_inboundreceipt_outboundexecution_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sku',
+            name='current_label',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='warehouse.labelversion'),
+        ),
+        migrations.AddField(
+            model_name='sku',
+            name='label_version_counter',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_label_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0004_sku_label_version_counter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='labelversion',
+            index=models.Index(fields=['created_at', 'id'], name='label_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentbatch',
+            index=models.Index(fields=['created_at', 'id'], name='batch_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sku',
+            index=models.Index(fields=['created_at', 'id'], name='sku_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocktransaction',
+            index=models.Index(fields=['timestamp', 'id'], name='txn_timestamp_id_idx'),
+        ),
+    ]
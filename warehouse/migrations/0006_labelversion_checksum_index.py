@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='labelversion',
+            name='checksum',
+            field=models.CharField(db_index=True, editable=False, max_length=64),
+        ),
+    ]
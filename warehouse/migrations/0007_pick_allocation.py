@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0006_labelversion_checksum_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PickAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='inventorystock',
+            name='quantity_allocated',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='inventorystock',
+            index=models.Index(condition=models.Q(('quantity__gt', models.F('quantity_allocated'))), fields=['label_version', 'updated_at'], name='stock_available_idx'),
+        ),
+        migrations.AddField(
+            model_name='pickallocation',
+            name='execution',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='warehouse.outboundexecution'),
+        ),
+        migrations.AddField(
+            model_name='pickallocation',
+            name='label_version',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='warehouse.labelversion'),
+        ),
+        migrations.AddField(
+            model_name='pickallocation',
+            name='location',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='warehouse.warehouselocation'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0007_pick_allocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PickWave',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=50, unique=True)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('picking', 'Picking'), ('completed', 'Completed')], default='open', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='warehouse.operator')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='outboundexecution',
+            name='wave',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='executions', to='warehouse.pickwave'),
+        ),
+        migrations.CreateModel(
+            name='PickWaveLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('sequence', models.PositiveIntegerField()),
+                ('execution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='warehouse.outboundexecution')),
+                ('label_version', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='warehouse.labelversion')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='warehouse.warehouselocation')),
+                ('wave', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='warehouse.pickwave')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pickwave',
+            index=models.Index(fields=['created_at', 'id'], name='wave_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pickwaveline',
+            index=models.Index(fields=['wave', 'sequence'], name='waveline_sequence_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0008_pick_waves'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_at', models.DateTimeField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('last_transaction_id', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stocktransaction',
+            index=models.Index(fields=['location', 'id'], name='txn_location_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockbalancesnapshot',
+            name='label_version',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='warehouse.labelversion'),
+        ),
+        migrations.AddField(
+            model_name='stockbalancesnapshot',
+            name='location',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='warehouse.warehouselocation'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stockbalancesnapshot',
+            unique_together={('snapshot_at', 'location', 'label_version')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0010_reconciliation_runs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipmentbatch',
+            name='row_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_availability(apps, schema_editor):
+    # 与 availability.rebuild_availability 相同的口径：库存合计、分配合计、未发货的已审核批次数量
+    InventoryStock = apps.get_model('warehouse', 'InventoryStock')
+    ShipmentBatch = apps.get_model('warehouse', 'ShipmentBatch')
+    LabelVersion = apps.get_model('warehouse', 'LabelVersion')
+    LabelAvailability = apps.get_model('warehouse', 'LabelAvailability')
+    SKUAvailability = apps.get_model('warehouse', 'SKUAvailability')
+    totals = {}
+    for label_id, on_hand, allocated in (
+        InventoryStock.objects.values('label_version_id')
+        .annotate(on_hand=Sum('quantity'), allocated=Sum('quantity_allocated'))
+        .values_list('label_version_id', 'on_hand', 'allocated')
+    ):
+        totals[label_id] = [on_hand or 0, allocated or 0, 0]
+    for label_id, committed in (
+        ShipmentBatch.objects.filter(status='approved').exclude(execution__status='shipped')
+        .values('label_id').annotate(committed=Sum('quantity')).values_list('label_id', 'committed')
+    ):
+        totals.setdefault(label_id, [0, 0, 0])[2] = committed or 0
+    sku_by_label = dict(LabelVersion.objects.filter(pk__in=list(totals)).values_list('id', 'sku_id'))
+    sku_totals = {}
+    for label_id, values in totals.items():
+        total = sku_totals.setdefault(sku_by_label[label_id], [0, 0, 0])
+        for i, value in enumerate(values):
+            total[i] += value
+    LabelAvailability.objects.bulk_create([
+        LabelAvailability(label_version_id=label_id, sku_id=sku_by_label[label_id],
+                          on_hand=on_hand, allocated=allocated, committed=committed)
+        for label_id, (on_hand, allocated, committed) in totals.items()
+    ], batch_size=1000)
+    SKUAvailability.objects.bulk_create([
+        SKUAvailability(sku_id=sku_id, on_hand=on_hand, allocated=allocated, committed=committed)
+        for sku_id, (on_hand, allocated, committed) in sku_totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0011_shipmentbatch_row_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SKUAvailability',
+            fields=[
+                ('sku', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='availability', serialize=False, to='warehouse.sku')),
+                ('on_hand', models.IntegerField(default=0)),
+                ('allocated', models.IntegerField(default=0)),
+                ('committed', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['updated_at', 'sku'], name='sku_avail_updated_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LabelAvailability',
+            fields=[
+                ('label_version', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='availability', serialize=False, to='warehouse.labelversion')),
+                ('on_hand', models.IntegerField(default=0)),
+                ('allocated', models.IntegerField(default=0)),
+                ('committed', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sku', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='label_availability', to='warehouse.sku')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['updated_at', 'label_version'], name='label_avail_updated_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_availability, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:28
+
+from django.db import migrations, models
+
+
+def parse_code(code):
+    # 与 WarehouseLocation.parse_code 相同的规则（迁移中不能引用模型方法）
+    parts = [p for p in code.strip().upper().replace('_', '-').split('-') if p]
+    zone = parts[0] if parts else ''
+    numbers = [int(p) if p.isdigit() else None for p in parts[1:4]]
+    numbers += [None] * (3 - len(numbers))
+    return (zone, *numbers)
+
+
+def backfill_hierarchy(apps, schema_editor):
+    # 按 (字段, 值) 分组写回，各字段取值种类很少
+    WarehouseLocation = apps.get_model('warehouse', 'WarehouseLocation')
+    groups = {}
+    for pk, code in WarehouseLocation.objects.values_list('id', 'code').iterator(chunk_size=2000):
+        for field, value in zip(('zone', 'aisle', 'bay', 'level'), parse_code(code)):
+            groups.setdefault((field, value), []).append(pk)
+    for (field, value), ids in groups.items():
+        for start in range(0, len(ids), 2000):
+            WarehouseLocation.objects.filter(pk__in=ids[start:start + 2000]).update(**{field: value})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0012_availability_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='warehouselocation',
+            name='aisle',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='warehouselocation',
+            name='bay',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='warehouselocation',
+            name='level',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='warehouselocation',
+            name='zone',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='warehouselocation',
+            index=models.Index(fields=['zone', 'aisle', 'bay', 'level'], name='location_path_idx'),
+        ),
+        migrations.RunPython(backfill_hierarchy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0013_location_hierarchy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CycleCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('counting', 'Counting'), ('posted', 'Posted'), ('cancelled', 'Cancelled')], default='counting', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('posted_at', models.DateTimeField(blank=True, null=True)),
+                ('last_transaction_id', models.BigIntegerField(default=0)),
+                ('location_count', models.PositiveIntegerField(default=0)),
+                ('line_count', models.PositiveIntegerField(default=0)),
+                ('adjusted_count', models.PositiveIntegerField(default=0)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('locations', models.ManyToManyField(related_name='cycle_counts', to='warehouse.warehouselocation')),
+                ('operator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='warehouse.operator')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CycleCountLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expected_quantity', models.PositiveIntegerField(default=0)),
+                ('counted_quantity', models.PositiveIntegerField(blank=True, null=True)),
+                ('counted_at', models.DateTimeField(blank=True, null=True)),
+                ('movement', models.IntegerField(default=0)),
+                ('variance', models.IntegerField(blank=True, null=True)),
+                ('count', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='warehouse.cyclecount')),
+                ('label_version', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='warehouse.labelversion')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='warehouse.warehouselocation')),
+            ],
+            options={
+                'unique_together': {('count', 'location', 'label_version')},
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:48
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def clamp_allocated(apps, schema_editor):
+    """
+    约束之前的调整可能已扣走分配量：占用最多保留到现有库存。未发货任务在该库存行上的分配记录按 ID 从旧到新保留，
+    超出部分从最新的记录起缩减或删除，使分配记录合计与占用一致（否则之后释放时会扣过头）。
+    被缩减的任务只剩部分分配，需要重新分配；之后执行 rebuild_availability 重建汇总。
+    """
+    InventoryStock = apps.get_model('warehouse', 'InventoryStock')
+    PickAllocation = apps.get_model('warehouse', 'PickAllocation')
+    over = list(
+        InventoryStock.objects.filter(quantity__lt=F('quantity_allocated'))
+        .values_list('id', 'location_id', 'label_version_id', 'quantity')
+    )
+    for stock_id, location_id, label_version_id, quantity in over:
+        keep = quantity
+        for pick in (
+            PickAllocation.objects.filter(location_id=location_id, label_version_id=label_version_id)
+            .exclude(execution__status='shipped').order_by('id')
+        ):
+            if pick.quantity <= keep:
+                keep -= pick.quantity
+            elif keep:
+                pick.quantity, keep = keep, 0
+                pick.save(update_fields=['quantity'])
+            else:
+                pick.delete()
+        # 分配记录原本就少于库存时，以记录合计为准
+        InventoryStock.objects.filter(pk=stock_id).update(quantity_allocated=quantity - keep)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0014_cycle_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_allocated, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='inventorystock',
+            constraint=models.CheckConstraint(condition=models.Q(('quantity__gte', models.F('quantity_allocated'))), name='stock_covers_allocated'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:53
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0015_stock_covers_allocated'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='labelavailability',
+            name='label_avail_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='skuavailability',
+            name='sku_avail_updated_idx',
+        ),
+    ]
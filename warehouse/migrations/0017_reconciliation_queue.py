@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0016_drop_availability_updated_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reconciliationrun',
+            name='workers',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='reconciliationrun',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20),
+        ),
+    ]
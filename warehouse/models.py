@@ -1,5 +1,6 @@
 # warehouse/models.py
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Case, When, Value, OuterRef, Subquery
 import hashlib
 
 
@@ -18,6 +19,20 @@ class SKU(models.Model):
     product_name = models.CharField(max_length=200, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # 标签版本计数器：下一个待分配的版本号，与新版本的 INSERT 在同一事务中原子递增
+    label_version_counter = models.PositiveIntegerField(default=0, editable=False)
+    # 最新标签版本指针，避免每次都 order_by('-version_number') 查找当前版本
+    current_label = models.ForeignKey(
+        'LabelVersion', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+', editable=False
+    )
+
+    class Meta:
+        indexes = [
+            # 游标分页 (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='sku_created_id_idx'),
+        ]
+
     def __str__(self):
         return self.sku_code
 
@@ -33,27 +48,112 @@ class LabelVersion(models.Model):
     upc = models.CharField(max_length=100, blank=True)
     created_by = models.CharField(max_length=50)  # 可改为 ForeignKey(Operator)，但为简化先保留
     created_at = models.DateTimeField(auto_now_add=True)
-    checksum = models.CharField(max_length=64, editable=False)
+    checksum = models.CharField(max_length=64, editable=False, db_index=True)
 
     class Meta:
         unique_together = ('sku', 'version_number')
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='label_created_id_idx'),
+        ]
+
+    @staticmethod
+    def compute_checksum(fnsku, upc):
+        raw = f"{fnsku}|{upc}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
 
     def save(self, *args, **kwargs):
-        raw = f"{self.fnsku}|{self.upc}"
-        self.checksum = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+        self.checksum = self.compute_checksum(self.fnsku, self.upc)
         super().save(*args, **kwargs)
 
     @classmethod
     def create_version(cls, sku, fnsku, upc, created_by):
-        last = cls.objects.filter(sku=sku).order_by('-version_number').first()
-        next_ver = (last.version_number + 1) if last else 0
-        return cls.objects.create(
-            sku=sku,
-            version_number=next_ver,
-            fnsku=fnsku,
-            upc=upc,
-            created_by=created_by
-        )
+        """
+        在一个写事务内分配版本号并插入新版本。
+        先对 SKU 行的计数器做 F() 原子递增（拿到该行写锁），并发的重贴标签请求会在此排队，
+        而不是在 unique_together ('sku', 'version_number') 上冲突。
+        """
+        with transaction.atomic():
+            SKU.objects.filter(pk=sku.pk).update(label_version_counter=F('label_version_counter') + 1)
+            next_ver = SKU.objects.filter(pk=sku.pk).values_list('label_version_counter', flat=True).get() - 1
+            label = cls.objects.create(
+                sku=sku,
+                version_number=next_ver,
+                fnsku=fnsku,
+                upc=upc,
+                created_by=created_by
+            )
+            SKU.objects.filter(pk=sku.pk).update(current_label=label)
+
+            from .verification import index_labels_on_commit
+            index_labels_on_commit([label])
+
+        # 同步内存中的 SKU 对象，调用方无需 refresh_from_db
+        sku.label_version_counter = next_ver + 1
+        sku.current_label = label
+        return label
+
+    @classmethod
+    def bulk_create_versions(cls, entries, created_by, batch_size=500):
+        """
+        批量版本创建：entries 为 (sku, fnsku, upc) 列表，sku 为已加载的 SKU 对象。
+        每批 SKU 的计数器用一条 CASE UPDATE 一次性预留版本号段，内存中分配版本号后
+        bulk_create 插入，再用子查询刷新最新版本指针。整体在一个事务内完成。
+        返回与 entries 顺序一致的 LabelVersion 列表。
+        """
+        counts = {}
+        skus = {}
+        for sku, _, _ in entries:
+            counts[sku.pk] = counts.get(sku.pk, 0) + 1
+            skus[sku.pk] = sku
+
+        labels = []
+        with transaction.atomic():
+            sku_ids = list(counts)
+            next_versions = {}
+            for start in range(0, len(sku_ids), batch_size):
+                chunk = sku_ids[start:start + batch_size]
+                # 按递增量分组生成 CASE 分支，通常只有少数几种数量
+                by_count = {}
+                for pk in chunk:
+                    by_count.setdefault(counts[pk], []).append(pk)
+                SKU.objects.filter(pk__in=chunk).update(
+                    label_version_counter=F('label_version_counter') + Case(
+                        *[When(pk__in=pks, then=Value(n)) for n, pks in by_count.items()],
+                        output_field=models.PositiveIntegerField(),
+                    )
+                )
+                for pk, counter in SKU.objects.filter(pk__in=chunk).values_list('pk', 'label_version_counter'):
+                    # 预留号段的起点 = 递增后的计数器 - 本次数量
+                    next_versions[pk] = counter - counts[pk]
+
+            for sku, fnsku, upc in entries:
+                labels.append(cls(
+                    sku=sku,
+                    version_number=next_versions[sku.pk],
+                    fnsku=fnsku,
+                    upc=upc,
+                    created_by=created_by,
+                    checksum=cls.compute_checksum(fnsku, upc),
+                ))
+                next_versions[sku.pk] += 1
+            cls.objects.bulk_create(labels, batch_size=batch_size)
+
+            # 最新版本指针：走 (sku, version_number) 唯一索引的相关子查询，每批一条 UPDATE
+            latest = cls.objects.filter(sku=OuterRef('pk')).order_by('-version_number').values('pk')[:1]
+            for start in range(0, len(sku_ids), batch_size):
+                SKU.objects.filter(pk__in=sku_ids[start:start + batch_size]).update(current_label=Subquery(latest))
+
+            from .verification import index_labels_on_commit
+            index_labels_on_commit(labels)
+            # bulk_create 不触发 post_save，显式失效这些 SKU 的版本历史缓存
+            from .label_cache import invalidate_on_commit
+            invalidate_on_commit(sku_ids=sku_ids)
+
+        for label in labels:
+            skus[label.sku_id].current_label = label
+        for sku in skus.values():
+            sku.label_version_counter = next_versions[sku.pk]
+        return labels
 
     def __str__(self):
         return f"{self.sku.sku_code} - v{self.version_number}"
@@ -93,20 +193,39 @@ class ShipmentBatch(models.Model):
     reviewer2_comment = models.TextField(blank=True)
     reviewer2_at = models.DateTimeField(null=True, blank=True)
 
+    # 行版本号：每次写入递增，审核接口用 UPDATE ... WHERE row_version = ? 检测并发修改
+    row_version = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='batch_created_id_idx'),
+        ]
+
     def __str__(self):
         return self.batch_code
 
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            self.row_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'row_version'}
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def compute_review_status(reviewer1_id, reviewer1_approved, reviewer2_id, reviewer2_approved):
+        """由两级审核结果推导批次状态（纯函数，单条与批量审核共用）"""
+        if reviewer1_approved and reviewer2_approved:
+            return 'approved'
+        if reviewer1_id and not reviewer1_approved:
+            return 'rejected'
+        if reviewer2_id and not reviewer2_approved:
+            return 'rejected'
+        return 'reviewing'
+
     def update_status_based_on_reviews(self):
-        
-        from django.utils import timezone
-        if self.reviewer1_approved and self.reviewer2_approved:
-            self.status = 'approved'
-        elif self.reviewer1 and not self.reviewer1_approved:
-            self.status = 'rejected'
-        elif self.reviewer2 and not self.reviewer2_approved:
-            self.status = 'rejected'
-        else:
-            self.status = 'reviewing'
+        self.status = self.compute_review_status(
+            self.reviewer1_id, self.reviewer1_approved, self.reviewer2_id, self.reviewer2_approved
+        )
         self.save(update_fields=['status'])
 
 class WarehouseLocation(models.Model):
@@ -126,6 +245,45 @@ class WarehouseLocation(models.Model):
     is_active = models.BooleanField(default=True)
     description = models.CharField(max_length=200, blank=True)
 
+    # 由 code 解析出的层级（保存时自动填充），区/巷道/列/层范围查询走 location_path_idx
+    zone = models.CharField(max_length=50, blank=True, editable=False)
+    aisle = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    bay = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    level = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
+    HIERARCHY_FIELDS = ('zone', 'aisle', 'bay', 'level')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['zone', 'aisle', 'bay', 'level'], name='location_path_idx'),
+        ]
+
+    @staticmethod
+    def parse_code(code):
+        """
+        解析库位编码 zone-aisle-bay-level（如 A-01-01、B-03-12-2），返回 (zone, aisle, bay, level)。
+        巷道、列、层解析为整数，缺失或非数字的部分为 None。
+        """
+        parts = [p for p in code.strip().upper().replace('_', '-').split('-') if p]
+        zone = parts[0] if parts else ''
+        numbers = [int(p) if p.isdigit() else None for p in parts[1:4]]
+        numbers += [None] * (3 - len(numbers))
+        return (zone, *numbers)
+
+    def fill_hierarchy(self):
+        """按 code 填充 zone/aisle/bay/level，返回是否有变化"""
+        parsed = self.parse_code(self.code)
+        changed = parsed != tuple(getattr(self, f) for f in self.HIERARCHY_FIELDS)
+        self.zone, self.aisle, self.bay, self.level = parsed
+        return changed
+
+    def save(self, *args, **kwargs):
+        self.fill_hierarchy()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'code' in update_fields:
+            kwargs['update_fields'] = {*update_fields, *self.HIERARCHY_FIELDS}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.code} ({self.location_type})"
 
@@ -139,11 +297,26 @@ class InventoryStock(models.Model):
     location = models.ForeignKey(WarehouseLocation, on_delete=models.PROTECT)
     label_version = models.ForeignKey(LabelVersion, on_delete=models.PROTECT) # 关联到具体的标签版本
     quantity = models.PositiveIntegerField(default=0)
+    # 已分配给出库任务、尚未发货扣减的数量；可用量 = quantity - quantity_allocated
+    quantity_allocated = models.PositiveIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         # 同一个库位、同一个标签版本只能有一条记录
         unique_together = ('location', 'label_version')
+        indexes = [
+            # 分配引擎按标签版本查找有可用量的库位（部分索引只包含可用行）
+            models.Index(
+                fields=['label_version', 'updated_at'], name='stock_available_idx',
+                condition=models.Q(quantity__gt=models.F('quantity_allocated')),
+            ),
+        ]
+        constraints = [
+            # 已分配的数量不能被调整、移库等其他过账扣走，否则发货时无货可出
+            models.CheckConstraint(
+                condition=models.Q(quantity__gte=models.F('quantity_allocated')), name='stock_covers_allocated',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.location.code} - {self.label_version} : {self.quantity}"
@@ -208,6 +381,9 @@ class OutboundExecution(models.Model):
     picker = models.ForeignKey(Operator, on_delete=models.SET_NULL, null=True, verbose_name="Picker")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='assigned')
     
+    # 所属拣货波次
+    wave = models.ForeignKey('PickWave', on_delete=models.SET_NULL, null=True, blank=True, related_name='executions')
+
     # 实际发货时间
     shipped_at = models.DateTimeField(null=True, blank=True)
     # 物流单号 (Tracking Number)
@@ -217,6 +393,66 @@ class OutboundExecution(models.Model):
         return f"EXEC-{self.batch.batch_code}"
 
 
+class PickAllocation(models.Model):
+    """
+    拣货分配
+    记录出库任务从哪个库位拣取多少件（必须是批次指定的标签版本），分配时占用库存的 quantity_allocated。
+    """
+    execution = models.ForeignKey(OutboundExecution, related_name='allocations', on_delete=models.CASCADE)
+    location = models.ForeignKey(WarehouseLocation, on_delete=models.PROTECT)
+    label_version = models.ForeignKey(LabelVersion, on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.execution} <- {self.location.code} x {self.quantity}"
+
+
+class PickWave(models.Model):
+    """
+    拣货波次
+    把多个出库任务合并为一次拣货作业，拣货单按库位行走路线（蛇形路径）排好顺序。
+    """
+    STATUS_CHOICES = [
+        ('open', 'Open'),           # 已生成
+        ('picking', 'Picking'),     # 拣货中
+        ('completed', 'Completed'), # 已完成
+    ]
+
+    code = models.CharField(max_length=50, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    created_by = models.ForeignKey(Operator, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='wave_created_id_idx'),
+        ]
+
+    def __str__(self):
+        return self.code
+
+
+class PickWaveLine(models.Model):
+    """
+    波次拣货行：sequence 为行走顺序
+    """
+    wave = models.ForeignKey(PickWave, related_name='lines', on_delete=models.CASCADE)
+    execution = models.ForeignKey(OutboundExecution, on_delete=models.CASCADE)
+    location = models.ForeignKey(WarehouseLocation, on_delete=models.PROTECT)
+    label_version = models.ForeignKey(LabelVersion, on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField()
+    sequence = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wave', 'sequence'], name='waveline_sequence_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.wave.code} #{self.sequence} {self.location.code}"
+
+
 class StockTransaction(models.Model):
     """
     库存流水日志
@@ -246,5 +482,171 @@ class StockTransaction(models.Model):
     # 关联单据号（可以是入库单号、出库单号等）
     reference_document = models.CharField(max_length=100, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='txn_timestamp_id_idx'),
+            # 按库位回放快照之后的流水尾部
+            models.Index(fields=['location', 'id'], name='txn_location_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.timestamp} | {self.transaction_type} | {self.quantity_change}"
+
+
+class StockBalanceSnapshot(models.Model):
+    """
+    库存结余快照
+    定期（或每 N 条流水）记录每个 (库位, 标签版本) 的结余，时点库存查询从最近的快照出发，
+    只回放 last_transaction_id 之后的流水尾部。结余为 0 的组合不写入。
+    """
+    location = models.ForeignKey(WarehouseLocation, on_delete=models.PROTECT)
+    label_version = models.ForeignKey(LabelVersion, on_delete=models.PROTECT)
+    snapshot_at = models.DateTimeField()
+    quantity = models.PositiveIntegerField()
+    # 快照包含的最后一条流水 ID（同一次快照的所有行相同）
+    last_transaction_id = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ('snapshot_at', 'location', 'label_version')
+
+    def __str__(self):
+        return f"{self.snapshot_at:%Y-%m-%d %H:%M} | {self.location_id}/{self.label_version_id} : {self.quantity}"
+
+
+
+class ReconciliationRun(models.Model):
+    """
+    库存对账任务
+    逐个 (库位, 标签版本) 核对 InventoryStock.quantity 与流水合计、最新 balance_after 是否一致。
+    增量对账只检查上次完成的对账之后有变动的库位。
+    API 只创建 queued 任务，由 reconcile_stock --queued 在独立进程中执行。
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    incremental = models.BooleanField(default=False)
+    # 执行时使用的进程数（排队时已按 WAREHOUSE_RECONCILE_MAX_WORKERS 截断）
+    workers = models.PositiveSmallIntegerField(default=1)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # 对账开始时的最大流水 ID，下一次增量对账从这里开始
+    last_transaction_id = models.BigIntegerField(default=0)
+    checked_keys = models.PositiveIntegerField(default=0)
+    discrepancy_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"RECON-{self.pk} ({self.status})"
+
+
+class ReconciliationDiscrepancy(models.Model):
+    """
+    对账差异：stock_quantity 为空表示没有库存行，ledger_balance 为空表示没有流水
+    """
+    run = models.ForeignKey(ReconciliationRun, related_name='discrepancies', on_delete=models.CASCADE)
+    location = models.ForeignKey(WarehouseLocation, on_delete=models.CASCADE)
+    label_version = models.ForeignKey(LabelVersion, on_delete=models.CASCADE)
+    stock_quantity = models.IntegerField(null=True)
+    ledger_sum = models.IntegerField()
+    ledger_balance = models.IntegerField(null=True)
+
+    def __str__(self):
+        return f"{self.run} | {self.location_id}/{self.label_version_id}"
+
+
+class LabelAvailability(models.Model):
+    """
+    标签版本可用量汇总（以标签版本为主键）
+    on_hand 为各库位库存合计，allocated 为已分配给出库任务的数量，
+    committed 为已审核通过、尚未发货的批次数量；可用量 = on_hand - committed。
+    由过账、审核、分配、发货路径增量维护（见 availability.py），可用 rebuild_availability 全量重建。
+    """
+    label_version = models.OneToOneField(
+        LabelVersion, primary_key=True, on_delete=models.CASCADE, related_name='availability'
+    )
+    sku = models.ForeignKey(SKU, on_delete=models.CASCADE, related_name='label_availability')
+    on_hand = models.IntegerField(default=0)
+    allocated = models.IntegerField(default=0)
+    committed = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def available(self):
+        return self.on_hand - self.committed
+
+    def __str__(self):
+        return f"{self.label_version_id}: {self.available}/{self.on_hand}"
+
+
+class SKUAvailability(models.Model):
+    """SKU 可用量汇总（以 SKU 为主键），为其全部标签版本汇总行之和"""
+    sku = models.OneToOneField(SKU, primary_key=True, on_delete=models.CASCADE, related_name='availability')
+    on_hand = models.IntegerField(default=0)
+    allocated = models.IntegerField(default=0)
+    committed = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def available(self):
+        return self.on_hand - self.committed
+
+    def __str__(self):
+        return f"{self.sku_id}: {self.available}/{self.on_hand}"
+
+
+class CycleCount(models.Model):
+    """
+    循环盘点任务
+    开始时在同一事务内冻结一组库位的 InventoryStock 快照（expected_quantity）并记下当时的最大流水 ID；
+    盘点期间库位照常收发货，过账时用冻结点之后、清点之前的流水修正期望值，避免重复计算。
+    """
+    STATUS_CHOICES = [
+        ('counting', 'Counting'),
+        ('posted', 'Posted'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='counting')
+    locations = models.ManyToManyField(WarehouseLocation, related_name='cycle_counts')
+    operator = models.ForeignKey(Operator, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    posted_at = models.DateTimeField(null=True, blank=True)
+    # 冻结快照时的最大流水 ID，之后的流水为盘点期间的收发货
+    last_transaction_id = models.BigIntegerField(default=0)
+    location_count = models.PositiveIntegerField(default=0)
+    line_count = models.PositiveIntegerField(default=0)
+    adjusted_count = models.PositiveIntegerField(default=0)
+    note = models.CharField(max_length=200, blank=True)
+
+    @property
+    def reference(self):
+        return f"CC-{self.pk}"
+
+    def __str__(self):
+        return f"{self.reference} ({self.status})"
+
+
+class CycleCountLine(models.Model):
+    """
+    盘点明细：每个 (库位, 标签版本) 一行。快照中没有、清点时发现的标签版本以 expected_quantity=0 补行。
+    movement 为冻结点之后、清点之前该组合的流水合计，variance = counted - (expected + movement)，过账时写入。
+    """
+    count = models.ForeignKey(CycleCount, related_name='lines', on_delete=models.CASCADE)
+    location = models.ForeignKey(WarehouseLocation, on_delete=models.PROTECT)
+    label_version = models.ForeignKey(LabelVersion, on_delete=models.PROTECT)
+    expected_quantity = models.PositiveIntegerField(default=0)
+    counted_quantity = models.PositiveIntegerField(null=True, blank=True)
+    counted_at = models.DateTimeField(null=True, blank=True)
+    movement = models.IntegerField(default=0)
+    variance = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('count', 'location', 'label_version')
+
     def __str__(self):
-        return f"{self.timestamp} | {self.transaction_type} | {self.quantity_change}"
\ No newline at end of file
+        return f"{self.count} | {self.location_id}/{self.label_version_id}"
@@ -0,0 +1,226 @@
+# warehouse/pagination.py
+import base64
+import json
+
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    复合键游标分页：按 (ordering_field, id) 倒序，游标记录上一页边界行的键值。
+    翻页条件是 WHERE (f < v) OR (f = v AND id < pk)，配合 (f, id) 复合索引，
+    深页与首页代价相同，不存在 OFFSET 扫描；同一时间戳的多行也不会重复或遗漏。
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    ordering_field = 'created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        field = self.ordering_field
+
+        if cursor is None:
+            reverse = False
+            queryset = queryset.order_by(f'-{field}', '-pk')
+        else:
+            value, pk, reverse = cursor
+            if reverse:
+                # 向前翻页：取边界之后（更新）的行，升序取再翻转
+                queryset = queryset.filter(
+                    Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+                ).order_by(field, 'pk')
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+                ).order_by(f'-{field}', '-pk')
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        self.next_cursor = self.row_key(rows[-1]) + (False,) if rows and has_next else None
+        self.previous_cursor = self.row_key(rows[0]) + (True,) if rows and has_previous else None
+        return rows
+
+    def row_key(self, row):
+        return getattr(row, self.ordering_field), row.pk
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            value, pk, reverse = raw.rsplit('|', 2)
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise ValueError(value)
+            return parsed, int(pk), reverse == '1'
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        value, pk, reverse = cursor
+        raw = f"{value.isoformat()}|{pk}|{1 if reverse else 0}"
+        encoded = base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        return self.encode_cursor(self.next_cursor) if self.next_cursor else None
+
+    def get_previous_link(self):
+        return self.encode_cursor(self.previous_cursor) if self.previous_cursor else None
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class IdKeysetPagination(KeysetPagination):
+    """只按主键倒序的游标分页：用于没有时间列，或时间列随写入改写、不能作为稳定游标的表"""
+    ordering_field = 'pk'
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            pk, reverse = raw.split('|')
+            return int(pk), int(pk), reverse == '1'
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        _, pk, reverse = cursor
+        encoded = base64.urlsafe_b64encode(f"{pk}|{1 if reverse else 0}".encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class LedgerKeysetPagination(KeysetPagination):
+    """库存流水按 (timestamp, id) 分页"""
+    ordering_field = 'timestamp'
+
+
+class ReconciliationKeysetPagination(KeysetPagination):
+    """对账任务按 (started_at, id) 分页"""
+    ordering_field = 'started_at'
+
+
+class AvailabilityKeysetPagination(IdKeysetPagination):
+    """可用量汇总按主键分页：updated_at 随每次过账改写，作为游标会让翻页中的行重复或遗漏"""
+
+
+class PathKeysetPagination(KeysetPagination):
+    """
+    按多列层级路径 (ordering_fields..., id) 升序的游标分页，用于库位按 (zone, aisle, bay, level) 行走顺序翻页。
+    层级列可为空，空值排在最前；翻页条件逐列展开为 (f1 > v1) OR (f1 = v1 AND f2 > v2) ...，
+    第一列的范围条件落在 (zone, aisle, bay, level) 复合索引上。
+    """
+    ordering_fields = ('zone', 'aisle', 'bay', 'level')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        fields = [*self.ordering_fields, 'pk']
+        ascending = [F(f).asc(nulls_first=True) for f in fields]
+        descending = [F(f).desc(nulls_last=True) for f in fields]
+
+        if cursor is None:
+            reverse = False
+            queryset = queryset.order_by(*ascending)
+        else:
+            values, reverse = cursor
+            if reverse:
+                queryset = queryset.filter(self.before(fields, values)).order_by(*descending)
+            else:
+                queryset = queryset.filter(self.after(fields, values)).order_by(*ascending)
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        self.next_cursor = (self.row_key(rows[-1]), False) if rows and has_next else None
+        self.previous_cursor = (self.row_key(rows[0]), True) if rows and has_previous else None
+        return rows
+
+    @staticmethod
+    def after(fields, values):
+        condition, prefix = Q(pk__in=[]), Q()
+        for field, value in zip(fields, values):
+            greater = Q(**{f'{field}__isnull': False}) if value is None else Q(**{f'{field}__gt': value})
+            condition |= prefix & greater
+            prefix &= Q(**{f'{field}__isnull': True}) if value is None else Q(**{field: value})
+        return condition
+
+    @staticmethod
+    def before(fields, values):
+        condition, prefix = Q(pk__in=[]), Q()
+        for field, value in zip(fields, values):
+            if value is not None:
+                condition |= prefix & (Q(**{f'{field}__lt': value}) | Q(**{f'{field}__isnull': True}))
+            prefix &= Q(**{f'{field}__isnull': True}) if value is None else Q(**{field: value})
+        return condition
+
+    def row_key(self, row):
+        return [*(getattr(row, f) for f in self.ordering_fields), row.pk]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            values, reverse = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if not isinstance(values, list) or len(values) != len(self.ordering_fields) + 1:
+                raise ValueError(values)
+            return values, bool(reverse)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
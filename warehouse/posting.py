@@ -0,0 +1,204 @@
+# warehouse/posting.py
+"""
+库存过账引擎
+InventoryStock 与 StockTransaction 的唯一写入口：一批数量变动在一个事务内完成，
+库存用 F() 表达式集合式更新（不做读-改-写），流水一次 bulk_create 写入并带 balance_after。
+"""
+from collections import namedtuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Case, When, Value, IntegerField
+from django.utils import timezone
+
+from .availability import stock_posted
+from .events import publish_postings
+from .ledger import maybe_snapshot_after
+from .models import InventoryStock, StockTransaction, LabelVersion, WarehouseLocation, Operator
+
+StockLine = namedtuple('StockLine', ['location_id', 'label_version_id', 'delta', 'reference'])
+StockLine.__new__.__defaults__ = ('',)
+MoveLine = namedtuple('MoveLine', ['from_location_id', 'to_location_id', 'label_version_id', 'quantity', 'reference'])
+MoveLine.__new__.__defaults__ = ('',)
+
+CHUNK_SIZE = 1000
+
+
+class StockPostingError(Exception):
+    """过账请求不合法（未知库位、未知标签版本等）"""
+
+
+class InsufficientStock(StockPostingError):
+    """扣减后库存将为负数"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(f"Insufficient stock for {len(shortages)} location/label pair(s)")
+
+
+def _operator_id(operator):
+    """Operator 实例或 ID（可为字符串形式的整数）；非整数时抛出 StockPostingError"""
+    operator_id = getattr(operator, 'pk', operator)
+    if operator_id in (None, ''):
+        return None
+    try:
+        return int(operator_id)
+    except (TypeError, ValueError):
+        raise StockPostingError(f"Unknown operator: {operator_id!r}")
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def post_stock(lines, transaction_type, operator=None):
+    """
+    过账一批库存变动：lines 为 StockLine（或同结构元组）列表，delta 正数入、负数出。
+    每条输入行生成一条流水，balance_after 为按输入顺序依次过账后的结余。
+    任一 (库位, 标签版本) 的结余为负或低于已分配数量时整批回滚并抛出 InsufficientStock。
+    返回创建的 StockTransaction 列表（与 lines 顺序一致）。
+    """
+    lines = [StockLine(*line) for line in lines]
+    if not lines:
+        return []
+
+    net = {}
+    for line in lines:
+        key = (line.location_id, line.label_version_id)
+        net[key] = net.get(key, 0) + line.delta
+    # 固定顺序插入与加锁：并发的过账按相同顺序取行锁，不会互相等待成环
+    keys = sorted(net)
+    location_ids = {k[0] for k in keys}
+    label_ids = {k[1] for k in keys}
+    operator_id = _operator_id(operator)
+
+    # 校验读在事务之外：SQLite 默认 DEFERRED 事务先读后写时，读锁升级写锁遇到并发写者会立即失败，
+    # 不经过 busy timeout；事务内第一条语句即为写入，写锁按 busy timeout 排队
+    sku_by_label = dict(LabelVersion.objects.filter(pk__in=label_ids).values_list('id', 'sku_id'))
+    known_locations = set(WarehouseLocation.objects.filter(pk__in=location_ids).values_list('id', flat=True))
+    if len(sku_by_label) != len(label_ids):
+        raise StockPostingError(f"Unknown label versions: {sorted(label_ids - set(sku_by_label))}")
+    if len(known_locations) != len(location_ids):
+        raise StockPostingError(f"Unknown locations: {sorted(location_ids - known_locations)}")
+    if operator_id is not None and not Operator.objects.filter(pk=operator_id).exists():
+        raise StockPostingError(f"Unknown operator: {operator_id}")
+
+    with transaction.atomic():
+        # 1. upsert 的插入部分：缺失的库存行以 0 补齐，已存在的忽略
+        InventoryStock.objects.bulk_create(
+            [InventoryStock(location_id=loc, label_version_id=lv, quantity=0) for loc, lv in keys],
+            ignore_conflicts=True, batch_size=CHUNK_SIZE,
+        )
+        stock_id = {}
+        for pk, loc, lv in (
+            InventoryStock.objects.select_for_update()
+            .filter(location_id__in=location_ids, label_version_id__in=label_ids)
+            .order_by('id')
+            .values_list('id', 'location_id', 'label_version_id')
+        ):
+            if (loc, lv) in net:
+                stock_id[(loc, lv)] = pk
+
+        # 2. 集合式 F() 更新：按变动量分组生成 CASE 分支，一条 UPDATE 处理一批库存行
+        now = timezone.now()
+        changed = [k for k in keys if net[k]]
+        try:
+            with transaction.atomic():
+                for chunk in _chunks(changed):
+                    by_delta = {}
+                    for key in chunk:
+                        by_delta.setdefault(net[key], []).append(stock_id[key])
+                    InventoryStock.objects.filter(pk__in=[stock_id[k] for k in chunk]).update(
+                        quantity=F('quantity') + Case(
+                            *[When(pk__in=ids, then=Value(delta)) for delta, ids in by_delta.items()],
+                            default=Value(0), output_field=IntegerField(),
+                        ),
+                        updated_at=now,
+                    )
+        except IntegrityError:
+            # 数据库 CHECK 约束拒绝负数库存，以及低于已分配数量（stock_covers_allocated）的库存
+            raise InsufficientStock(_shortages(net, stock_id))
+
+        # 3. 读回过账后的结余，倒推每条流水的 balance_after
+        balance = {}
+        id_to_key = {pk: key for key, pk in stock_id.items()}
+        for chunk in _chunks(list(id_to_key)):
+            for pk, quantity in InventoryStock.objects.filter(pk__in=chunk).values_list('id', 'quantity'):
+                key = id_to_key[pk]
+                balance[key] = quantity - net[key]
+
+        opening = dict(balance)
+        transactions = []
+        negative = set()
+        for line in lines:
+            key = (line.location_id, line.label_version_id)
+            balance[key] += line.delta
+            if balance[key] < 0:
+                negative.add(key)
+            transactions.append(StockTransaction(
+                transaction_type=transaction_type,
+                sku_id=sku_by_label[line.label_version_id],
+                label_version_id=line.label_version_id,
+                location_id=line.location_id,
+                quantity_change=line.delta,
+                balance_after=balance[key],
+                operator_id=operator_id,
+                reference_document=line.reference,
+            ))
+        if negative:
+            # 净变动不为负，但按顺序过账时中途出现负结余（先出后入）
+            raise InsufficientStock([
+                {"location": loc, "label_version": lv, "requested": net[(loc, lv)], "available": opening[(loc, lv)]}
+                for loc, lv in sorted(negative)
+            ])
+
+        StockTransaction.objects.bulk_create(transactions, batch_size=CHUNK_SIZE)
+        stock_posted(transactions, sku_by_label)
+        maybe_snapshot_after(transactions)
+        publish_postings(transaction_type, transactions)
+    return transactions
+
+
+def move_stock(moves, operator=None):
+    """
+    移库：moves 为 MoveLine（或同结构元组）列表。每行拆成移出、移入两条 StockLine，
+    一次 post_stock 过账，流水为成对相邻的 move 记录（先移出后移入），库存加锁顺序与普通过账相同。
+    移出后库位库存不得低于已分配数量（quantity_allocated），否则整批回滚并抛出 InsufficientStock。
+    返回创建的 StockTransaction 列表（每个 move 两条）。
+    """
+    moves = [MoveLine(*move) for move in moves]
+    if not moves:
+        return []
+    for move in moves:
+        if move.quantity <= 0:
+            raise StockPostingError(f"Move quantity must be positive, got {move.quantity}.")
+        if move.from_location_id == move.to_location_id:
+            raise StockPostingError(f"Move source and destination are the same location: {move.from_location_id}.")
+    inactive = sorted(
+        WarehouseLocation.objects.filter(pk__in={move.to_location_id for move in moves}, is_active=False)
+        .values_list('id', flat=True)
+    )
+    if inactive:
+        raise StockPostingError(f"Inactive destination locations: {inactive}")
+    lines = []
+    for move in moves:
+        lines.append(StockLine(move.from_location_id, move.label_version_id, -move.quantity, move.reference))
+        lines.append(StockLine(move.to_location_id, move.label_version_id, move.quantity, move.reference))
+    # 不在外层另开事务：post_stock 的校验读必须在事务之外，事务内第一条语句才是写入（见 post_stock）。
+    # 移出后低于已分配数量由 stock_covers_allocated 约束拦截，整批回滚
+    return post_stock(lines, 'move', operator=operator)
+
+
+def _shortages(net, stock_id):
+    """可扣减量为库存减去已分配数量"""
+    available = {
+        pk: quantity - allocated
+        for pk, quantity, allocated in InventoryStock.objects.filter(pk__in=list(stock_id.values()))
+        .values_list('id', 'quantity', 'quantity_allocated')
+    }
+    shortages = []
+    for key, delta in net.items():
+        free = available.get(stock_id.get(key), 0)
+        if free + delta < 0:
+            shortages.append({"location": key[0], "label_version": key[1], "requested": delta, "available": free})
+    return shortages
@@ -0,0 +1,172 @@
+# warehouse/reconciliation.py
+"""
+库存对账
+按库位 ID 分块：每块在数据库端聚合流水（SUM(quantity_change)、MAX(id) 对应的 balance_after），
+与 InventoryStock 逐组合比对，内存占用只与块大小有关。块可以分发到进程池并行执行。
+对账期间仍有过账写入，初筛出的差异会在最后复核一次，只记录复核后仍不一致的组合。
+API 只排队（queue_reconciliation），对账由 reconcile_stock 管理命令在独立进程中执行（run_queued），
+进程池用 spawn 方式启动，不会 fork 带线程的 Web 进程。
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .models import (
+    InventoryStock, StockTransaction, WarehouseLocation, ReconciliationRun, ReconciliationDiscrepancy,
+)
+
+CHUNK_SIZE = 200
+
+
+def check_locations(location_ids):
+    """
+    核对一组库位下的全部 (库位, 标签版本)，返回 (核对组合数, 差异列表)。
+    差异元素为 (location_id, label_version_id, stock_quantity, ledger_sum, ledger_balance)。
+    """
+    with transaction.atomic():
+        stock = dict(
+            ((loc, lv), qty) for loc, lv, qty in
+            InventoryStock.objects.filter(location_id__in=location_ids)
+            .values_list('location_id', 'label_version_id', 'quantity')
+        )
+        ledger = {}
+        for row in (
+            StockTransaction.objects.filter(location_id__in=location_ids)
+            .values('location_id', 'label_version_id')
+            .annotate(total=Sum('quantity_change'), last=Max('id')).order_by()
+        ):
+            ledger[(row['location_id'], row['label_version_id'])] = [row['total'], row['last']]
+        balance_by_id = dict(
+            StockTransaction.objects.filter(id__in=[v[1] for v in ledger.values()]).values_list('id', 'balance_after')
+        )
+
+    discrepancies = []
+    keys = stock.keys() | ledger.keys()
+    for key in keys:
+        quantity = stock.get(key)
+        total, last_id = ledger.get(key, (0, None))
+        balance = balance_by_id.get(last_id)
+        expected = quantity or 0
+        if total != expected or (balance is not None and balance != expected):
+            discrepancies.append((key[0], key[1], quantity, total, balance))
+    return len(keys), discrepancies
+
+
+def max_workers():
+    return getattr(settings, 'WAREHOUSE_RECONCILE_MAX_WORKERS', 1)
+
+
+def _location_chunks(run, previous, chunk_size):
+    """全量：按 ID 顺序遍历全部库位；增量：上次对账之后有流水或库存变动的库位"""
+    if previous is None:
+        ids = WarehouseLocation.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size)
+    else:
+        touched = set(
+            StockTransaction.objects.filter(id__gt=previous.last_transaction_id, id__lte=run.last_transaction_id)
+            .values_list('location_id', flat=True).distinct().iterator(chunk_size=chunk_size)
+        )
+        touched.update(
+            InventoryStock.objects.filter(updated_at__gte=previous.started_at)
+            .values_list('location_id', flat=True).distinct().iterator(chunk_size=chunk_size)
+        )
+        ids = iter(sorted(touched))
+    chunk = []
+    for location_id in ids:
+        chunk.append(location_id)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_reconciliation(run, workers=1, chunk_size=CHUNK_SIZE):
+    """执行对账任务 run，写入差异并更新汇总；workers > 1 时使用进程池"""
+    try:
+        previous = None
+        if run.incremental:
+            previous = (
+                ReconciliationRun.objects.filter(status='completed').exclude(pk=run.pk)
+                .order_by('-started_at').first()
+            )
+        run.last_transaction_id = StockTransaction.objects.aggregate(last=Max('id'))['last'] or 0
+        run.save(update_fields=['last_transaction_id'])
+
+        chunks = _location_chunks(run, previous, chunk_size)
+        checked = 0
+        suspects = []
+        if workers > 1:
+            # spawn 启动的子进程重新导入 Django（initializer 为 django.setup）并各自建立数据库连接
+            chunks = list(chunks)
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+            ) as pool:
+                for count, found in pool.map(check_locations, chunks):
+                    checked += count
+                    suspects.extend(found)
+        else:
+            for chunk in chunks:
+                count, found = check_locations(chunk)
+                checked += count
+                suspects.extend(found)
+
+        # 复核：排除对账期间并发过账造成的瞬时不一致
+        confirmed = []
+        suspect_keys = {(loc, lv) for loc, lv, *_ in suspects}
+        suspect_locations = sorted({loc for loc, _ in suspect_keys})
+        for start in range(0, len(suspect_locations), chunk_size):
+            _, found = check_locations(suspect_locations[start:start + chunk_size])
+            confirmed.extend(d for d in found if (d[0], d[1]) in suspect_keys)
+
+        ReconciliationDiscrepancy.objects.bulk_create(
+            [
+                ReconciliationDiscrepancy(
+                    run=run, location_id=loc, label_version_id=lv,
+                    stock_quantity=quantity, ledger_sum=total, ledger_balance=balance,
+                )
+                for loc, lv, quantity, total, balance in confirmed
+            ],
+            batch_size=1000,
+        )
+        run.status = 'completed'
+        run.checked_keys = checked
+        run.discrepancy_count = len(confirmed)
+    except Exception as exc:
+        run.status = 'failed'
+        run.error = str(exc)
+        raise
+    finally:
+        run.finished_at = timezone.now()
+        run.save(update_fields=['status', 'checked_keys', 'discrepancy_count', 'error', 'finished_at'])
+    return run
+
+
+def queue_reconciliation(incremental=False, workers=1):
+    """创建排队中的对账任务，workers 按 WAREHOUSE_RECONCILE_MAX_WORKERS 截断；由 run_queued 执行"""
+    workers = max(1, min(workers, max_workers()))
+    return ReconciliationRun.objects.create(status='queued', incremental=incremental, workers=workers)
+
+
+def run_queued(chunk_size=CHUNK_SIZE):
+    """
+    按创建顺序执行全部排队中的任务，返回执行过的任务列表。
+    每个任务先用条件 UPDATE（queued -> running）认领，多个执行进程同时运行也不会重复执行同一任务。
+    单个任务失败时记为 failed（错误写入 run.error），继续执行后面的任务。
+    """
+    done = []
+    for pk in ReconciliationRun.objects.filter(status='queued').order_by('id').values_list('id', flat=True):
+        if not ReconciliationRun.objects.filter(pk=pk, status='queued').update(status='running', started_at=timezone.now()):
+            continue
+        run = ReconciliationRun.objects.get(pk=pk)
+        try:
+            run_reconciliation(run, workers=min(run.workers, max_workers()), chunk_size=chunk_size)
+        except Exception:
+            pass  # 失败信息已写入 run.error
+        done.append(run)
+    return done
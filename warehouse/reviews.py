@@ -0,0 +1,180 @@
+# warehouse/reviews.py
+"""
+出货批次审核
+审核校验与状态推导都是基于一次读取的行快照在内存中完成的纯计算；
+写入是一条 UPDATE ... WHERE id = ? AND row_version = ?，同时写审核人字段、新状态并递增行版本。
+读取之后若有其他审核写入，行版本已变化，UPDATE 命中 0 行，返回冲突而不是静默覆盖。
+批量审核复用同一套校验与状态推导，一次读取、按组写入。
+"""
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .availability import batches_changed
+from .events import publish_batches
+from .models import Operator, ShipmentBatch
+
+ROLES = ('1', '2')
+# 审核需要的行快照字段
+REVIEW_FIELDS = (
+    'id', 'created_by_id', 'row_version', 'status', 'label_id', 'quantity',
+    'reviewer1_id', 'reviewer1_approved', 'reviewer2_id', 'reviewer2_approved',
+)
+
+
+class ReviewError(Exception):
+    """审核请求不合法；status_code 为对应的 HTTP 状态码"""
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ReviewConflict(ReviewError):
+    """批次在读取之后已被修改"""
+    def __init__(self, current_version=None):
+        super().__init__("Batch was modified by another request. Reload and retry.", 409)
+        self.current_version = current_version
+
+
+def parse_approved(value):
+    try:
+        return models.BooleanField().to_python(value)
+    except ValidationError:
+        raise ReviewError("approved must be a boolean.")
+
+
+def check_review(row, operator_id, role):
+    """
+    对行快照 row（含 REVIEW_FIELDS 的 dict）做权限校验，不合法时抛出 ReviewError：
+    审核人不能是创建人；一级与二级审核人不能是同一个人。
+    """
+    if role not in ROLES:
+        raise ReviewError("Invalid reviewer role. Use '1' or '2'.")
+    if row['created_by_id'] == operator_id:
+        raise ReviewError("Reviewer cannot be the creator.", 403)
+    if role == '1' and row['reviewer2_id'] == operator_id:
+        raise ReviewError("Reviewer 1 cannot be the same as Reviewer 2.", 403)
+    if role == '2' and row['reviewer1_id'] == operator_id:
+        raise ReviewError("Reviewer 2 cannot be the same as Reviewer 1.", 403)
+
+
+def review_changes(row, operator_id, role, approved, comment, now):
+    """返回本次审核要写入的字段（含推导出的新状态）"""
+    reviewers = {
+        '1': (row['reviewer1_id'], row['reviewer1_approved']),
+        '2': (row['reviewer2_id'], row['reviewer2_approved']),
+    }
+    reviewers[role] = (operator_id, approved)
+    changes = {
+        f'reviewer{role}_id': operator_id,
+        f'reviewer{role}_approved': approved,
+        f'reviewer{role}_comment': comment,
+        f'reviewer{role}_at': now,
+    }
+    changes['status'] = ShipmentBatch.compute_review_status(*reviewers['1'], *reviewers['2'])
+    return changes
+
+
+def _commitment(row, status):
+    return (status, row['label_id'], row['quantity'])
+
+
+def review_batch(batch_id, operator_id, role, approved, comment='', expected_version=None):
+    """
+    单条审核：读取一次行快照，校验后用一条带行版本条件的 UPDATE 写入。
+    expected_version 为客户端持有的 row_version，给出时与快照不一致直接返回冲突。
+    """
+    try:
+        operator_id = int(operator_id)
+    except (TypeError, ValueError):
+        raise ReviewError("Operator not found")
+    if not Operator.objects.filter(pk=operator_id).exists():
+        raise ReviewError("Operator not found")
+    try:
+        batch_id = int(batch_id)
+    except (TypeError, ValueError):
+        raise ReviewError("Batch not found", 404)
+
+    row = ShipmentBatch.objects.filter(pk=batch_id).values(*REVIEW_FIELDS).first()
+    if row is None:
+        raise ReviewError("Batch not found", 404)
+    if expected_version is not None and expected_version != row['row_version']:
+        raise ReviewConflict(row['row_version'])
+    check_review(row, operator_id, str(role))
+
+    changes = review_changes(row, operator_id, str(role), approved, comment, timezone.now())
+    with transaction.atomic():
+        updated = ShipmentBatch.objects.filter(pk=batch_id, row_version=row['row_version']).update(
+            row_version=F('row_version') + 1, **changes
+        )
+        if not updated:
+            raise ReviewConflict()
+        batches_changed([(row['id'], _commitment(row, row['status']), _commitment(row, changes['status']))])
+    publish_batches([(row['id'], changes['status'], row['status'])])
+    return row['row_version'] + 1
+
+
+def bulk_review(batch_ids, operator_id, role, approved, comment=''):
+    """
+    批量审核：与 review_batch 相同，在事务之外一次取出全部批次快照，逐条复用 check_review / review_changes
+    在内存中校验；事务内只按 (新状态, 行版本) 分组，每组一条带行版本条件的 UPDATE 写入。
+    任一批次在读取快照之后被并发修改时整批回滚并抛出 ReviewConflict，客户端重试即可。
+    返回与 batch_ids 顺序一致的逐条结果。
+    """
+    try:
+        operator_id = int(operator_id)
+    except (TypeError, ValueError):
+        raise ReviewError("Operator not found")
+    if not Operator.objects.filter(pk=operator_id).exists():
+        raise ReviewError("Operator not found")
+    role = str(role)
+    if role not in ROLES:
+        raise ReviewError("Invalid reviewer role. Use '1' or '2'.")
+    batch_ids = list(dict.fromkeys(batch_ids))
+
+    now = timezone.now()
+    results = {}
+    groups = {}
+    # 快照读在事务之外：SQLite DEFERRED 事务先读后写时读锁升级会立即失败（见 posting.post_stock），
+    # 并发写由下面 UPDATE 的行版本条件检出
+    rows = {row['id']: row for row in ShipmentBatch.objects.filter(pk__in=batch_ids).values(*REVIEW_FIELDS)}
+    for batch_id in batch_ids:
+        row = rows.get(batch_id)
+        if row is None:
+            results[batch_id] = {"id": batch_id, "ok": False, "status_code": 404, "error": "Batch not found"}
+            continue
+        try:
+            check_review(row, operator_id, role)
+        except ReviewError as exc:
+            results[batch_id] = {"id": batch_id, "ok": False, "status_code": exc.status_code, "error": str(exc)}
+            continue
+        status = review_changes(row, operator_id, role, approved, comment, now)['status']
+        groups.setdefault((status, row['row_version']), []).append(batch_id)
+        results[batch_id] = {"id": batch_id, "ok": True, "status": status, "row_version": row['row_version'] + 1}
+
+    # 审核人字段对所有行相同，只有状态和原行版本不同
+    shared = {
+        f'reviewer{role}_id': operator_id,
+        f'reviewer{role}_approved': approved,
+        f'reviewer{role}_comment': comment,
+        f'reviewer{role}_at': now,
+    }
+    with transaction.atomic():
+        for (status, version), ids in groups.items():
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                updated = ShipmentBatch.objects.filter(pk__in=chunk, row_version=version).update(
+                    status=status, row_version=F('row_version') + 1, **shared
+                )
+                if updated != len(chunk):
+                    # 读取快照之后有批次被并发修改，整批回滚
+                    raise ReviewConflict()
+        reviewed = [batch_id for batch_id in batch_ids if results[batch_id]['ok']]
+        batches_changed([
+            (batch_id, _commitment(rows[batch_id], rows[batch_id]['status']),
+             _commitment(rows[batch_id], results[batch_id]['status']))
+            for batch_id in reviewed
+        ])
+        publish_batches([(batch_id, results[batch_id]['status'], rows[batch_id]['status']) for batch_id in reviewed])
+    return [results[batch_id] for batch_id in batch_ids]
@@ -1,6 +1,10 @@
 # warehouse/serializers.py
 from rest_framework import serializers
-from .models import Operator, SKU, LabelVersion, ShipmentBatch
+from .models import (
+    Operator, SKU, LabelVersion, ShipmentBatch, WarehouseLocation, InventoryStock, StockTransaction,
+    InboundReceipt, InboundLineItem, OutboundExecution, PickAllocation, PickWave, PickWaveLine,
+    ReconciliationRun, ReconciliationDiscrepancy, LabelAvailability, SKUAvailability, CycleCount, CycleCountLine,
+)
 
 class OperatorSerializer(serializers.ModelSerializer):
     class Meta:
@@ -33,11 +37,184 @@ class ShipmentBatchSerializer(serializers.ModelSerializer):
             'id', 'batch_code', 'label', 'label_details', 'quantity', 'status', 
             'created_at', 'created_by', 'created_by_name',
             'reviewer1', 'reviewer1_name', 'reviewer1_approved', 'reviewer1_comment', 'reviewer1_at',
-            'reviewer2', 'reviewer2_name', 'reviewer2_approved', 'reviewer2_comment', 'reviewer2_at'
+            'reviewer2', 'reviewer2_name', 'reviewer2_approved', 'reviewer2_comment', 'reviewer2_at',
+            'row_version'
         ]
         # 核心逻辑：审核字段不应该由前端在"创建"或"普通修改"时直接写入，需要通过专门的审核接口
         read_only_fields = [
             'status', 'created_by', 
             'reviewer1', 'reviewer1_approved', 'reviewer1_comment', 'reviewer1_at',
-            'reviewer2', 'reviewer2_approved', 'reviewer2_comment', 'reviewer2_at'
-        ]
\ No newline at end of file
+            'reviewer2', 'reviewer2_approved', 'reviewer2_comment', 'reviewer2_at', 'row_version'
+        ]
+
+class WarehouseLocationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WarehouseLocation
+        fields = ['id', 'code', 'location_type', 'is_active', 'description', 'zone', 'aisle', 'bay', 'level']
+        # 层级由 code 自动解析
+        read_only_fields = ['zone', 'aisle', 'bay', 'level']
+
+class InventoryStockSerializer(serializers.ModelSerializer):
+    location_code = serializers.CharField(source='location.code', read_only=True)
+    sku_code = serializers.CharField(source='label_version.sku.sku_code', read_only=True)
+    version_number = serializers.IntegerField(source='label_version.version_number', read_only=True)
+
+    class Meta:
+        model = InventoryStock
+        fields = ['id', 'location', 'location_code', 'label_version', 'sku_code', 'version_number', 'quantity', 'quantity_allocated', 'updated_at']
+        read_only_fields = fields
+
+
+class StockTransactionSerializer(serializers.ModelSerializer):
+    sku_code = serializers.CharField(source='sku.sku_code', read_only=True)
+    location_code = serializers.CharField(source='location.code', read_only=True)
+    version_number = serializers.IntegerField(source='label_version.version_number', read_only=True)
+
+    class Meta:
+        model = StockTransaction
+        fields = [
+            'id', 'transaction_type', 'sku', 'sku_code', 'label_version', 'version_number',
+            'location', 'location_code', 'quantity_change', 'balance_after',
+            'operator', 'timestamp', 'reference_document'
+        ]
+        read_only_fields = fields
+
+
+class InboundLineItemSerializer(serializers.ModelSerializer):
+    sku_code = serializers.CharField(source='label_version.sku.sku_code', read_only=True)
+    version_number = serializers.IntegerField(source='label_version.version_number', read_only=True)
+    location_code = serializers.CharField(source='target_location.code', read_only=True)
+
+    class Meta:
+        model = InboundLineItem
+        fields = [
+            'id', 'receipt', 'label_version', 'sku_code', 'version_number', 'target_location', 'location_code',
+            'quantity_declared', 'quantity_received', 'scanned_hash'
+        ]
+        # 实收数量与哈希只能通过扫描会话写入
+        read_only_fields = ['receipt', 'quantity_received', 'scanned_hash']
+
+class InboundReceiptSerializer(serializers.ModelSerializer):
+    items = InboundLineItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = InboundReceipt
+        fields = ['id', 'receipt_no', 'reference_no', 'status', 'operator', 'created_at', 'completed_at', 'items']
+        # 状态只能通过扫描、完成等作业接口流转
+        read_only_fields = ['status', 'created_at', 'completed_at']
+
+
+class PickAllocationSerializer(serializers.ModelSerializer):
+    location_code = serializers.CharField(source='location.code', read_only=True)
+
+    class Meta:
+        model = PickAllocation
+        fields = ['id', 'location', 'location_code', 'label_version', 'quantity', 'created_at']
+        read_only_fields = fields
+
+class OutboundExecutionSerializer(serializers.ModelSerializer):
+    batch_code = serializers.CharField(source='batch.batch_code', read_only=True)
+    allocations = PickAllocationSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = OutboundExecution
+        fields = ['id', 'batch', 'batch_code', 'picker', 'status', 'wave', 'shipped_at', 'tracking_number', 'allocations']
+        # 状态通过分配、波次、发货接口流转
+        read_only_fields = ['status', 'wave', 'shipped_at']
+
+    def validate_batch(self, batch):
+        if batch.status != 'approved':
+            raise serializers.ValidationError("Only approved batches can be executed.")
+        return batch
+
+
+class PickWaveLineSerializer(serializers.ModelSerializer):
+    location_code = serializers.CharField(source='location.code', read_only=True)
+    batch_code = serializers.CharField(source='execution.batch.batch_code', read_only=True)
+    sku_code = serializers.CharField(source='label_version.sku.sku_code', read_only=True)
+    version_number = serializers.IntegerField(source='label_version.version_number', read_only=True)
+
+    class Meta:
+        model = PickWaveLine
+        fields = [
+            'sequence', 'location', 'location_code', 'execution', 'batch_code',
+            'label_version', 'sku_code', 'version_number', 'quantity'
+        ]
+        read_only_fields = fields
+
+class PickWaveSerializer(serializers.ModelSerializer):
+    lines = PickWaveLineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = PickWave
+        fields = ['id', 'code', 'status', 'created_by', 'created_at', 'lines']
+        read_only_fields = fields
+
+
+class ReconciliationRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReconciliationRun
+        fields = [
+            'id', 'status', 'incremental', 'workers', 'started_at', 'finished_at',
+            'last_transaction_id', 'checked_keys', 'discrepancy_count', 'error'
+        ]
+        read_only_fields = fields
+
+class ReconciliationDiscrepancySerializer(serializers.ModelSerializer):
+    location_code = serializers.CharField(source='location.code', read_only=True)
+    sku_code = serializers.CharField(source='label_version.sku.sku_code', read_only=True)
+
+    class Meta:
+        model = ReconciliationDiscrepancy
+        fields = [
+            'id', 'location', 'location_code', 'label_version', 'sku_code',
+            'stock_quantity', 'ledger_sum', 'ledger_balance'
+        ]
+        read_only_fields = fields
+
+
+class LabelAvailabilitySerializer(serializers.ModelSerializer):
+    sku_code = serializers.CharField(source='sku.sku_code', read_only=True)
+    version_number = serializers.IntegerField(source='label_version.version_number', read_only=True)
+    available = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = LabelAvailability
+        fields = [
+            'label_version', 'sku', 'sku_code', 'version_number',
+            'on_hand', 'allocated', 'committed', 'available', 'updated_at'
+        ]
+        read_only_fields = fields
+
+class SKUAvailabilitySerializer(serializers.ModelSerializer):
+    sku_code = serializers.CharField(source='sku.sku_code', read_only=True)
+    available = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = SKUAvailability
+        fields = ['sku', 'sku_code', 'on_hand', 'allocated', 'committed', 'available', 'updated_at']
+        read_only_fields = fields
+
+
+class CycleCountSerializer(serializers.ModelSerializer):
+    reference = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = CycleCount
+        fields = [
+            'id', 'reference', 'status', 'operator', 'note', 'created_at', 'posted_at',
+            'last_transaction_id', 'location_count', 'line_count', 'adjusted_count'
+        ]
+        read_only_fields = fields
+
+class CycleCountLineSerializer(serializers.ModelSerializer):
+    location_code = serializers.CharField(source='location.code', read_only=True)
+    sku_code = serializers.CharField(source='label_version.sku.sku_code', read_only=True)
+
+    class Meta:
+        model = CycleCountLine
+        fields = [
+            'id', 'location', 'location_code', 'label_version', 'sku_code', 'expected_quantity',
+            'counted_quantity', 'counted_at', 'movement', 'variance'
+        ]
+        read_only_fields = fields
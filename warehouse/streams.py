@@ -0,0 +1,54 @@
+# warehouse/streams.py
+"""
+Server-Sent Events 推送接口
+GET /api/events/?topics=batch,execution,stock
+每个连接在事件总线上注册一个订阅，按 SSE 格式推送事件；无事件时定期发送注释行保活。
+断线重连时浏览器自动携带 Last-Event-ID，从进程内缓冲补发错过的事件。
+需要在 ASGI 服务器（uvicorn / daphne）下运行：WSGI 下每个连接会长期占用一个工作线程。
+"""
+import json
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .events import broker, TOPICS
+
+
+def format_event(event):
+    data = json.dumps({"topic": event.topic, "timestamp": event.timestamp, **event.payload}, ensure_ascii=False)
+    return f"id: {event.id}\nevent: {event.topic}\ndata: {data}\n\n"
+
+
+async def _stream(subscription, heartbeat):
+    try:
+        # 先发一行注释，客户端立即收到响应头并建立连接
+        yield ": connected\n\n"
+        while True:
+            event = await subscription.get(timeout=heartbeat)
+            yield format_event(event) if event is not None else ": ping\n\n"
+    finally:
+        subscription.close()
+
+
+async def event_stream(request):
+    if request.method != 'GET':
+        return JsonResponse({"error": "Method not allowed."}, status=405)
+    topics = [t for t in request.GET.get('topics', '').split(',') if t]
+    unknown = sorted(set(topics) - set(TOPICS))
+    if unknown:
+        return JsonResponse({"error": f"Unknown topics: {', '.join(unknown)}. Use {', '.join(TOPICS)}."}, status=400)
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.GET.get('last_event_id') or 0) or None
+    except ValueError:
+        last_event_id = None
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "The event stream is only served under ASGI."}, status=501)
+
+    subscription = broker.subscribe(topics or None, last_event_id=last_event_id)
+    heartbeat = getattr(settings, 'WAREHOUSE_SSE_HEARTBEAT', 15)
+    response = StreamingHttpResponse(_stream(subscription, heartbeat), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # 关闭反向代理缓冲（nginx）
+    response['X-Accel-Buffering'] = 'no'
+    return response
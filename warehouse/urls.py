@@ -1,12 +1,28 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import SKUViewSet, LabelVersionViewSet, ShipmentBatchViewSet
+from .streams import event_stream
+from .views import (
+    SKUViewSet, LabelVersionViewSet, ShipmentBatchViewSet, InventoryStockViewSet, StockTransactionViewSet,
+    InboundReceiptViewSet, OutboundExecutionViewSet, PickWaveViewSet, ReconciliationRunViewSet,
+    LabelAvailabilityViewSet, SKUAvailabilityViewSet, WarehouseLocationViewSet, CycleCountViewSet,
+)
 
 router = DefaultRouter()
 router.register(r'skus', SKUViewSet)
 router.register(r'labels', LabelVersionViewSet)   # 对应 /api/labels/
 router.register(r'batches', ShipmentBatchViewSet) # 对应 /api/batches/
+router.register(r'locations', WarehouseLocationViewSet) # 对应 /api/locations/
+router.register(r'inventory', InventoryStockViewSet) # 对应 /api/inventory/
+router.register(r'transactions', StockTransactionViewSet) # 对应 /api/transactions/
+router.register(r'receipts', InboundReceiptViewSet) # 对应 /api/receipts/
+router.register(r'executions', OutboundExecutionViewSet) # 对应 /api/executions/
+router.register(r'waves', PickWaveViewSet) # 对应 /api/waves/
+router.register(r'reconciliations', ReconciliationRunViewSet) # 对应 /api/reconciliations/
+router.register(r'availability/labels', LabelAvailabilityViewSet) # 对应 /api/availability/labels/
+router.register(r'availability/skus', SKUAvailabilityViewSet) # 对应 /api/availability/skus/
+router.register(r'cycle-counts', CycleCountViewSet) # 对应 /api/cycle-counts/
 
 urlpatterns = [
+    path('events/', event_stream, name='event-stream'),  # 对应 /api/events/（SSE，需 ASGI）
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,19 +1,19 @@
 # warehouse/utils.py
+from .verification import checksum_index
 from .models import LabelVersion
-import hashlib
 
 def verify_label(label_id, scanned_fnsku, scanned_upc):
-    
-    try:
-        label = LabelVersion.objects.get(id=label_id)
-    except LabelVersion.DoesNotExist:
-        return False,
+    """
+    校验扫描到的 FNSKU/UPC 是否与指定标签版本一致。
+    返回 (是否通过, 说明)，标签数据取自内存索引。
+    """
+    entry = checksum_index.get(label_id)
+    if entry is None:
+        return False, "Label not found"
 
-    
-    scanned_raw = f"{scanned_fnsku}|{scanned_upc}"
-    scanned_checksum = hashlib.sha256(scanned_raw.encode('utf-8')).hexdigest()
+    scanned_checksum = LabelVersion.compute_checksum(scanned_fnsku, scanned_upc)
 
-    if scanned_checksum == label.checksum:
-        return True,
+    if scanned_checksum == entry.checksum:
+        return True, "OK"
     else:
-        return False, 
\ No newline at end of file
+        return False, "Checksum mismatch"
@@ -0,0 +1,217 @@
+# warehouse/verification.py
+"""
+扫描校验服务
+在内存中维护 checksum -> 标签版本 的索引，扫描枪高频校验时命中内存，不访问数据库。
+索引（含每个 SKU 的当前版本指针）在进程启动时预热（见 wsgi.py / asgi.py），
+并在 LabelVersion.create_version / bulk_create_versions 提交后增量更新，校验本身不访问数据库。
+
+每个进程各自持有一份索引：其他进程新建的版本不经过本进程的信号，
+由增量同步（id 大于已知最大 ID 的版本及其 SKU 的当前指针，一条走主键的查询）补入；
+同步最多每 WAREHOUSE_SCAN_SYNC_SECONDS 秒一次，未命中的校验和在两次同步之间直接判定为未知，
+因此其他进程的新版本、当前版本变化在本进程最多延迟这么久可见。
+"""
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import LabelVersion, SKU
+
+LabelEntry = namedtuple('LabelEntry', ['label_id', 'sku_id', 'sku_code', 'version_number', 'checksum'])
+
+
+class LabelChecksumIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_checksum = {}   # checksum -> tuple[LabelEntry]
+        self._by_id = {}         # label_id -> LabelEntry
+        self._current = {}       # sku_id -> current_label_id（与 SKU.current_label 一致，删除后为 None）
+        self._last_id = 0        # 已索引的最大标签版本 ID，增量同步的起点
+        self._synced_at = 0.0
+        self._sync_lock = threading.Lock()
+        self.warmed = False
+
+    # --- 维护 ---
+
+    def warm(self, chunk_size=5000):
+        by_checksum, by_id = {}, {}
+        synced_at = time.monotonic()
+        rows = (
+            LabelVersion.objects
+            .values_list('id', 'sku_id', 'sku__sku_code', 'version_number', 'checksum')
+            .iterator(chunk_size=chunk_size)
+        )
+        for row in rows:
+            entry = LabelEntry(*row)
+            self._insert(entry, by_checksum, by_id)
+        current = dict(SKU.objects.filter(current_label__isnull=False).values_list('id', 'current_label_id'))
+        with self._lock:
+            self._by_checksum, self._by_id, self._current = by_checksum, by_id, current
+            self._last_id = max(by_id, default=0)
+            self._synced_at = synced_at
+            self.warmed = True
+
+    def warm_safely(self):
+        """启动时预热；数据库尚未迁移时跳过，首次查询时再懒加载"""
+        try:
+            self.warm()
+        except DatabaseError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._by_checksum, self._by_id, self._current = {}, {}, {}
+            self._last_id, self._synced_at = 0, 0.0
+            self.warmed = False
+
+    def add(self, labels):
+        """
+        labels 为刚提交的新版本（已加载 sku）。新版本总是其 SKU 的最新版本，
+        同一 SKU 取版本号最大者作为当前版本。
+        """
+        if not self.warmed:
+            return
+        with self._lock:
+            for label in labels:
+                entry = LabelEntry(label.id, label.sku_id, label.sku.sku_code, label.version_number, label.checksum)
+                self._insert(entry, self._by_checksum, self._by_id)
+                current = self._by_id.get(self._current.get(label.sku_id))
+                if current is None or current.version_number < label.version_number:
+                    self._current[label.sku_id] = label.id
+                self._last_id = max(self._last_id, label.id)
+
+    def discard(self, label_id):
+        with self._lock:
+            entry = self._by_id.pop(label_id, None)
+            if entry is None:
+                return
+            if self._current.get(entry.sku_id) == label_id:
+                # 与 SKU.current_label 的 on_delete=SET_NULL 一致
+                self._current[entry.sku_id] = None
+            remaining = tuple(e for e in self._by_checksum.get(entry.checksum, ()) if e.label_id != label_id)
+            if remaining:
+                self._by_checksum[entry.checksum] = remaining
+            else:
+                self._by_checksum.pop(entry.checksum, None)
+
+    @staticmethod
+    def _insert(entry, by_checksum, by_id):
+        if entry.label_id in by_id:
+            return
+        by_id[entry.label_id] = entry
+        by_checksum[entry.checksum] = by_checksum.get(entry.checksum, ()) + (entry,)
+
+    # --- 查询 ---
+
+    def _ensure_warm(self):
+        if not self.warmed:
+            self.warm()
+
+    def sync(self):
+        """增量同步其他进程新建的版本：一条 id > 已知最大 ID 的查询，同时刷新这些 SKU 的当前版本指针"""
+        if not self._sync_lock.acquire(blocking=False):
+            return  # 其他线程正在同步
+        try:
+            synced_at = time.monotonic()
+            rows = list(
+                LabelVersion.objects.filter(id__gt=self._last_id).order_by('id')
+                .values_list('id', 'sku_id', 'sku__sku_code', 'version_number', 'checksum', 'sku__current_label_id')
+            )
+            with self._lock:
+                for *row, current_id in rows:
+                    entry = LabelEntry(*row)
+                    self._insert(entry, self._by_checksum, self._by_id)
+                    self._current[entry.sku_id] = current_id
+                    self._last_id = max(self._last_id, entry.label_id)
+                self._synced_at = synced_at
+        finally:
+            self._sync_lock.release()
+
+    def _maybe_sync(self):
+        self._ensure_warm()
+        if time.monotonic() - self._synced_at >= getattr(settings, 'WAREHOUSE_SCAN_SYNC_SECONDS', 5):
+            self.sync()
+
+    def lookup(self, checksum):
+        """命中与未命中都只读内存；未命中的校验和在下次同步前视为未知"""
+        self._maybe_sync()
+        return self._by_checksum.get(checksum, ())
+
+    def is_current(self, entry):
+        return self._current.get(entry.sku_id) == entry.label_id
+
+    def get(self, label_id):
+        self._ensure_warm()
+        entry = self._by_id.get(label_id)
+        if entry is None:
+            label = LabelVersion.objects.filter(pk=label_id).select_related('sku').first()
+            if label is None:
+                return None
+            self.add([label])
+            entry = self._by_id.get(label_id)
+        return entry
+
+
+
+checksum_index = LabelChecksumIndex()
+
+
+def _describe(entry):
+    return {
+        "label_id": entry.label_id,
+        "sku": entry.sku_id,
+        "sku_code": entry.sku_code,
+        "version_number": entry.version_number,
+        "is_current": checksum_index.is_current(entry),
+    }
+
+
+def _result(fnsku, upc, checksum, entries, label_id=None):
+    result = {
+        "fnsku": fnsku,
+        "upc": upc,
+        "checksum": checksum,
+        "matched": bool(entries),
+        "matches": [_describe(e) for e in entries],
+    }
+    if label_id is not None:
+        result["label_id"] = label_id
+        result["label_match"] = any(e.label_id == label_id for e in entries)
+    return result
+
+
+def verify_scan(fnsku, upc, label_id=None):
+    """单次扫描：这对 FNSKU/UPC 对应哪个 SKU 的哪个版本，是否为当前版本"""
+    fnsku, upc = fnsku or '', upc or ''
+    checksum = LabelVersion.compute_checksum(fnsku, upc)
+    return _result(fnsku, upc, checksum, checksum_index.lookup(checksum), label_id)
+
+
+def verify_scans(scans):
+    """
+    批量扫描：scans 为 (fnsku, upc, label_id) 列表，相同的 FNSKU/UPC 组合只计算一次哈希。
+    """
+    checksums = {}
+    results = []
+    for fnsku, upc, label_id in scans:
+        fnsku, upc = fnsku or '', upc or ''
+        key = (fnsku, upc)
+        checksum = checksums.get(key)
+        if checksum is None:
+            checksum = checksums[key] = LabelVersion.compute_checksum(fnsku, upc)
+        results.append(_result(fnsku, upc, checksum, checksum_index.lookup(checksum), label_id))
+    return results
+
+
+def index_labels_on_commit(labels):
+    transaction.on_commit(lambda: checksum_index.add(labels))
+
+
+@receiver(post_delete, sender=LabelVersion)
+def _discard_deleted_label(sender, instance, **kwargs):
+    label_id = instance.pk
+    transaction.on_commit(lambda: checksum_index.discard(label_id))
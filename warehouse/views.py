@@ -2,20 +2,99 @@ from django.shortcuts import render
 
 # Create your views here.
 # warehouse/views.py
-from rest_framework import viewsets, status, permissions
+from rest_framework import viewsets, mixins, status, permissions
+from rest_framework.exceptions import ValidationError
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import OperationalError
+from django.db.models import Prefetch, Exists, OuterRef, F
 from django.utils import timezone
-from .models import SKU, LabelVersion, ShipmentBatch, Operator
-from .serializers import SKUSerializer, LabelVersionSerializer, ShipmentBatchSerializer
+from django.utils.dateparse import parse_datetime
+from .models import (
+    SKU, LabelVersion, ShipmentBatch, Operator, InventoryStock, StockTransaction,
+    InboundReceipt, InboundLineItem, OutboundExecution, PickAllocation, PickWave, PickWaveLine, ReconciliationRun,
+    LabelAvailability, SKUAvailability, WarehouseLocation, CycleCount,
+)
+from .serializers import (
+    SKUSerializer, LabelVersionSerializer, ShipmentBatchSerializer, InventoryStockSerializer,
+    StockTransactionSerializer, InboundReceiptSerializer, InboundLineItemSerializer,
+    OutboundExecutionSerializer, PickWaveSerializer, ReconciliationRunSerializer, ReconciliationDiscrepancySerializer,
+    LabelAvailabilitySerializer, SKUAvailabilitySerializer, WarehouseLocationSerializer,
+    CycleCountSerializer, CycleCountLineSerializer,
+)
+from .reviews import review_batch, bulk_review, parse_approved, ReviewError, ReviewConflict
+from .inbound import ingest_scan_session, complete_receipt, ReceiptClosed
+from .posting import post_stock, move_stock, StockLine, MoveLine, StockPostingError, InsufficientStock
+from .allocation import allocate_executions, ship_execution, AllocationError
+from .waves import build_wave, WaveError
+from .ledger import balances_as_of
+from .reconciliation import queue_reconciliation
+from .availability import check_availability
+from .locations import location_filter, LocationFilterError, PATH_ORDERING, FILTER_PARAMS
+from .cycle_counts import (
+    start_cycle_count, record_counts, post_cycle_count, cancel_cycle_count, CycleCountError, UNCOUNTED_POLICIES,
+)
+from .catalog import read_catalog, import_catalog, CatalogError
+from .exports import stream_export, filter_export, ExportError, LEDGER_COLUMNS, INVENTORY_COLUMNS
+from .pagination import (
+    KeysetPagination, IdKeysetPagination, LedgerKeysetPagination, ReconciliationKeysetPagination, AvailabilityKeysetPagination,
+    PathKeysetPagination,
+)
+from .verification import verify_scan, verify_scans
+from .label_cache import label_detail, sku_history, conditional_response
 
 class SKUViewSet(viewsets.ModelViewSet):
     queryset = SKU.objects.all()
     serializer_class = SKUSerializer
+    pagination_class = KeysetPagination
 
-class LabelVersionViewSet(viewsets.ModelViewSet):
-    queryset = LabelVersion.objects.all()
+    @action(detail=False, methods=['post'], url_path='import')
+    def catalog_import(self, request):
+        """
+        POST /api/skus/import/  (multipart/form-data)
+        file: CSV 或 XLSX，列 sku_code, product_name, fnsku, upc；created_by: 可选
+        创建缺失的 SKU 及 v0 标签版本，FNSKU/UPC 变化的 SKU 生成新版本，逐行返回错误。
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload a CSV or XLSX file in the 'file' field."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            summary = import_catalog(
+                read_catalog(upload.file, upload.name), created_by=request.data.get('created_by') or 'import',
+            )
+        except CatalogError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(summary, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='labels')
+    def labels(self, request, pk=None):
+        """
+        GET /api/skus/{id}/labels/
+        SKU 的全部标签版本（按版本号升序）及当前版本指针；响应带 ETag，缓存命中时不访问数据库。
+        新版本会改变历史，客户端每次都需要用 If-None-Match 重新验证。
+        """
+        entry = sku_history(pk)
+        if entry is None:
+            return Response({"error": "SKU not found"}, status=status.HTTP_404_NOT_FOUND)
+        return conditional_response(request, entry, 'no-cache')
+
+class LabelVersionViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    # 标签版本不可变：只能新建版本，不提供 PUT/PATCH/DELETE（扫描校验索引与响应缓存都以此为前提）
+    # 序列化器读取 sku.sku_code，JOIN 进来避免逐行查询
+    queryset = LabelVersion.objects.select_related('sku')
     serializer_class = LabelVersionSerializer
+    pagination_class = KeysetPagination
+
+    def retrieve(self, request, pk=None):
+        """
+        GET /api/labels/{id}/
+        版本内容不可变，但响应包含可修改的 sku_code：走标签响应缓存，客户端每次用 If-None-Match 重新验证（304）。
+        """
+        entry = label_detail(pk)
+        if entry is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        return conditional_response(request, entry, 'private, no-cache')
     
     # 覆写 create 方法：利用 Model 中定义的 create_version 逻辑
     def create(self, request, *args, **kwargs):
@@ -40,9 +119,106 @@ class LabelVersionViewSet(viewsets.ModelViewSet):
         except SKU.DoesNotExist:
             return Response({"error": "SKU not found"}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """
+        POST /api/labels/bulk/
+        Body: {
+            "created_by": "system",
+            "labels": [{"sku": 1, "fnsku": "X00...", "upc": "0123..."}, ...]
+        }
+        也可直接提交数组。所有 SKU 一次查询解析，版本号在内存中分配，一个事务内 bulk_create。
+        逐行返回错误，合法行照常创建。
+        """
+        data = request.data
+        rows = data if isinstance(data, list) else data.get('labels')
+        if not isinstance(rows, list):
+            return Response({"error": "Expected a list of labels."}, status=status.HTTP_400_BAD_REQUEST)
+        created_by = (data.get('created_by') if isinstance(data, dict) else None) or 'system'
+
+        errors = []
+        sku_ids = set()
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                errors.append({"index": index, "error": "Row must be an object."})
+                continue
+            try:
+                sku_ids.add(int(row.get('sku')))
+            except (TypeError, ValueError):
+                errors.append({"index": index, "error": "Invalid SKU id."})
+        skus = SKU.objects.in_bulk(sku_ids)
+
+        entries = []
+        indexes = []
+        failed = {e['index'] for e in errors}
+        for index, row in enumerate(rows):
+            if index in failed:
+                continue
+            sku = skus.get(int(row['sku']))
+            if sku is None:
+                errors.append({"index": index, "error": "SKU not found"})
+                continue
+            entries.append((sku, row.get('fnsku') or '', row.get('upc') or ''))
+            indexes.append(index)
+
+        labels = LabelVersion.bulk_create_versions(entries, created_by=created_by) if entries else []
+        created = [
+            {
+                "index": index,
+                "id": label.id,
+                "sku": label.sku_id,
+                "sku_code": label.sku.sku_code,
+                "version_number": label.version_number,
+                "checksum": label.checksum,
+            }
+            for index, label in zip(indexes, labels)
+        ]
+        errors.sort(key=lambda e: e['index'])
+        response_status = status.HTTP_201_CREATED if created or not errors else status.HTTP_400_BAD_REQUEST
+        return Response({"created": created, "errors": errors}, status=response_status)
+
+    # --- 扫描校验：走内存 checksum 索引，不访问数据库 ---
+
+    @action(detail=False, methods=['post'], url_path='verify')
+    def verify(self, request):
+        """
+        POST /api/labels/verify/
+        Body: { "fnsku": "...", "upc": "...", "label": 12 (可选，期望的标签版本 ID) }
+        """
+        data = request.data
+        label_id = data.get('label')
+        try:
+            label_id = int(label_id) if label_id not in (None, '') else None
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid label id."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(verify_scan(data.get('fnsku'), data.get('upc'), label_id))
+
+    @action(detail=False, methods=['post'], url_path='verify-batch')
+    def verify_batch(self, request):
+        """
+        POST /api/labels/verify-batch/
+        Body: { "scans": [{"fnsku": "...", "upc": "...", "label": 12}, ...] }
+        """
+        scans = request.data.get('scans') if isinstance(request.data, dict) else request.data
+        if not isinstance(scans, list):
+            return Response({"error": "Expected a list of scans."}, status=status.HTTP_400_BAD_REQUEST)
+        parsed = []
+        for index, scan in enumerate(scans):
+            if not isinstance(scan, dict):
+                return Response({"error": f"Scan {index} must be an object."}, status=status.HTTP_400_BAD_REQUEST)
+            label_id = scan.get('label')
+            try:
+                label_id = int(label_id) if label_id not in (None, '') else None
+            except (TypeError, ValueError):
+                return Response({"error": f"Invalid label id in scan {index}."}, status=status.HTTP_400_BAD_REQUEST)
+            parsed.append((scan.get('fnsku'), scan.get('upc'), label_id))
+        return Response({"results": verify_scans(parsed)})
+
 class ShipmentBatchViewSet(viewsets.ModelViewSet):
-    queryset = ShipmentBatch.objects.all()
+    # 嵌套的 label_details 与三个操作员名称全部 JOIN，列表查询条数与行数无关
+    queryset = ShipmentBatch.objects.select_related('label__sku', 'created_by', 'reviewer1', 'reviewer2')
     serializer_class = ShipmentBatchSerializer
+    pagination_class = KeysetPagination
 
     def perform_create(self, serializer):
         # 自动关联创建人
@@ -60,50 +236,635 @@ class ShipmentBatchViewSet(viewsets.ModelViewSet):
             "reviewer_role": "1" or "2", 
             "approved": true, 
             "comment": "OK",
-            "operator_id": 1  (实际应从 Token 获取当前登录用户 ID)
+            "operator_id": 1,  (实际应从 Token 获取当前登录用户 ID)
+            "row_version": 3   (可选：客户端读取批次时的行版本，已变化则返回 409)
         }
+        审核人赋值与状态流转用一条带行版本条件的 UPDATE 完成，并发审核不会互相覆盖。
         """
-        batch = self.get_object()
         data = request.data
-        
-        operator_id = data.get('operator_id') # 实际项目中应使用 request.user
-        role = data.get('reviewer_role') # '1' for Reviewer1, '2' for Reviewer2
-        approved = data.get('approved', False)
-        comment = data.get('comment', '')
-
-        try:
-            operator = Operator.objects.get(id=operator_id)
-        except Operator.DoesNotExist:
-            return Response({"error": "Operator not found"}, status=400)
-
-        # 1. 校验：审核人不能是创建人 (自审自批风险)
-        if batch.created_by and batch.created_by.id == operator.id:
-             return Response({"error": "Reviewer cannot be the creator."}, status=403)
-
-        # 2. 校验：Reviewer 1 和 Reviewer 2 不能是同一个人
-        if role == '1':
-            if batch.reviewer2 and batch.reviewer2.id == operator.id:
-                return Response({"error": "Reviewer 1 cannot be the same as Reviewer 2."}, status=403)
-            
-            batch.reviewer1 = operator
-            batch.reviewer1_approved = approved
-            batch.reviewer1_comment = comment
-            batch.reviewer1_at = timezone.now()
-            
-        elif role == '2':
-            if batch.reviewer1 and batch.reviewer1.id == operator.id:
-                return Response({"error": "Reviewer 2 cannot be the same as Reviewer 1."}, status=403)
-
-            batch.reviewer2 = operator
-            batch.reviewer2_approved = approved
-            batch.reviewer2_comment = comment
-            batch.reviewer2_at = timezone.now()
-        
-        else:
-            return Response({"error": "Invalid reviewer role. Use '1' or '2'."}, status=400)
+        expected_version = data.get('row_version')
+        if expected_version is not None:
+            try:
+                expected_version = int(expected_version)
+            except (TypeError, ValueError):
+                return Response({"error": "row_version must be an integer."}, status=400)
+        try:
+            review_batch(
+                pk, data.get('operator_id'), str(data.get('reviewer_role')),
+                parse_approved(data.get('approved', False)), data.get('comment', ''),
+                expected_version=expected_version,
+            )
+        except ReviewConflict as exc:
+            return Response({"error": str(exc), "row_version": exc.current_version}, status=409)
+        except ReviewError as exc:
+            return Response({"error": str(exc)}, status=exc.status_code)
 
-        # 3. 触发状态机更新
-        batch.update_status_based_on_reviews()
-        batch.save()
-        
-        return Response(ShipmentBatchSerializer(batch).data)
+        return Response(ShipmentBatchSerializer(self.get_queryset().get(pk=pk)).data)
+
+    @action(detail=False, methods=['post'], url_path='bulk-review')
+    def bulk_review(self, request):
+        """
+        POST /api/batches/bulk-review/
+        Body: { "batch_ids": [1, 2, ...], "reviewer_role": "1", "approved": true, "comment": "OK", "operator_id": 1 }
+        与单条审核相同的校验逐条在内存中完成，合法的批次在一个事务内分组写入；逐条返回结果。
+        """
+        data = request.data
+        ids = data.get('batch_ids')
+        if not isinstance(ids, list) or not ids:
+            return Response({"error": "Expected a non-empty list of batch_ids."}, status=400)
+        if len(ids) > 1000:
+            return Response({"error": "At most 1000 batches per request."}, status=400)
+        try:
+            ids = [int(i) for i in ids]
+            results = bulk_review(
+                ids, data.get('operator_id'), data.get('reviewer_role'),
+                parse_approved(data.get('approved', False)), data.get('comment', ''),
+            )
+        except (TypeError, ValueError):
+            return Response({"error": "batch_ids must be integers."}, status=400)
+        except ReviewConflict as exc:
+            return Response({"error": str(exc)}, status=409)
+        except ReviewError as exc:
+            return Response({"error": str(exc)}, status=exc.status_code)
+        except OperationalError as exc:
+            return busy_response(exc)
+        reviewed = sum(1 for r in results if r['ok'])
+        return Response({"reviewed": reviewed, "failed": len(results) - reviewed, "results": results})
+
+
+def hierarchy_filter(queryset, params, prefix=''):
+    """按库位层级查询参数过滤；参数不合法时返回 400"""
+    try:
+        return queryset.filter(location_filter(params, prefix=prefix))
+    except LocationFilterError as exc:
+        raise ValidationError({"error": str(exc)})
+
+
+class WarehouseLocationViewSet(mixins.CreateModelMixin, mixins.UpdateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    库位：zone/aisle/bay/level 由 code 自动解析，列表按行走顺序 (zone, aisle, bay, level, id) 游标分页。
+    GET /api/locations/?zone=A,B&aisle=3&bay_from=1&bay_to=10&level=2&location_type=storage&is_active=true&empty=true
+    """
+    queryset = WarehouseLocation.objects.all()
+    serializer_class = WarehouseLocationSerializer
+    pagination_class = PathKeysetPagination
+
+    def filter_queryset(self, queryset):
+        params = self.request.query_params
+        queryset = hierarchy_filter(queryset, params)
+        if params.get('location_type'):
+            queryset = queryset.filter(location_type__in=params['location_type'].split(','))
+        if params.get('is_active'):
+            queryset = queryset.filter(is_active=params['is_active'].lower() in ('1', 'true', 'yes'))
+        if params.get('empty'):
+            occupied = Exists(InventoryStock.objects.filter(location=OuterRef('pk'), quantity__gt=0))
+            queryset = queryset.filter(~occupied if params['empty'].lower() in ('1', 'true', 'yes') else occupied)
+        return queryset
+
+
+class InventoryStockViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    实时库存只读接口：库存只能通过入库、出库、调整等业务单据变动。
+    列表支持库位层级过滤（zone、aisle、bay、level 及 *_from/*_to），ordering=location 按库位行走顺序排序。
+    """
+    queryset = InventoryStock.objects.select_related('location', 'label_version__sku')
+    serializer_class = InventoryStockSerializer
+
+    def filter_queryset(self, queryset):
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+        queryset = hierarchy_filter(queryset, params, prefix='location__')
+        if params.get('ordering') == 'location':
+            queryset = queryset.order_by(*[f'location__{f}' for f in PATH_ORDERING], 'id')
+        return queryset
+
+    @action(detail=False, methods=['get'], url_path='as-of')
+    def as_of(self, request):
+        """
+        GET /api/inventory/as-of/?at=2025-12-31T23:59:59Z&location=1,2&label_version=3&sku=4
+        从最近的结余快照出发，只回放快照之后的流水尾部。
+        """
+        at = parse_datetime(request.query_params.get('at', ''))
+        if at is None:
+            return Response({"error": "Query parameter 'at' must be an ISO datetime."}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        try:
+            filters = {
+                name: [int(v) for v in request.query_params[param].split(',') if v]
+                for name, param in (('location_ids', 'location'), ('label_version_ids', 'label_version'), ('sku_ids', 'sku'))
+                if request.query_params.get(param)
+            }
+        except ValueError:
+            return Response({"error": "location, label_version and sku must be integer ids."}, status=status.HTTP_400_BAD_REQUEST)
+
+        snapshot_at, replayed, balances = balances_as_of(at, **filters)
+        return Response({
+            "at": at,
+            "snapshot_at": snapshot_at,
+            "replayed_transactions": replayed,
+            "results": [
+                {"location": loc, "label_version": lv, "quantity": qty}
+                for (loc, lv), qty in sorted(balances.items())
+            ],
+        })
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        GET /api/inventory/export/?file_format=csv|ndjson&gzip=1&date_from=&date_to=&sku=&location=
+        流式导出实时库存，日期范围按 updated_at 过滤。
+        """
+        return export_response(
+            request, InventoryStock.objects.order_by('id'), INVENTORY_COLUMNS,
+            date_field='updated_at', sku_field='label_version__sku_id', filename='inventory',
+        )
+
+    @action(detail=False, methods=['post'], url_path='adjust')
+    def adjust(self, request):
+        """
+        POST /api/inventory/adjust/
+        Body: {
+            "operator_id": 1,
+            "lines": [{"location": 1, "label_version": 2, "delta": -3, "reference": "ADJ-001"}, ...]
+        }
+        整批在一个事务内过账，任一行库存不足则整批拒绝（409）。
+        """
+        lines, error = parse_stock_lines(request.data, ('location', 'label_version', 'delta'))
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        return run_posting(
+            lambda: post_stock(
+                [StockLine(loc, lv, delta, ref) for loc, lv, delta, ref in lines],
+                'adjust', operator=request.data.get('operator_id'),
+            )
+        )
+
+    @action(detail=False, methods=['post'], url_path='move')
+    def move(self, request):
+        """
+        POST /api/inventory/move/
+        Body: {
+            "operator_id": 1,
+            "lines": [{"from_location": 1, "to_location": 7, "label_version": 2, "quantity": 12, "reference": "RPL-001"}, ...]
+        }
+        每行生成一对 move 流水（移出、移入），整批在一个事务内过账；
+        移出库位库存不足或会动用已分配数量时整批拒绝（409）。
+        """
+        lines, error = parse_stock_lines(request.data, ('from_location', 'to_location', 'label_version', 'quantity'))
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        return run_posting(
+            lambda: move_stock([MoveLine(*line) for line in lines], operator=request.data.get('operator_id'))
+        )
+
+
+def parse_stock_lines(data, fields):
+    """
+    解析 {"lines": [...]} 请求体，fields 中的字段必须为整数，reference 可选。
+    返回 (行元组列表, 错误信息)。
+    """
+    rows = data.get('lines') if isinstance(data, dict) else None
+    if not isinstance(rows, list) or not rows:
+        return None, "Expected a non-empty list of lines."
+    lines = []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            return None, f"Line {index} must be an object."
+        try:
+            values = tuple(int(row[field]) for field in fields)
+        except (KeyError, TypeError, ValueError):
+            return None, f"Line {index} requires integer {', '.join(fields)}."
+        lines.append(values + (str(row.get('reference', '')),))
+    return lines, None
+
+
+def busy_response(exc):
+    """
+    排队等写锁超过 busy timeout（database is locked）：事务已整体回滚，返回 503 让客户端稍后重试。
+    其他 OperationalError 原样抛出。
+    """
+    if 'locked' not in str(exc):
+        raise exc
+    return Response({"error": "Database is busy, retry shortly."}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': '1'})
+
+
+def run_posting(post):
+    """执行过账并把引擎异常转换为 HTTP 响应"""
+    try:
+        transactions = post()
+    except InsufficientStock as exc:
+        return Response({"error": str(exc), "shortages": exc.shortages}, status=status.HTTP_409_CONFLICT)
+    except StockPostingError as exc:
+        return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    except OperationalError as exc:
+        return busy_response(exc)
+    return Response({
+        "transactions": [
+            {
+                "id": txn.id,
+                "location": txn.location_id,
+                "label_version": txn.label_version_id,
+                "quantity_change": txn.quantity_change,
+                "balance_after": txn.balance_after,
+                "reference_document": txn.reference_document,
+            }
+            for txn in transactions
+        ]
+    }, status=status.HTTP_201_CREATED)
+
+
+def export_response(request, queryset, columns, date_field, sku_field, filename):
+    """解析导出查询参数并返回流式响应（参数名用 file_format，format 被 DRF 保留用于渲染器选择）"""
+    params = request.query_params
+    compress = params.get('gzip', '').lower() in ('1', 'true', 'yes')
+    try:
+        queryset = filter_export(queryset, params, date_field, sku_field)
+        return stream_export(queryset, columns, params.get('file_format', 'csv'), filename, compress=compress)
+    except ExportError as exc:
+        return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class StockTransactionViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    库存流水只读接口：流水不可变，按 (timestamp, id) 游标分页。
+    """
+    queryset = StockTransaction.objects.select_related('sku', 'label_version', 'location')
+    serializer_class = StockTransactionSerializer
+    pagination_class = LedgerKeysetPagination
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        GET /api/transactions/export/?file_format=csv|ndjson&gzip=1&date_from=2025-01-01&date_to=2025-01-31&sku=1&location=2
+        按 (timestamp, id) 顺序流式导出全部流水。
+        """
+        return export_response(
+            request, StockTransaction.objects.order_by('timestamp', 'id'), LEDGER_COLUMNS,
+            date_field='timestamp', sku_field='sku_id', filename='transactions',
+        )
+
+
+class InboundReceiptViewSet(viewsets.ModelViewSet):
+    queryset = InboundReceipt.objects.prefetch_related(
+        Prefetch('items', queryset=InboundLineItem.objects.select_related('label_version__sku', 'target_location'))
+    )
+    serializer_class = InboundReceiptSerializer
+    pagination_class = KeysetPagination
+
+    @action(detail=True, methods=['post'], url_path='items')
+    def add_item(self, request, pk=None):
+        """POST /api/receipts/{id}/items/ 为入库单添加明细"""
+        receipt = self.get_object()
+        if receipt.status == 'completed':
+            return Response({"error": "Receipt is already completed."}, status=status.HTTP_409_CONFLICT)
+        serializer = InboundLineItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(receipt=receipt)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], url_path='scan-session')
+    def scan_session(self, request, pk=None):
+        """
+        POST /api/receipts/{id}/scan-session/
+        Body: { "scans": [["FNSKU", "UPC"], {"fnsku": "...", "upc": "..."}, ...] }
+        每个元素是一次扫描，支持数组或对象两种写法（数组更省流量）。
+        """
+        scans = request.data.get('scans') if isinstance(request.data, dict) else None
+        if not isinstance(scans, list):
+            return Response({"error": "Expected a list of scans."}, status=status.HTTP_400_BAD_REQUEST)
+        pairs = []
+        for index, scan in enumerate(scans):
+            if isinstance(scan, dict):
+                pairs.append((scan.get('fnsku'), scan.get('upc')))
+            elif isinstance(scan, (list, tuple)) and len(scan) == 2:
+                pairs.append((scan[0], scan[1]))
+            else:
+                return Response({"error": f"Invalid scan at index {index}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        receipt = self.get_object()
+        try:
+            summary = ingest_scan_session(receipt.pk, pairs)
+        except ReceiptClosed:
+            return Response({"error": "Receipt is already completed."}, status=status.HTTP_409_CONFLICT)
+        except OperationalError as exc:
+            return busy_response(exc)
+        return Response(summary)
+
+    @action(detail=True, methods=['post'], url_path='complete')
+    def complete(self, request, pk=None):
+        """
+        POST /api/receipts/{id}/complete/
+        Body: { "operator_id": 1 (可选，默认为入库单操作员) }
+        整单过账入库；对已完成的单据重复调用不会重复入账。
+        """
+        receipt = self.get_object()
+        try:
+            receipt, transactions = complete_receipt(receipt.pk, operator=request.data.get('operator_id'))
+        except StockPostingError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        receipt = self.get_queryset().get(pk=receipt.pk)
+        return Response({
+            "receipt": self.get_serializer(receipt).data,
+            "posted_lines": len(transactions),
+        })
+
+
+class OutboundExecutionViewSet(viewsets.ModelViewSet):
+    queryset = OutboundExecution.objects.select_related('batch').prefetch_related(
+        Prefetch('allocations', queryset=PickAllocation.objects.select_related('location'))
+    )
+    serializer_class = OutboundExecutionSerializer
+
+    @action(detail=False, methods=['post'], url_path='allocate')
+    def allocate(self, request):
+        """
+        POST /api/executions/allocate/
+        Body: { "execution_ids": [1, 2, ...], "strategy": "fewest_locations" | "fifo" | "picking_first" }
+        整个波次一次分配；库存不足的任务列入 shortages，不做部分分配。
+        """
+        ids = request.data.get('execution_ids')
+        if not isinstance(ids, list) or not ids:
+            return Response({"error": "Expected a non-empty list of execution_ids."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [int(i) for i in ids]
+            result = allocate_executions(ids, strategy=request.data.get('strategy'))
+        except (TypeError, ValueError):
+            return Response({"error": "execution_ids must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        except AllocationError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except OperationalError as exc:
+            return busy_response(exc)
+        return Response({
+            "strategy": result['strategy'],
+            "allocated": {
+                execution_id: [
+                    {"location": a.location_id, "label_version": a.label_version_id, "quantity": a.quantity}
+                    for a in picks
+                ]
+                for execution_id, picks in result['allocated'].items()
+            },
+            "shortages": result['shortages'],
+            "skipped": result['skipped'],
+        })
+
+    @action(detail=True, methods=['post'], url_path='ship')
+    def ship(self, request, pk=None):
+        """
+        POST /api/executions/{id}/ship/
+        Body: { "tracking_number": "...", "operator_id": 1 }
+        按分配记录扣减库存并写出库流水。
+        """
+        execution = self.get_object()
+        try:
+            ship_execution(
+                execution.pk, operator=request.data.get('operator_id'),
+                tracking_number=request.data.get('tracking_number', ''),
+            )
+        except AllocationError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_409_CONFLICT)
+        except InsufficientStock as exc:
+            return Response({"error": str(exc), "shortages": exc.shortages}, status=status.HTTP_409_CONFLICT)
+        except StockPostingError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(self.get_queryset().get(pk=execution.pk)).data)
+
+
+class PickWaveViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    拣货波次：GET 返回按行走顺序排列的拣货行；POST 用一批出库任务生成新波次。
+    """
+    queryset = PickWave.objects.prefetch_related(
+        Prefetch(
+            'lines',
+            queryset=PickWaveLine.objects.select_related('location', 'execution__batch', 'label_version__sku')
+            .order_by('sequence'),
+        )
+    )
+    serializer_class = PickWaveSerializer
+    pagination_class = KeysetPagination
+
+    def create(self, request):
+        """
+        POST /api/waves/
+        Body: { "execution_ids": [1, 2, ...], "operator_id": 1 }
+        """
+        ids = request.data.get('execution_ids')
+        if not isinstance(ids, list) or not ids:
+            return Response({"error": "Expected a non-empty list of execution_ids."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [int(i) for i in ids]
+        except (TypeError, ValueError):
+            return Response({"error": "execution_ids must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            wave, _, skipped = build_wave(ids, operator=request.data.get('operator_id'))
+        except WaveError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        data = self.get_serializer(self.get_queryset().get(pk=wave.pk)).data
+        data['skipped'] = skipped
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class ReconciliationRunViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    库存对账：POST 排队一次对账（由 reconcile_stock --queued 执行，轮询 GET 查看进度），discrepancies 分页返回差异明细。
+    """
+    queryset = ReconciliationRun.objects.all()
+    serializer_class = ReconciliationRunSerializer
+    pagination_class = ReconciliationKeysetPagination
+
+    def create(self, request):
+        """
+        POST /api/reconciliations/
+        Body: { "incremental": true, "workers": 1 }
+        """
+        try:
+            workers = max(1, int(request.data.get('workers', 1)))
+        except (TypeError, ValueError):
+            return Response({"error": "workers must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        incremental = str(request.data.get('incremental', '')).lower() in ('1', 'true', 'yes')
+        # Web 进程内不启动进程池，只排队
+        run = queue_reconciliation(incremental=incremental, workers=workers)
+        return Response(self.get_serializer(run).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], url_path='discrepancies')
+    def discrepancies(self, request, pk=None):
+        """
+        GET /api/reconciliations/{id}/discrepancies/?page_size=100&cursor=...
+        按 id 倒序游标分页。
+        """
+        run = self.get_object()
+        paginator = IdKeysetPagination()
+        page = paginator.paginate_queryset(
+            run.discrepancies.select_related('location', 'label_version__sku'), request, view=self,
+        )
+        return paginator.get_paginated_response(ReconciliationDiscrepancySerializer(page, many=True).data)
+
+
+def availability_check_response(request, by, key):
+    """
+    POST .../check/
+    Body: { "lines": [{ "<key>": 1, "quantity": 10 }, ...] }，同一 id 多行时数量合并
+    """
+    lines = request.data.get('lines')
+    if not isinstance(lines, list) or not lines:
+        return Response({"error": "Expected a non-empty list of lines."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(lines) > 1000:
+        return Response({"error": "At most 1000 lines per request."}, status=status.HTTP_400_BAD_REQUEST)
+    requested = {}
+    try:
+        for line in lines:
+            pk, quantity = int(line[key]), int(line.get('quantity', 0))
+            requested[pk] = requested.get(pk, 0) + quantity
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return Response({"error": f"Each line needs an integer '{key}' and 'quantity'."}, status=status.HTTP_400_BAD_REQUEST)
+    results = check_availability(requested, by=by)
+    return Response({"ok": all(r['ok'] for r in results), "results": results})
+
+
+class LabelAvailabilityViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    标签版本可用量汇总（主键为标签版本 ID）：详情为一次主键读取，无需跨库位聚合。
+    """
+    queryset = LabelAvailability.objects.select_related('sku', 'label_version')
+    serializer_class = LabelAvailabilitySerializer
+    pagination_class = AvailabilityKeysetPagination
+
+    @action(detail=False, methods=['post'])
+    def check(self, request):
+        return availability_check_response(request, 'label', 'label_version')
+
+
+class SKUAvailabilityViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    SKU 可用量汇总（主键为 SKU ID），为其全部标签版本之和。
+    """
+    queryset = SKUAvailability.objects.select_related('sku')
+    serializer_class = SKUAvailabilitySerializer
+    pagination_class = AvailabilityKeysetPagination
+
+    @action(detail=False, methods=['post'])
+    def check(self, request):
+        return availability_check_response(request, 'sku', 'sku')
+
+
+class CycleCountViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    循环盘点：POST 冻结一组库位的库存快照，counts 批量录入实盘，post 一次过账全部差异。
+    """
+    queryset = CycleCount.objects.all()
+    serializer_class = CycleCountSerializer
+    pagination_class = KeysetPagination
+
+    def create(self, request):
+        """
+        POST /api/cycle-counts/
+        Body: { "locations": [1, 2, ...], "zone": "A", "aisle_from": 3, "aisle_to": 5, "operator_id": 1, "note": "" }
+        locations 与库位层级条件至少给一个，同时给出时取交集。
+        """
+        location_ids = request.data.get('locations')
+        try:
+            location_ids = [int(i) for i in location_ids] if location_ids else None
+        except (TypeError, ValueError):
+            return Response({"error": "locations must be a list of integer ids."}, status=status.HTTP_400_BAD_REQUEST)
+        params = {name: str(request.data[name]) for name in FILTER_PARAMS if request.data.get(name) not in (None, '')}
+        try:
+            count = start_cycle_count(
+                location_ids, params, operator=request.data.get('operator_id'), note=str(request.data.get('note', '')),
+            )
+        except (CycleCountError, LocationFilterError) as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(count).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'], url_path='lines')
+    def lines(self, request, pk=None):
+        """
+        GET /api/cycle-counts/{id}/lines/?state=uncounted|counted|variance&zone=A&aisle=3
+        盘点单按库位行走顺序 (zone, aisle, bay, level) 游标分页。
+        """
+        count = self.get_object()
+        queryset = count.lines.select_related('location', 'label_version__sku').annotate(
+            zone=F('location__zone'), aisle=F('location__aisle'), bay=F('location__bay'), level=F('location__level'),
+        )
+        queryset = hierarchy_filter(queryset, request.query_params, prefix='location__')
+        state = request.query_params.get('state')
+        if state == 'uncounted':
+            queryset = queryset.filter(counted_quantity__isnull=True)
+        elif state == 'counted':
+            queryset = queryset.filter(counted_quantity__isnull=False)
+        elif state == 'variance':
+            queryset = queryset.exclude(variance=0).filter(variance__isnull=False)
+        elif state:
+            return Response({"error": "state must be uncounted, counted or variance."}, status=status.HTTP_400_BAD_REQUEST)
+        paginator = PathKeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(CycleCountLineSerializer(page, many=True).data)
+
+    @action(detail=True, methods=['post'], url_path='counts')
+    def counts(self, request, pk=None):
+        """
+        POST /api/cycle-counts/{id}/counts/
+        Body: { "lines": [{"location": 1, "label_version": 2, "quantity": 40, "counted_at": "2025-12-31T11:00:00Z"}, ...] }
+        counted_at 为扫描枪记录的清点时刻，缺省为上传时刻。
+        """
+        lines, error = parse_stock_lines(request.data, ('location', 'label_version', 'quantity'))
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        entries = []
+        for index, (line, row) in enumerate(zip(lines, request.data['lines'])):
+            counted_at = row.get('counted_at')
+            if counted_at not in (None, ''):
+                try:
+                    counted_at = parse_datetime(str(counted_at))
+                except ValueError:
+                    counted_at = None
+                if counted_at is None:
+                    return Response({"error": f"Line {index} counted_at must be an ISO datetime."}, status=status.HTTP_400_BAD_REQUEST)
+                if timezone.is_naive(counted_at):
+                    counted_at = timezone.make_aware(counted_at)
+            entries.append(line[:3] + (counted_at or None,))
+        count = self.get_object()
+        try:
+            result = record_counts(count.pk, entries)
+        except CycleCountError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except OperationalError as exc:
+            return busy_response(exc)
+        return Response(result)
+
+    @action(detail=True, methods=['post'], url_path='post')
+    def post_variances(self, request, pk=None):
+        """
+        POST /api/cycle-counts/{id}/post/
+        Body: { "operator_id": 1, "uncounted": "skip" | "zero" }
+        全部差异在一个事务内写成 adjust 流水并修正库存。
+        """
+        uncounted = request.data.get('uncounted', 'skip')
+        if uncounted not in UNCOUNTED_POLICIES:
+            return Response({"error": f"uncounted must be one of {', '.join(UNCOUNTED_POLICIES)}."}, status=status.HTTP_400_BAD_REQUEST)
+        count = self.get_object()
+        try:
+            count, transactions = post_cycle_count(count.pk, operator=request.data.get('operator_id'), uncounted=uncounted)
+        except CycleCountError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_409_CONFLICT)
+        except InsufficientStock as exc:
+            return Response({"error": str(exc), "shortages": exc.shortages}, status=status.HTTP_409_CONFLICT)
+        except StockPostingError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        data = self.get_serializer(count).data
+        data['net_variance'] = sum(txn.quantity_change for txn in transactions)
+        return Response(data)
+
+    @action(detail=True, methods=['post'], url_path='cancel')
+    def cancel(self, request, pk=None):
+        """
+        POST /api/cycle-counts/{id}/cancel/
+        """
+        count = self.get_object()
+        try:
+            count = cancel_cycle_count(count.pk)
+        except CycleCountError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(count).data)
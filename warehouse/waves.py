@@ -0,0 +1,111 @@
+# warehouse/waves.py
+"""
+波次拣货
+把已分配库位的出库任务合并成波次，拣货行按库位层级字段 (区, 巷道, 列, 层) 排成蛇形路径：
+同一区内逐巷道行走，相邻巷道交替正向/反向经过各列，避免拣货员来回穿越。
+"""
+import uuid
+
+from django.db import transaction
+
+from .events import publish_executions
+from .models import Operator, OutboundExecution, PickAllocation, PickWave, PickWaveLine, WarehouseLocation
+
+
+class WaveError(Exception):
+    """波次无法生成"""
+
+
+def serpentine_order(lines):
+    """
+    lines 为带 location_code 键的 dict 列表，返回按蛇形路径排序后的新列表。
+    行中带有库位层级（zone/aisle/bay/level 键）时直接使用，否则解析编码。
+    无法解析出巷道/列的库位排在最后，按编码排序。
+    """
+    parsed = []
+    unparsed = []
+    for line in lines:
+        if 'zone' in line:
+            zone, aisle, bay, level = line['zone'], line['aisle'], line['bay'], line['level']
+        else:
+            zone, aisle, bay, level = WarehouseLocation.parse_code(line['location_code'])
+        if aisle is None or bay is None:
+            unparsed.append(line)
+        else:
+            parsed.append(((zone, aisle, bay, level or 0), line))
+
+    # 每个区内按实际要走的巷道排名决定方向，跳过的空巷道不影响交替
+    aisle_rank = {}
+    visited = {}
+    for zone, aisle in sorted({(key[0], key[1]) for key, _ in parsed}):
+        aisle_rank[(zone, aisle)] = visited.get(zone, 0)
+        visited[zone] = aisle_rank[(zone, aisle)] + 1
+
+    def walk_key(item):
+        (zone, aisle, bay, level), line = item
+        forward = aisle_rank[(zone, aisle)] % 2 == 0
+        return (zone, aisle, bay if forward else -bay, level, line['execution_id'])
+
+    ordered = [line for _, line in sorted(parsed, key=walk_key)]
+    ordered.extend(sorted(unparsed, key=lambda l: (l['location_code'], l['execution_id'])))
+    return ordered
+
+
+def build_wave(execution_ids, operator=None):
+    """
+    用已分配、尚未进入波次的出库任务生成一个波次：一次查询取出全部分配行，
+    内存中排出行走顺序，bulk_create 拣货行，并把任务一次性标记为 picking。
+    波次编号为 WAVE-{id}；波次状态随任务发货推进（见 update_wave_status）。
+    """
+    operator_id = getattr(operator, 'pk', operator)
+    if operator_id in ('', None):
+        operator_id = None
+    else:
+        try:
+            operator_id = int(operator_id)
+        except (TypeError, ValueError):
+            raise WaveError(f"Unknown operator: {operator_id!r}")
+        if not Operator.objects.filter(pk=operator_id).exists():
+            raise WaveError(f"Unknown operator: {operator_id}")
+
+    with transaction.atomic():
+        eligible = list(
+            OutboundExecution.objects.select_for_update()
+            .filter(pk__in=execution_ids, wave__isnull=True, status='assigned')
+            .values_list('id', flat=True)
+        )
+        allocations = list(
+            PickAllocation.objects.filter(execution_id__in=eligible)
+            .values('execution_id', 'location_id', 'label_version_id', 'quantity', 'location__code',
+                    *[f'location__{f}' for f in WarehouseLocation.HIERARCHY_FIELDS])
+        )
+        if not allocations:
+            raise WaveError("No allocated executions available for a wave.")
+        for row in allocations:
+            row['location_code'] = row.pop('location__code')
+            for field in WarehouseLocation.HIERARCHY_FIELDS:
+                row[field] = row.pop(f'location__{field}')
+
+        # 先用随机占位编号插入，取得主键后改为 WAVE-{id}，并发成波不会撞号
+        wave = PickWave.objects.create(code=uuid.uuid4().hex, created_by_id=operator_id)
+        wave.code = f"WAVE-{wave.pk}"
+        wave.save(update_fields=['code'])
+        lines = [
+            PickWaveLine(
+                wave=wave, execution_id=row['execution_id'], location_id=row['location_id'],
+                label_version_id=row['label_version_id'], quantity=row['quantity'], sequence=sequence,
+            )
+            for sequence, row in enumerate(serpentine_order(allocations), start=1)
+        ]
+        PickWaveLine.objects.bulk_create(lines, batch_size=1000)
+
+        in_wave = {row['execution_id'] for row in allocations}
+        OutboundExecution.objects.filter(pk__in=in_wave).update(wave=wave, status='picking')
+        publish_executions(in_wave, 'picking', wave=wave.pk)
+    return wave, lines, sorted(set(execution_ids) - in_wave)
+
+
+def update_wave_status(wave_id):
+    """任务发货后推进波次状态：部分任务已发货为 picking，全部发货为 completed"""
+    pending = OutboundExecution.objects.filter(wave_id=wave_id).exclude(status='shipped').exists()
+    PickWave.objects.filter(pk=wave_id).update(status='picking' if pending else 'completed')
@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'warehouse_project.settings')
 
+# 异步只读接口 /api/async/（warehouse/async_views.py）与 SSE 事件流 /api/events/ 需要经由此入口运行，
+# 例如 uvicorn warehouse_project.asgi:application
 application = get_asgi_application()
+
+# 预热扫描校验的 checksum 内存索引
+from warehouse.verification import checksum_index  # noqa: E402
+checksum_index.warm_safely()
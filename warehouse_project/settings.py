@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware', 
     'django.middleware.common.CommonMiddleware',
+    'warehouse.db_router.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'warehouse_project.urls'
@@ -81,9 +84,53 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # 测试库使用文件而不是共享缓存的内存库：并发测试的多线程连接走 busy timeout 排队，
+        # 内存库的表锁会立即报 "database table is locked"；文件名带进程号，同一台机器上并行的测试互不覆盖
+        'TEST': {'NAME': os.path.join(tempfile.gettempdir(), f'warehouse_test_{os.getpid()}.sqlite3')},
     }
 }
 
+# 读库：WAREHOUSE_READ_REPLICAS 为逗号分隔的 SQLite 文件路径，依次注册为 replica1、replica2 ...
+# 本地双库测试：WAREHOUSE_READ_REPLICAS=db_replica.sqlite3，再用 python manage.py sync_replica 从主库复制
+for index, path in enumerate(filter(None, os.environ.get('WAREHOUSE_READ_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / path.strip(),
+        # 测试时读库直接指向测试主库
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# SQLite 生产配置：WAREHOUSE_DB_PROFILE=production 时对每个连接执行以下 PRAGMA
+# WAL 让读写互不阻塞；synchronous=NORMAL 在 WAL 下只在检查点时 fsync；mmap/cache 减少读系统调用。
+# 写锁等待时长只由连接参数 timeout（SQLITE_BUSY_TIMEOUT 秒）设置：它就是 SQLite 的 busy timeout，
+# 不要再写 PRAGMA busy_timeout，否则后执行的 PRAGMA 会静默覆盖它。
+# 写事务以 BEGIN IMMEDIATE 开始，避免读锁升级写锁时的死锁式失败。
+SQLITE_BUSY_TIMEOUT = 20
+SQLITE_PRODUCTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA mmap_size=268435456;"
+    "PRAGMA cache_size=-65536;"
+    "PRAGMA temp_store=MEMORY;"
+)
+
+if os.environ.get('WAREHOUSE_DB_PROFILE') == 'production':
+    for database in DATABASES.values():
+        database['OPTIONS'] = {
+            'init_command': SQLITE_PRODUCTION_PRAGMAS,
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_BUSY_TIMEOUT,
+        }
+        # 持久连接：每个工作线程复用连接，PRAGMA 只在建立连接时执行一次
+        database['CONN_MAX_AGE'] = 600
+        database['CONN_HEALTH_CHECKS'] = True
+
+DATABASE_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['warehouse.db_router.PrimaryReplicaRouter']
+
+# 写请求之后多少秒内，该客户端的读请求仍走主库（读己之写）
+WAREHOUSE_STICKY_PRIMARY_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -126,5 +173,40 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# 扫描会话一次上传可达数万条扫描，放宽请求体上限（默认 2.5MB）
+DATA_UPLOAD_MAX_MEMORY_SIZE = 20 * 1024 * 1024
+
+# 出库分配默认策略：fewest_locations / fifo / picking_first
+WAREHOUSE_ALLOCATION_STRATEGY = 'fewest_locations'
+
+# 每过账多少条流水自动写一份库存结余快照（None 关闭，仅靠 snapshot_balances 定时任务）
+WAREHOUSE_SNAPSHOT_EVERY = 100000
+# 快照只覆盖这么多秒之前的流水，避开尚未提交的过账事务占用的较小流水 ID
+WAREHOUSE_SNAPSHOT_SETTLE_SECONDS = 60
+# 自动快照在后台线程执行，不占用触发它的过账请求（False 时在提交回调中同步执行）
+WAREHOUSE_SNAPSHOT_IN_BACKGROUND = True
+
+# 扫描校验索引的增量同步间隔（秒）：其他进程新建的标签版本、当前版本变化在本进程最多延迟这么久可见
+WAREHOUSE_SCAN_SYNC_SECONDS = 5
+
+# 共享缓存：设置 WAREHOUSE_REDIS_URL（如 redis://127.0.0.1:6379/1，需要安装 redis 包）后所有进程共用 Redis 缓存，
+# 否则为进程内 LocMemCache
+if os.environ.get('WAREHOUSE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['WAREHOUSE_REDIS_URL'],
+        }
+    }
+
+# 标签详情 / SKU 版本历史响应缓存的有效期（秒）：写入提交时失效，所有后端都可以缓存很久
+WAREHOUSE_LABEL_CACHE_TIMEOUT = 86400
+
+# SSE 事件流无事件时发送保活注释的间隔（秒）
+WAREHOUSE_SSE_HEARTBEAT = 15
+
+# 对账最多使用的进程数：API 排队的任务按此截断，reconcile_stock --queued 执行时再次截断
+WAREHOUSE_RECONCILE_MAX_WORKERS = 2
+
 #开发阶段允许所有来源，生产环境再改为特定域名
 CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
@@ -20,5 +20,7 @@ from django.urls import include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # 异步只读查询接口，在 ASGI（asgi.py）下运行时不占用工作线程
+    path('api/async/', include('warehouse.async_urls')),
     path('api/', include('warehouse.urls'))
 ]
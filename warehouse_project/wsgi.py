@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'warehouse_project.settings')
 
 application = get_wsgi_application()
+
+# 预热扫描校验的 checksum 内存索引
+from warehouse.verification import checksum_index  # noqa: E402
+checksum_index.warm_safely()